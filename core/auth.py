@@ -1,4 +1,8 @@
 import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import Optional, Tuple
 from fastapi import Request
 from core.config import logger, ADMIN_EMAILS
@@ -55,9 +59,6 @@ def _verify_photomark_api_token(token: str) -> Optional[str]:
         return None
     
     try:
-        import hashlib
-        from datetime import datetime
-        
         parts = token.split("_", 2)
         if len(parts) != 3:
             return None
@@ -65,50 +66,76 @@ def _verify_photomark_api_token(token: str) -> Optional[str]:
         _, uid_prefix, actual_token = parts
         token_hash = hashlib.sha256(actual_token.encode()).hexdigest()
         
-        # Find user by uid prefix - check common storage locations
-        # This searches for users whose uid starts with the prefix
-        from utils.storage import read_json_key
-        import os
-        
-        # Try to find the user's token file
-        # We need to iterate through potential users - in production use a database index
-        # For now, we'll use a token lookup table
-        lookup_key = f"auth/api_token_lookup/{token_hash[:16]}.json"
-        lookup = read_json_key(lookup_key)
-        
-        if lookup and lookup.get("uid"):
-            uid = lookup["uid"]
-            # Verify the token is still valid
-            tokens_key = f"users/{uid}/integrations/api_tokens.json"
-            data = read_json_key(tokens_key) or {}
-            tokens = data.get("tokens", [])
-            
-            now = datetime.utcnow()
-            for t in tokens:
-                if t.get("hash") == token_hash and t.get("is_active", True):
-                    # Check expiry
-                    exp_str = t.get("expires_at")
-                    if exp_str:
-                        try:
-                            exp = datetime.fromisoformat(exp_str)
-                            if now > exp:
-                                continue
-                        except Exception:
-                            pass
-                    
-                    # Update last_used_at
-                    t["last_used_at"] = now.isoformat()
-                    from utils.storage import write_json_key
-                    write_json_key(tokens_key, data)
-                    
-                    return uid
-        
-        return None
+        # Indexed lookup with an in-process cache; last_used_at is flushed in batches
+        from utils.api_tokens import verify_token_hash
+        return verify_token_hash(token_hash)
     except Exception as ex:
         logger.warning(f"API token verification failed: {ex}")
         return None
 
 
+# Verified Firebase ID-token claims, keyed by token digest, kept until the token's exp.
+# Saves the signature/claims check on the many API calls a page load makes with one token.
+_ID_TOKEN_CACHE_MAX = 10_000
+_ID_TOKEN_EXP_SKEW_SECONDS = 30
+_id_token_cache: "OrderedDict[str, tuple[dict, float]]" = OrderedDict()
+_id_tokens_by_uid: dict[str, set[str]] = {}
+_id_token_lock = threading.Lock()
+
+
+def _id_token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _forget_id_token(digest: str) -> None:
+    entry = _id_token_cache.pop(digest, None)
+    if entry:
+        uid = entry[0].get("uid")
+        digests = _id_tokens_by_uid.get(uid)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                _id_tokens_by_uid.pop(uid, None)
+
+
+def _cached_id_token_claims(digest: str) -> Optional[dict]:
+    with _id_token_lock:
+        entry = _id_token_cache.get(digest)
+        if not entry:
+            return None
+        if entry[1] <= time.time():
+            _forget_id_token(digest)
+            return None
+        _id_token_cache.move_to_end(digest)
+        return entry[0]
+
+
+def _cache_id_token_claims(digest: str, claims: dict) -> None:
+    try:
+        expires_at = float(claims.get("exp") or 0) - _ID_TOKEN_EXP_SKEW_SECONDS
+    except Exception:
+        return
+    uid = claims.get("uid")
+    if not uid or expires_at <= time.time():
+        return
+    with _id_token_lock:
+        _forget_id_token(digest)
+        _id_token_cache[digest] = (claims, expires_at)
+        _id_tokens_by_uid.setdefault(uid, set()).add(digest)
+        while len(_id_token_cache) > _ID_TOKEN_CACHE_MAX:
+            _forget_id_token(next(iter(_id_token_cache)))
+
+
+def revoke_cached_tokens(uid: str) -> None:
+    """Drop cached claims for a user (call on delete, password/email change, revocation).
+
+    Only affects this process; other workers keep their entries until token exp.
+    """
+    with _id_token_lock:
+        for digest in list(_id_tokens_by_uid.get(uid, ())):
+            _forget_id_token(digest)
+
+
 def get_uid_from_request(request: Request) -> Optional[str]:
     auth_header = request.headers.get("authorization") or request.headers.get("Authorization")
     if not auth_header or not auth_header.lower().startswith("bearer "):
@@ -124,8 +151,13 @@ def get_uid_from_request(request: Request) -> Optional[str]:
     # Otherwise, verify as Firebase ID token
     if not firebase_enabled or not fb_auth:
         return None
+    digest = _id_token_digest(token)
+    cached = _cached_id_token_claims(digest)
+    if cached is not None:
+        return cached.get("uid")
     try:
         decoded = fb_auth.verify_id_token(token)
+        _cache_id_token_claims(digest, decoded)
         return decoded.get("uid")
     except Exception as ex:
         logger.warning(f"Token verification failed: {ex}")
@@ -0,0 +1,483 @@
+"""
+App-lifetime process pool for CPU-heavy image work (format conversion, histogram
+matching, moodboard tiles, watermarking, LUT application, ...).
+
+Routers used to create a ProcessPoolExecutor / multiprocessing.Pool sized to the CPU
+count on every request, so N concurrent requests forked N x cores workers. All of
+them now share one pool of CPU_POOL_WORKERS processes that is started (and warmed)
+once at app startup.
+
+Scheduling: at most CPU_POOL_MAX_RUNNING tasks (default: one per worker) hold a CPU
+slot at a time; everything else waits in a weighted fair queue so one tenant's
+300-image batch cannot starve other tenants' previews:
+
+- Tasks are keyed by tenant (the effective workspace uid) and a priority class,
+  INTERACTIVE (single images, previews) or BATCH (multi-file jobs).
+- Classes are served weighted round-robin (CPU_POOL_INTERACTIVE_WEIGHT grants to
+  interactive for every batch grant while both are waiting); within a class tenants
+  take turns, each getting `weight` grants per turn.
+- Work that cannot be pickled (torch tensors, closures) can hold a slot while it
+  runs in a thread via `run_in_thread`.
+
+Backpressure: when CPU_POOL_MAX_QUEUED tasks are already waiting new work is refused
+with CpuPoolBusy, and interactive tasks give up after CPU_POOL_WAIT_SECONDS. Routers
+answer 503 with Retry-After.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from core.config import logger
+
+WORKERS = max(1, int(os.getenv("CPU_POOL_WORKERS", "0") or "0") or (os.cpu_count() or 2))
+MAX_RUNNING = max(1, int(os.getenv("CPU_POOL_MAX_RUNNING", "0") or "0") or WORKERS)
+MAX_QUEUED = max(1, int(os.getenv("CPU_POOL_MAX_QUEUED", "0") or "0") or WORKERS * 64)
+WAIT_SECONDS = float(os.getenv("CPU_POOL_WAIT_SECONDS", "30") or "30")
+# Tasks one call may have waiting/running at a time
+CALL_WINDOW = max(2, WORKERS * 2)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+CLASS_WEIGHTS = {
+    INTERACTIVE: max(1, int(os.getenv("CPU_POOL_INTERACTIVE_WEIGHT", "4") or "4")),
+    BATCH: 1,
+}
+# Calls with at most this many images are scheduled as interactive
+INTERACTIVE_MAX_ITEMS = 2
+
+
+class CpuPoolBusy(RuntimeError):
+    """The fair queue is full, or an interactive task waited too long for a slot."""
+
+
+def priority_for(n_items: int) -> str:
+    return INTERACTIVE if n_items <= INTERACTIVE_MAX_ITEMS else BATCH
+
+
+def tenant_for_request(request, eff_uid: Optional[str] = None) -> str:
+    """Scheduling key: effective workspace uid, else the client address."""
+    if not eff_uid:
+        try:
+            from core.auth import resolve_workspace_uid
+            eff_uid, _ = resolve_workspace_uid(request)
+        except Exception:
+            eff_uid = None
+    if eff_uid:
+        return eff_uid
+    try:
+        return f"anon:{request.client.host}"
+    except Exception:
+        return "anon:unknown"
+
+
+def busy_response():
+    """503 answer for CpuPoolBusy."""
+    from fastapi.responses import JSONResponse
+    return JSONResponse(
+        {"error": "busy", "message": "Server is busy, please retry shortly."},
+        status_code=503,
+        headers={"Retry-After": "10"},
+    )
+
+
+class _Waiter:
+    __slots__ = ("tenant", "cls", "weight", "event", "loop", "afut", "granted", "queued_at")
+
+    def __init__(self, tenant: str, cls: str, weight: int, loop=None):
+        self.tenant = tenant
+        self.cls = cls
+        self.weight = weight
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.afut = loop.create_future() if loop else None
+        self.granted = False
+        self.queued_at = time.monotonic()
+
+    def grant(self) -> None:
+        self.granted = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.afut)
+        else:
+            self.event.set()
+
+
+def _resolve(afut: asyncio.Future) -> None:
+    if not afut.done():
+        afut.set_result(True)
+
+
+class _FairScheduler:
+    """Weighted round-robin over priority classes, then over tenants within a class."""
+
+    def __init__(self, capacity: int, max_queued: int):
+        self.capacity = capacity
+        self.max_queued = max_queued
+        self.running = 0
+        self.queued = 0
+        self._lock = threading.Lock()
+        self._tenant_queues: dict[str, dict[str, deque]] = {c: {} for c in CLASS_WEIGHTS}
+        self._turns: dict[str, deque] = {c: deque() for c in CLASS_WEIGHTS}
+        self._tenant_credit: dict[str, dict[str, int]] = {c: {} for c in CLASS_WEIGHTS}
+        self._class_credit = dict(CLASS_WEIGHTS)
+        self.granted_total = {c: 0 for c in CLASS_WEIGHTS}
+        self.wait_seconds_total = {c: 0.0 for c in CLASS_WEIGHTS}
+
+    def enqueue(self, waiter: _Waiter) -> None:
+        with self._lock:
+            if self.queued == 0 and self.running < self.capacity:
+                self._start(waiter)
+                return
+            if self.queued >= self.max_queued:
+                raise CpuPoolBusy("CPU pool queue is full")
+            queues = self._tenant_queues[waiter.cls]
+            q = queues.get(waiter.tenant)
+            if q is None:
+                q = queues[waiter.tenant] = deque()
+                self._turns[waiter.cls].append(waiter.tenant)
+            q.append(waiter)
+            self.queued += 1
+
+    def cancel(self, waiter: _Waiter) -> bool:
+        """Withdraw a waiter. Returns False if it had already been granted a slot."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            q = self._tenant_queues[waiter.cls].get(waiter.tenant)
+            if q is not None:
+                try:
+                    q.remove(waiter)
+                    self.queued -= 1
+                except ValueError:
+                    pass
+                if not q:
+                    self._drop_tenant(waiter.cls, waiter.tenant)
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.running -= 1
+            self._dispatch()
+
+    def _start(self, waiter: _Waiter) -> None:
+        self.running += 1
+        self.granted_total[waiter.cls] += 1
+        self.wait_seconds_total[waiter.cls] += time.monotonic() - waiter.queued_at
+        waiter.grant()
+
+    def _drop_tenant(self, cls: str, tenant: str) -> None:
+        self._tenant_queues[cls].pop(tenant, None)
+        self._tenant_credit[cls].pop(tenant, None)
+        try:
+            self._turns[cls].remove(tenant)
+        except ValueError:
+            pass
+
+    def _next_class(self) -> Optional[str]:
+        waiting = [c for c in CLASS_WEIGHTS if self._turns[c]]
+        if not waiting:
+            return None
+        for c in waiting:
+            if self._class_credit[c] > 0:
+                self._class_credit[c] -= 1
+                return c
+        # Every waiting class used its share this round; start a new round
+        self._class_credit = dict(CLASS_WEIGHTS)
+        c = waiting[0]
+        self._class_credit[c] -= 1
+        return c
+
+    def _dispatch(self) -> None:
+        while self.running < self.capacity and self.queued:
+            cls = self._next_class()
+            if cls is None:
+                return
+            turns = self._turns[cls]
+            tenant = turns[0]
+            credits = self._tenant_credit[cls]
+            q = self._tenant_queues[cls][tenant]
+            waiter = q.popleft()
+            self.queued -= 1
+            left = credits.get(tenant, waiter.weight) - 1
+            if not q:
+                self._drop_tenant(cls, tenant)
+            elif left <= 0:
+                credits.pop(tenant, None)
+                turns.rotate(-1)
+            else:
+                credits[tenant] = left
+            self._start(waiter)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "running": self.running,
+                "queued": self.queued,
+                "queued_by_class": {
+                    c: sum(len(q) for q in self._tenant_queues[c].values()) for c in CLASS_WEIGHTS
+                },
+                "waiting_tenants": {c: len(self._turns[c]) for c in CLASS_WEIGHTS},
+                "granted": dict(self.granted_total),
+                "wait_seconds": {c: round(v, 3) for c, v in self.wait_seconds_total.items()},
+            }
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_scheduler = _FairScheduler(MAX_RUNNING, MAX_QUEUED)
+_stats_lock = threading.Lock()
+_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+}
+
+
+def _noop() -> int:
+    return os.getpid()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=WORKERS)
+    return _pool
+
+
+def _reset_pool(broken: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            logger.warning("[cpu-pool] worker pool broken; starting a new one")
+            _pool = None
+    try:
+        broken.shutdown(wait=False, cancel_futures=True)
+    except Exception:
+        pass
+
+
+def start() -> None:
+    """Create the pool and start every worker so the first requests do not pay fork cost."""
+    pool = get_pool()
+    futures = [pool.submit(_noop) for _ in range(WORKERS)]
+    for fut in futures:
+        try:
+            fut.result(timeout=60)
+        except Exception as ex:
+            logger.warning(f"[cpu-pool] warm-up failed: {ex}")
+            break
+    logger.info(f"[cpu-pool] started {WORKERS} workers (max running {MAX_RUNNING}, max queued {MAX_QUEUED})")
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def stats() -> dict:
+    """Queue depth per class, running tasks and counters, for logging/monitoring."""
+    with _stats_lock:
+        out = dict(_stats)
+    out.update(_scheduler.snapshot())
+    out.update({"workers": WORKERS, "max_running": MAX_RUNNING, "max_queued": MAX_QUEUED})
+    return out
+
+
+def _count(field: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[field] += n
+
+
+def _reject(cls: str, reason: str) -> CpuPoolBusy:
+    _count("rejected")
+    logger.warning(f"[cpu-pool] rejected {cls} task: {reason} ({stats()})")
+    return CpuPoolBusy(f"CPU pool is busy ({reason})")
+
+
+def _acquire(tenant: str, priority: str, weight: int) -> None:
+    """Block until the scheduler grants a slot (interactive: at most WAIT_SECONDS)."""
+    waiter = _Waiter(tenant or "-", priority, max(1, int(weight)))
+    try:
+        _scheduler.enqueue(waiter)
+    except CpuPoolBusy:
+        raise _reject(priority, "queue full")
+    timeout = WAIT_SECONDS if priority == INTERACTIVE else None
+    if waiter.event.wait(timeout):
+        return
+    if _scheduler.cancel(waiter):
+        raise _reject(priority, f"no slot within {WAIT_SECONDS:g}s")
+
+
+async def _acquire_async(tenant: str, priority: str, weight: int) -> None:
+    waiter = _Waiter(tenant or "-", priority, max(1, int(weight)), loop=asyncio.get_running_loop())
+    try:
+        _scheduler.enqueue(waiter)
+    except CpuPoolBusy:
+        raise _reject(priority, "queue full")
+    timeout = WAIT_SECONDS if priority == INTERACTIVE else None
+    try:
+        await asyncio.wait_for(asyncio.shield(waiter.afut), timeout)
+    except asyncio.TimeoutError:
+        if _scheduler.cancel(waiter):
+            raise _reject(priority, f"no slot within {WAIT_SECONDS:g}s")
+    except asyncio.CancelledError:
+        # Client went away while waiting; hand the slot back if it was already granted
+        if not _scheduler.cancel(waiter):
+            _scheduler.release()
+        raise
+
+
+def _on_done(fut: Future) -> None:
+    _scheduler.release()
+    _count("completed" if not fut.cancelled() and fut.exception() is None else "failed")
+
+
+def _submit_with_slot(fn: Callable, args: tuple) -> Future:
+    """Submit once a slot is held; the slot is released when the task finishes."""
+    _count("submitted")
+    try:
+        pool = get_pool()
+        try:
+            fut = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); replace the pool and retry once
+            _reset_pool(pool)
+            fut = get_pool().submit(fn, *args)
+    except Exception:
+        _scheduler.release()
+        raise
+    fut.add_done_callback(_on_done)
+    return fut
+
+
+def submit(fn: Callable, *args: Any, tenant: str = "-", priority: str = BATCH, weight: int = 1) -> Future:
+    """Submit one task once the fair queue grants it a slot (blocking)."""
+    _acquire(tenant, priority, weight)
+    return _submit_with_slot(fn, args)
+
+
+def imap(
+    fn: Callable,
+    items: Iterable[Any],
+    return_exceptions: bool = False,
+    tenant: str = "-",
+    priority: str = BATCH,
+    weight: int = 1,
+) -> Iterator[Any]:
+    """Ordered results of `fn(item)` for each item, with a bounded in-flight window.
+
+    Blocking; use from sync code or threads. With return_exceptions=True a failed
+    item yields its exception instead of aborting the iteration.
+    """
+    window: deque = deque()
+    it = iter(items)
+    exhausted = False
+    while True:
+        while not exhausted and len(window) < CALL_WINDOW:
+            try:
+                item = next(it)
+            except StopIteration:
+                exhausted = True
+                break
+            window.append(submit(fn, item, tenant=tenant, priority=priority, weight=weight))
+        if not window:
+            return
+        fut = window.popleft()
+        try:
+            yield fut.result()
+        except Exception as ex:
+            if not return_exceptions:
+                for f in window:
+                    f.cancel()
+                raise
+            yield ex
+
+
+async def amap(
+    fn: Callable,
+    items: Iterable[Any],
+    return_exceptions: bool = False,
+    tenant: str = "-",
+    priority: str = BATCH,
+    weight: int = 1,
+) -> list:
+    """Async `imap`: waits for slots and results without blocking the event loop."""
+    items = list(items)
+    results: list = [None] * len(items)
+    in_flight: dict[asyncio.Future, int] = {}
+    idx = 0
+    try:
+        while idx < len(items) or in_flight:
+            while idx < len(items) and len(in_flight) < CALL_WINDOW:
+                await _acquire_async(tenant, priority, weight)
+                in_flight[asyncio.wrap_future(_submit_with_slot(fn, (items[idx],)))] = idx
+                idx += 1
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                i = in_flight.pop(fut)
+                try:
+                    results[i] = fut.result()
+                except Exception as ex:
+                    if not return_exceptions:
+                        raise
+                    results[i] = ex
+    finally:
+        for fut in in_flight:
+            fut.cancel()
+    return results
+
+
+async def run(fn: Callable, *args: Any, tenant: str = "-", priority: str = INTERACTIVE, weight: int = 1) -> Any:
+    """Run one picklable `fn(*args)` on a worker process without blocking the event loop."""
+    await _acquire_async(tenant, priority, weight)
+    return await asyncio.wrap_future(_submit_with_slot(fn, args))
+
+
+async def run_in_thread(
+    fn: Callable,
+    *args: Any,
+    tenant: str = "-",
+    priority: str = INTERACTIVE,
+    weight: int = 1,
+    **kwargs: Any,
+) -> Any:
+    """Run `fn` in a thread while holding a scheduler slot.
+
+    For CPU-bound work that cannot go to a worker process (torch tensors, closures);
+    it still takes its fair turn and counts against MAX_RUNNING. The slot is released
+    by the thread when `fn` returns, not by the awaiting request: a cancelled request
+    cannot free the slot while its thread is still running.
+    """
+    await _acquire_async(tenant, priority, weight)
+    _count("submitted")
+
+    def _call() -> Any:
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            _count("failed")
+            raise
+        finally:
+            _scheduler.release()
+        _count("completed")
+        return result
+
+    try:
+        fut = asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, _call)
+    except BaseException:
+        # Never reached the thread; hand the slot back here
+        _scheduler.release()
+        _count("failed")
+        raise
+    return await fut
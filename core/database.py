@@ -92,6 +92,91 @@ def init_db():
             chk7 = conn.execute(text("SELECT 1 FROM information_schema.columns WHERE table_name='collaborators' AND column_name='last_login_at'"))
             if not chk7.first():
                 conn.execute(text("ALTER TABLE public.collaborators ADD COLUMN IF NOT EXISTS last_login_at TIMESTAMPTZ"))
+
+            # Ensure gallery_assets.has_invisible column exists (invisible-mark index)
+            chk8 = conn.execute(text("SELECT 1 FROM information_schema.columns WHERE table_name='gallery_assets' AND column_name='has_invisible'"))
+            if not chk8.first():
+                conn.execute(text("ALTER TABLE public.gallery_assets ADD COLUMN IF NOT EXISTS has_invisible BOOLEAN"))
+
+            # Ensure vault membership table exists (vault manifest in Postgres)
+            chk9 = conn.execute(text("SELECT 1 FROM information_schema.tables WHERE table_name='vaults'"))
+            if chk9.first():
+                conn.execute(text("ALTER TABLE public.vaults ADD COLUMN IF NOT EXISTS manifest_in_db BOOLEAN NOT NULL DEFAULT FALSE"))
+                conn.execute(text("""
+                    CREATE TABLE IF NOT EXISTS public.vault_photos (
+                      vault_id INTEGER NOT NULL REFERENCES public.vaults(id) ON DELETE CASCADE,
+                      key TEXT NOT NULL,
+                      position INTEGER NOT NULL DEFAULT 1000000000,
+                      added_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                      PRIMARY KEY (vault_id, key)
+                    )
+                """))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_vault_photos_order ON public.vault_photos (vault_id, position, key)"))
+                conn.execute(text("""
+                    CREATE TABLE IF NOT EXISTS public.vault_summaries (
+                      vault_id INTEGER PRIMARY KEY REFERENCES public.vaults(id) ON DELETE CASCADE,
+                      photo_count INTEGER NOT NULL DEFAULT 0,
+                      total_size_bytes BIGINT NOT NULL DEFAULT 0,
+                      cover_key TEXT,
+                      is_protected BOOLEAN NOT NULL DEFAULT FALSE,
+                      display_name TEXT,
+                      meta_synced BOOLEAN NOT NULL DEFAULT FALSE,
+                      updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                    )
+                """))
+                # One vaults row per (owner_uid, name); fold earlier duplicates into the oldest row first
+                chk10 = conn.execute(text("SELECT 1 FROM pg_indexes WHERE schemaname='public' AND indexname='ux_vaults_owner_name'"))
+                if not chk10.first():
+                    conn.execute(text("""
+                        INSERT INTO public.vault_photos (vault_id, key, position, added_at)
+                        SELECT k.id, vp.key, vp.position, vp.added_at
+                        FROM public.vault_photos vp
+                        JOIN public.vaults d ON d.id = vp.vault_id
+                        JOIN public.vaults k ON k.owner_uid = d.owner_uid AND k.name = d.name AND k.id < d.id
+                        ON CONFLICT (vault_id, key) DO NOTHING
+                    """))
+                    conn.execute(text("""
+                        UPDATE public.vault_summaries s SET
+                          photo_count = (SELECT COUNT(*) FROM public.vault_photos vp WHERE vp.vault_id = s.vault_id),
+                          total_size_bytes = (SELECT COALESCE(SUM(ga.size_bytes), 0) FROM public.vault_photos vp
+                                              JOIN public.gallery_assets ga ON ga.key = vp.key WHERE vp.vault_id = s.vault_id),
+                          cover_key = (SELECT vp.key FROM public.vault_photos vp WHERE vp.vault_id = s.vault_id
+                                       ORDER BY vp.position, vp.key LIMIT 1),
+                          updated_at = NOW()
+                        WHERE s.vault_id IN (SELECT MIN(id) FROM public.vaults GROUP BY owner_uid, name HAVING COUNT(*) > 1)
+                    """))
+                    conn.execute(text("""
+                        DELETE FROM public.vaults d USING public.vaults k
+                        WHERE k.owner_uid = d.owner_uid AND k.name = d.name AND k.id < d.id
+                    """))
+                    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_vaults_owner_name ON public.vaults (owner_uid, name)"))
+
+            # API token index (pm_ integration tokens)
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS public.api_tokens (
+                  token_hash TEXT PRIMARY KEY,
+                  uid TEXT NOT NULL,
+                  token_id TEXT,
+                  name TEXT,
+                  is_active BOOLEAN NOT NULL DEFAULT TRUE,
+                  created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                  expires_at TIMESTAMP,
+                  last_used_at TIMESTAMP
+                )
+            """))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_api_tokens_uid ON public.api_tokens (uid)"))
+
+            # Image placeholders for listings (dimensions, dominant color, LQIP)
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS public.image_placeholders (
+                  key TEXT PRIMARY KEY,
+                  width INTEGER NOT NULL,
+                  height INTEGER NOT NULL,
+                  color VARCHAR(7) NOT NULL,
+                  lqip TEXT,
+                  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                )
+            """))
     except Exception:
         # Swallow to avoid startup crash in constrained envs; logs handled by callers
         pass
@@ -0,0 +1,111 @@
+"""
+Cached SPA shell for custom-domain page views.
+
+The frontend `index.html` is fetched from FRONTEND_ORIGIN once and revalidated at
+most every REVALIDATE_SECONDS with If-None-Match, over one shared HTTP client. The
+shell is kept pre-split at its `<head>` / `</head>` injection points, and each
+tenant-specific page (shell + tenant script) is rendered once and served from memory
+with its own ETag, so repeat views can be answered with 304 Not Modified.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import httpx
+
+from core.config import logger
+
+REVALIDATE_SECONDS = 30
+MAX_RENDERED = 1000
+
+_client: Optional[httpx.AsyncClient] = None
+_refresh_lock = asyncio.Lock()
+# {"etag", "checked_at", "head": (before, after) | None, "head_end": (before, after) | None, "html"}
+_shell: dict = {}
+_rendered: "OrderedDict[tuple, tuple[bytes, str]]" = OrderedDict()
+
+
+def frontend_origin() -> str:
+    return (os.getenv("FRONTEND_ORIGIN", "https://photomark.cloud").split(",")[0].strip() or "https://photomark.cloud").rstrip("/")
+
+
+def get_client() -> httpx.AsyncClient:
+    """Shared client for frontend proxying; keeps connections to FRONTEND_ORIGIN alive."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=10.0, follow_redirects=True)
+    return _client
+
+
+def _split(html: str, marker: str, keep_marker_first: bool) -> Optional[tuple[str, str]]:
+    idx = html.find(marker)
+    if idx < 0:
+        return None
+    if keep_marker_first:
+        idx += len(marker)
+    return html[:idx], html[idx:]
+
+
+async def _refresh() -> None:
+    headers = {}
+    if _shell.get("etag"):
+        headers["If-None-Match"] = _shell["etag"]
+    try:
+        r = await get_client().get(f"{frontend_origin()}/", headers=headers)
+    except Exception as ex:
+        logger.warning(f"[spa-shell] upstream fetch failed: {ex}")
+        if _shell:
+            _shell["checked_at"] = time.monotonic()
+        return
+    if r.status_code == 304 and _shell:
+        _shell["checked_at"] = time.monotonic()
+        return
+    if r.status_code != 200:
+        logger.warning(f"[spa-shell] upstream returned {r.status_code}")
+        if _shell:
+            _shell["checked_at"] = time.monotonic()
+        return
+    html = r.text
+    etag = r.headers.get("etag") or ('"' + hashlib.sha1(html.encode("utf-8")).hexdigest() + '"')
+    if etag != _shell.get("etag"):
+        _rendered.clear()
+    _shell.update({
+        "etag": etag,
+        "checked_at": time.monotonic(),
+        "html": html,
+        # Insert right after <head> / right before </head>
+        "head": _split(html, "<head>", keep_marker_first=True),
+        "head_end": _split(html, "</head>", keep_marker_first=False),
+    })
+
+
+async def _current_shell() -> dict:
+    fresh = _shell and (time.monotonic() - _shell.get("checked_at", 0)) < REVALIDATE_SECONDS
+    if not fresh:
+        async with _refresh_lock:
+            if not _shell or (time.monotonic() - _shell.get("checked_at", 0)) >= REVALIDATE_SECONDS:
+                await _refresh()
+    return _shell
+
+
+async def render_shell(inject: str, at_head_start: bool) -> Optional[tuple[bytes, str]]:
+    """Shell with `inject` placed after `<head>` (or before `</head>`). Returns (body, etag)."""
+    shell = await _current_shell()
+    if "html" not in shell:
+        return None
+    cache_key = (shell["etag"], at_head_start, inject)
+    hit = _rendered.get(cache_key)
+    if hit:
+        _rendered.move_to_end(cache_key)
+        return hit
+    parts = shell.get("head") if at_head_start else shell.get("head_end")
+    html = (parts[0] + inject + parts[1]) if parts else (inject + shell["html"])
+    body = html.encode("utf-8")
+    etag = '"' + hashlib.sha1(body).hexdigest()[:32] + '"'
+    _rendered[cache_key] = (body, etag)
+    while len(_rendered) > MAX_RENDERED:
+        _rendered.popitem(last=False)
+    return body, etag
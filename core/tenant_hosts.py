@@ -0,0 +1,177 @@
+"""
+Host -> tenant resolution for the custom-domain middleware.
+
+Resolving a host can take up to four queries (shop JSONB hostname with a LIKE
+fallback, then uploads, vault and portfolio domains). Results are cached in-process
+per host, including misses, so ordinary traffic on first-party hosts and repeat
+views on custom domains do not open a DB session at all.
+
+Entries are dropped whenever a Shop / UploadsDomain / VaultDomain / PortfolioDomain
+row is inserted, updated or deleted in this process (ORM events). Other workers pick
+up changes when their entry's TTL runs out.
+
+The `find_*` lookups raise on database errors instead of reporting "no match", so a
+failed lookup is never cached as a miss.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import event
+
+from core.config import logger
+from core.database import SessionLocal
+
+POSITIVE_TTL_SECONDS = 300
+NEGATIVE_TTL_SECONDS = 60
+MAX_ENTRIES = 10_000
+
+_cache: "OrderedDict[str, tuple[float, Optional[dict]]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _normalize_host(host: str) -> str:
+    return (host or "").strip().lower().rstrip(".")
+
+
+def should_redirect_shop(shop) -> bool:
+    try:
+        dom = shop.domain or {}
+        hostname = (dom.get('hostname') or "").strip()
+        enabled = bool(dom.get('enabled') or False)
+        return bool(hostname and enabled)
+    except Exception as e:
+        logger.error(f"[custom-domain] should_redirect_shop error: {e}")
+        return False
+
+
+def find_shop_by_host(db, host: str):
+    from models.shop import Shop
+    from sqlalchemy import cast, String, func
+    host_l = _normalize_host(host)
+    q = db.query(Shop).filter(func.lower(cast(Shop.domain['hostname'], String)) == host_l)
+    shop = q.first()
+    if shop:
+        return shop
+    # Fallback: handle potential stored variations
+    q2 = db.query(Shop).filter(cast(Shop.domain['hostname'], String).like(f"%{host_l}%"))
+    return q2.first()
+
+
+def _find_uploads_domain_by_host(db, host: str):
+    """Find uploads domain record by hostname"""
+    from models.uploads_domain import UploadsDomain
+    domain = db.query(UploadsDomain).filter(UploadsDomain.hostname == _normalize_host(host)).first()
+    if domain and domain.enabled:
+        return domain
+    return None
+
+
+def _find_vault_domain_by_host(db, host: str):
+    """Find vault domain record by hostname"""
+    from models.vault_domain import VaultDomain
+    domain = db.query(VaultDomain).filter(VaultDomain.hostname == _normalize_host(host)).first()
+    if domain and domain.enabled:
+        return domain
+    return None
+
+
+def _find_portfolio_domain_by_host(db, host: str):
+    """Find portfolio domain record by hostname"""
+    from models.portfolio_domain import PortfolioDomain
+    domain = db.query(PortfolioDomain).filter(PortfolioDomain.hostname == _normalize_host(host)).first()
+    if domain and domain.enabled and domain.dns_verified:
+        return domain
+    return None
+
+
+def _lookup(host: str) -> Optional[dict]:
+    """Uncached resolution; returns plain values so nothing ORM-bound is cached.
+
+    Database errors propagate so `resolve_host` can skip caching them.
+    """
+    db = SessionLocal()
+    try:
+        shop = find_shop_by_host(db, host)
+        if shop and should_redirect_shop(shop):
+            return {"kind": "shop", "redirect": True, "slug": (shop.slug or "").strip()}
+        uploads_domain = _find_uploads_domain_by_host(db, host)
+        if uploads_domain:
+            return {"kind": "uploads", "uid": uploads_domain.uid}
+        vault_domain = _find_vault_domain_by_host(db, host)
+        if vault_domain:
+            return {
+                "kind": "vault",
+                "share_token": vault_domain.share_token,
+                "vault_name": vault_domain.vault_name,
+            }
+        portfolio_domain = _find_portfolio_domain_by_host(db, host)
+        if portfolio_domain:
+            return {"kind": "portfolio", "uid": portfolio_domain.uid}
+        if shop:
+            # Matched a shop whose custom domain is not enabled: its assets are still proxied
+            return {"kind": "shop", "redirect": False, "slug": (shop.slug or "").strip()}
+        return None
+    finally:
+        try:
+            db.close()
+        except Exception:
+            pass
+
+
+def resolve_host(host: str) -> Optional[dict]:
+    """Cached tenant for a request host, or None for hosts that are not custom domains."""
+    host_l = _normalize_host(host)
+    if not host_l:
+        return None
+    now = time.monotonic()
+    with _lock:
+        hit = _cache.get(host_l)
+        if hit and hit[0] > now:
+            _cache.move_to_end(host_l)
+            return hit[1]
+    try:
+        tenant = _lookup(host_l)
+    except Exception as ex:
+        # Do not cache failures; the next request retries
+        logger.warning(f"[custom-domain] host resolution failed for {host_l}: {ex}")
+        return None
+    logger.info(f"[custom-domain] Resolved host {host_l}: {tenant['kind'] if tenant else None}")
+    ttl = POSITIVE_TTL_SECONDS if tenant else NEGATIVE_TTL_SECONDS
+    with _lock:
+        _cache[host_l] = (now + ttl, tenant)
+        _cache.move_to_end(host_l)
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return tenant
+
+
+def invalidate_host(host: Optional[str] = None) -> None:
+    """Forget one host, or every host when called without arguments."""
+    with _lock:
+        if host is None:
+            _cache.clear()
+        else:
+            _cache.pop(_normalize_host(host), None)
+
+
+def _on_domain_change(mapper, connection, target) -> None:
+    # Shops match by LIKE as well as exact hostname, so any change may affect several hosts
+    invalidate_host()
+
+
+def _register_invalidation() -> None:
+    from models.shop import Shop
+    from models.uploads_domain import UploadsDomain
+    from models.vault_domain import VaultDomain
+    from models.portfolio_domain import PortfolioDomain
+    for model in (Shop, UploadsDomain, VaultDomain, PortfolioDomain):
+        for evt in ("after_insert", "after_update", "after_delete"):
+            event.listen(model, evt, _on_domain_change)
+
+
+try:
+    _register_invalidation()
+except Exception as _ex:
+    logger.warning(f"[custom-domain] host cache invalidation hooks not registered: {_ex}")
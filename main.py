@@ -6,6 +6,8 @@ import os
 import warnings
 
 from core.config import logger  # type: ignore
+from core.tenant_hosts import resolve_host, find_shop_by_host, should_redirect_shop
+from core.spa_shell import render_shell, frontend_origin, get_client as get_spa_client
 import asyncio
 import os
 import httpx
@@ -184,82 +186,6 @@ def _get_request_host(request: Request) -> str:
     host = (host.split(":")[0] or "").strip().lower().strip(".")
     return host
 
-def _should_redirect_shop(shop) -> bool:
-    try:
-        dom = shop.domain or {}
-        hostname = (dom.get('hostname') or "").strip()
-        enabled = bool(dom.get('enabled') or False)
-        published = bool(shop.published) if hasattr(shop, 'published') else True
-        result = bool(hostname and enabled)
-        logger.info(f"[custom-domain] _should_redirect_shop: hostname={hostname}, enabled={enabled}, published={published}, result={result}")
-        return result
-    except Exception as e:
-        logger.error(f"[custom-domain] _should_redirect_shop error: {e}")
-        return False
-
-def _find_shop_by_host(db, host: str):
-    try:
-        from models.shop import Shop
-        from sqlalchemy import cast, String, func
-        host_l = (host or "").strip().lower().rstrip(".")
-        q = db.query(Shop).filter(func.lower(cast(Shop.domain['hostname'], String)) == host_l)
-        shop = q.first()
-        if shop:
-            return shop
-        # Fallback: handle potential stored variations
-        q2 = db.query(Shop).filter(cast(Shop.domain['hostname'], String).like(f"%{host_l}%"))
-        return q2.first()
-    except Exception:
-        return None
-
-
-def _find_uploads_domain_by_host(db, host: str):
-    """Find uploads domain record by hostname"""
-    try:
-        from models.uploads_domain import UploadsDomain
-        host_l = (host or "").strip().lower().rstrip(".")
-        domain = db.query(UploadsDomain).filter(UploadsDomain.hostname == host_l).first()
-        logger.info(f"[custom-domain] Uploads domain lookup for '{host_l}': found={domain is not None}, enabled={domain.enabled if domain else None}")
-        if domain and domain.enabled:
-            return domain
-        return None
-    except Exception as e:
-        logger.error(f"[custom-domain] Uploads domain lookup error: {e}")
-        return None
-
-
-def _find_vault_domain_by_host(db, host: str):
-    """Find vault domain record by hostname"""
-    try:
-        from models.vault_domain import VaultDomain
-        host_l = (host or "").strip().lower().rstrip(".")
-        domain = db.query(VaultDomain).filter(VaultDomain.hostname == host_l).first()
-        logger.info(f"[custom-domain] Vault domain lookup for '{host_l}': found={domain is not None}, enabled={domain.enabled if domain else None}")
-        if domain and domain.enabled:
-            return domain
-        return None
-    except Exception as e:
-        logger.error(f"[custom-domain] Vault domain lookup error: {e}")
-        return None
-
-
-def _find_portfolio_domain_by_host(db, host: str):
-    """Find portfolio domain record by hostname"""
-    try:
-        from models.portfolio_domain import PortfolioDomain
-        host_l = (host or "").strip().lower().rstrip(".")
-        domain = db.query(PortfolioDomain).filter(PortfolioDomain.hostname == host_l).first()
-        logger.info(f"[custom-domain] Portfolio domain lookup for '{host_l}': found={domain is not None}, enabled={domain.enabled if domain else None}")
-        if domain and domain.enabled and domain.dns_verified:
-            return domain
-        return None
-    except Exception as e:
-        logger.error(f"[custom-domain] Portfolio domain lookup error: {e}")
-        return None
-
-
-
-
 @app.middleware("http")
 async def custom_domain_routing(request: Request, call_next):
     try:
@@ -279,127 +205,68 @@ async def custom_domain_routing(request: Request, call_next):
         if is_static:
             # For custom domains, proxy static assets to the frontend
             host = _get_request_host(request)
-            if host:
-                from core.database import get_db
-                from sqlalchemy.orm import Session
-                db: Session = next(get_db())
-                try:
-                    shop = _find_shop_by_host(db, host)
-                    uploads_domain = _find_uploads_domain_by_host(db, host) if not shop else None
-                    vault_domain = _find_vault_domain_by_host(db, host) if not shop and not uploads_domain else None
-                    portfolio_domain = _find_portfolio_domain_by_host(db, host) if not shop and not uploads_domain and not vault_domain else None
-                    if shop or uploads_domain or vault_domain or portfolio_domain:
-                        # Proxy static asset request to frontend
-                        front = (os.getenv("FRONTEND_ORIGIN", "https://photomark.cloud").split(",")[0].strip() or "https://photomark.cloud").rstrip("/")
-                        # Strip /shop prefix if present (happens when URL is /shop/{slug} and assets are relative)
-                        asset_path = path
-                        if path.startswith('/shop/assets/'):
-                            asset_path = path.replace('/shop/assets/', '/assets/')
-                        async with httpx.AsyncClient(timeout=10.0) as client:
-                            r = await client.get(f"{front}{asset_path}", follow_redirects=True)
-                            # Determine content type from response or path
-                            content_type = r.headers.get('content-type', 'application/octet-stream')
-                            return Response(content=r.content, media_type=content_type, status_code=r.status_code)
-                finally:
-                    try:
-                        db.close()
-                    except Exception:
-                        pass
+            if host and resolve_host(host):
+                # Proxy static asset request to frontend
+                # Strip /shop prefix if present (happens when URL is /shop/{slug} and assets are relative)
+                asset_path = path
+                if path.startswith('/shop/assets/'):
+                    asset_path = path.replace('/shop/assets/', '/assets/')
+                r = await get_spa_client().get(f"{frontend_origin()}{asset_path}")
+                # Determine content type from response or path
+                content_type = r.headers.get('content-type', 'application/octet-stream')
+                return Response(content=r.content, media_type=content_type, status_code=r.status_code)
             return await call_next(request)
 
         host = _get_request_host(request)
-        logger.info(f"[custom-domain] Middleware checking host: {host}, path: {path}")
-        if host:
-            from core.database import get_db
-            from sqlalchemy.orm import Session
-            from models.shop import Shop
-            db: Session = next(get_db())
-            try:
-                # Check for shop custom domain first
-                shop = _find_shop_by_host(db, host)
-                logger.info(f"[custom-domain] Found shop: {shop.slug if shop else None}")
-                if shop:
-                    if _should_redirect_shop(shop):
-                        slug = (shop.slug or "").strip()
-                        front = (os.getenv("FRONTEND_ORIGIN", "https://photomark.cloud").split(",")[0].strip() or "https://photomark.cloud").rstrip("/")
-                        async with httpx.AsyncClient(timeout=10.0) as client:
-                            # Fetch the SPA shell from root
-                            r = await client.get(f"{front}/", follow_redirects=True)
-                            html = r.text
-                            # Inject script to set custom domain flag and slug
-                            # Do NOT use history.replaceState as it breaks relative asset paths
-                            inject = f"""<script>
+        tenant = resolve_host(host) if host else None
+        if tenant:
+            kind = tenant.get("kind")
+            inject = None
+            at_head_start = False
+            if kind == "shop" and tenant.get("redirect"):
+                slug = tenant.get("slug") or ""
+                # Inject script to set custom domain flag and slug
+                # Do NOT use history.replaceState as it breaks relative asset paths
+                inject = f"""<script>
 window.__SHOP_CUSTOM_DOMAIN__=true;
 window.__SHOP_SLUG__="{slug}";
 </script>""" if slug else ""
-                            # Insert right after <head> to ensure it runs first
-                            html = html.replace("<head>", "<head>" + inject) if "<head>" in html else (inject + html)
-                            return Response(content=html, media_type="text/html", status_code=200)
-                
-                # Check for uploads custom domain
-                uploads_domain = _find_uploads_domain_by_host(db, host)
-                logger.info(f"[custom-domain] Found uploads_domain: {uploads_domain.hostname if uploads_domain else None}")
-                if uploads_domain:
-                    # Serve the uploads preview page for this user
-                    uid = uploads_domain.uid
-                    front = (os.getenv("FRONTEND_ORIGIN", "https://photomark.cloud").split(",")[0].strip() or "https://photomark.cloud").rstrip("/")
-                    async with httpx.AsyncClient(timeout=10.0) as client:
-                        r = await client.get(f"{front}/", follow_redirects=True)
-                        html = r.text
-                        # Inject script to set uploads preview mode with user UID
-                        inject = f"""<script>
-                            window.__UPLOADS_CUSTOM_DOMAIN__ = true;
-                            window.__UPLOADS_OWNER_UID__ = "{uid}";
-                            try{{history.replaceState(null,'','/external-uploads')}}catch(e){{}}
-                        </script>"""
-                        html = html.replace("</head>", inject + "</head>") if "</head>" in html else (inject + html)
-                        return Response(content=html, media_type="text/html", status_code=200)
-                
-                # Check for vault custom domain
-                vault_domain = _find_vault_domain_by_host(db, host)
-                logger.info(f"[custom-domain] Found vault_domain: {vault_domain.hostname if vault_domain else None}")
-                if vault_domain:
-                    # Serve the vault share page
-                    share_token = vault_domain.share_token
-                    vault_name = vault_domain.vault_name
-                    front = (os.getenv("FRONTEND_ORIGIN", "https://photomark.cloud").split(",")[0].strip() or "https://photomark.cloud").rstrip("/")
-                    async with httpx.AsyncClient(timeout=10.0) as client:
-                        r = await client.get(f"{front}/", follow_redirects=True)
-                        html = r.text
-                        # Inject script to set vault share mode with token
-                        inject = f"""<script>
-                            window.__VAULT_CUSTOM_DOMAIN__ = true;
-                            window.__VAULT_SHARE_TOKEN__ = "{share_token or ''}";
-                            window.__VAULT_NAME__ = "{vault_name or ''}";
-                            try{{history.replaceState(null,'','/#share?token={share_token or ""}')}}catch(e){{}}
-                        </script>"""
-                        html = html.replace("</head>", inject + "</head>") if "</head>" in html else (inject + html)
-                        return Response(content=html, media_type="text/html", status_code=200)
-                
-                # Check for portfolio custom domain
-                portfolio_domain = _find_portfolio_domain_by_host(db, host)
-                logger.info(f"[custom-domain] Found portfolio_domain: {portfolio_domain.hostname if portfolio_domain else None}")
-                if portfolio_domain:
-                    # Serve the portfolio page
-                    uid = portfolio_domain.uid
-                    front = (os.getenv("FRONTEND_ORIGIN", "https://photomark.cloud").split(",")[0].strip() or "https://photomark.cloud").rstrip("/")
-                    async with httpx.AsyncClient(timeout=10.0) as client:
-                        r = await client.get(f"{front}/", follow_redirects=True)
-                        html = r.text
-                        # Inject script to set portfolio custom domain mode with user ID
-                        inject = f"""<script>
-                            window.__PORTFOLIO_CUSTOM_DOMAIN__ = true;
-                            window.__PORTFOLIO_USER_ID__ = "{uid}";
-                            try{{history.replaceState(null,'','/portfolio/{uid}')}}catch(e){{}}
-                        </script>"""
-                        html = html.replace("</head>", inject + "</head>") if "</head>" in html else (inject + html)
-                        return Response(content=html, media_type="text/html", status_code=200)
-
-            finally:
-                try:
-                    db.close()
-                except Exception:
-                    pass
+                # Insert right after <head> to ensure it runs first
+                at_head_start = True
+            elif kind == "uploads":
+                # Serve the uploads preview page for this user
+                uid = tenant.get("uid")
+                inject = f"""<script>
+                        window.__UPLOADS_CUSTOM_DOMAIN__ = true;
+                        window.__UPLOADS_OWNER_UID__ = "{uid}";
+                        try{{history.replaceState(null,'','/external-uploads')}}catch(e){{}}
+                    </script>"""
+            elif kind == "vault":
+                # Serve the vault share page
+                share_token = tenant.get("share_token")
+                vault_name = tenant.get("vault_name")
+                inject = f"""<script>
+                        window.__VAULT_CUSTOM_DOMAIN__ = true;
+                        window.__VAULT_SHARE_TOKEN__ = "{share_token or ''}";
+                        window.__VAULT_NAME__ = "{vault_name or ''}";
+                        try{{history.replaceState(null,'','/#share?token={share_token or ""}')}}catch(e){{}}
+                    </script>"""
+            elif kind == "portfolio":
+                # Serve the portfolio page
+                uid = tenant.get("uid")
+                inject = f"""<script>
+                        window.__PORTFOLIO_CUSTOM_DOMAIN__ = true;
+                        window.__PORTFOLIO_USER_ID__ = "{uid}";
+                        try{{history.replaceState(null,'','/portfolio/{uid}')}}catch(e){{}}
+                    </script>"""
+            if inject is not None:
+                page = await render_shell(inject, at_head_start=at_head_start)
+                if page:
+                    body, etag = page
+                    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+                    if etag in (request.headers.get("if-none-match") or ""):
+                        return Response(status_code=304, headers=headers)
+                    return Response(content=body, media_type="text/html", status_code=200, headers=headers)
     except Exception:
         pass
     return await call_next(request)
@@ -1003,6 +870,43 @@ async def _init_postgres_schema():
         init_db()
     except Exception as _ex:
         logger.warning(f"init_db failed: {_ex}")
+
+@app.on_event("startup")
+async def _start_derivative_workers():
+    # Resume thumbnail/backup jobs queued before the last restart
+    try:
+        from utils.storage import register_derivative_handlers
+        from utils.derivative_jobs import start_workers
+        register_derivative_handlers()
+        start_workers()
+    except Exception as _ex:
+        logger.warning(f"derivative workers not started: {_ex}")
+
+@app.on_event("startup")
+async def _load_watermark_fonts():
+    # Resolve the watermark font once; pool workers forked afterwards inherit it
+    try:
+        from utils.watermark import load_fonts
+        await asyncio.to_thread(load_fonts)
+    except Exception as _ex:
+        logger.warning(f"watermark fonts not preloaded: {_ex}")
+
+@app.on_event("startup")
+async def _start_cpu_pool():
+    # Fork and warm the shared image-processing workers before taking traffic
+    try:
+        from core import cpu_pool
+        await asyncio.to_thread(cpu_pool.start)
+    except Exception as _ex:
+        logger.warning(f"cpu pool not started: {_ex}")
+
+@app.on_event("shutdown")
+async def _stop_cpu_pool():
+    try:
+        from core import cpu_pool
+        cpu_pool.shutdown()
+    except Exception:
+        pass
 @app.get("/")
 async def root(request: Request):
     try:
@@ -1014,9 +918,9 @@ async def root(request: Request):
             from models.user import User
             db: Session = next(get_db())
             try:
-                shop = _find_shop_by_host(db, host)
+                shop = find_shop_by_host(db, host)
                 if shop:
-                    if _should_redirect_shop(shop):
+                    if should_redirect_shop(shop):
                         user = db.query(User).filter(User.uid == shop.owner_uid).first()
                         sub_id = (user.subscription_id if user and user.subscription_id else "")
                         status = (user.subscription_status if user and user.subscription_status else (user.plan if user and user.plan else "inactive"))
@@ -1054,9 +958,9 @@ async def domain_redirect_any(request: Request, remaining_path: str):
             from models.shop import Shop
             db: Session = next(get_db())
             try:
-                shop = _find_shop_by_host(db, host)
+                shop = find_shop_by_host(db, host)
                 if shop:
-                    if _should_redirect_shop(shop):
+                    if should_redirect_shop(shop):
                         slug = (shop.slug or "").strip()
                         front = (os.getenv("FRONTEND_ORIGIN", "https://photomark.cloud").split(",")[0].strip() or "https://photomark.cloud").rstrip("/")
                         
@@ -1104,7 +1008,7 @@ async def allow_domain_text(request: Request):
         from models.shop import Shop
         db: Session = next(get_db())
         try:
-            shop = _find_shop_by_host(db, domain)
+            shop = find_shop_by_host(db, domain)
             if shop:
                 return PlainTextResponse("yes", status_code=200)
         finally:
@@ -1128,7 +1032,7 @@ async def resolve_domain_simple(hostname: str):
         from models.shop import Shop
         db: Session = next(get_db())
         try:
-            shop = _find_shop_by_host(db, inbound)
+            shop = find_shop_by_host(db, inbound)
             if not shop:
                 raise HTTPException(status_code=404, detail="No shop bound to this domain")
             enabled = bool((shop.domain or {}).get('enabled') or False)
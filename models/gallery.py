@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
 from sqlalchemy.sql import func
 from core.database import Base
 
@@ -11,6 +11,8 @@ class GalleryAsset(Base):
     vault = Column(String(255), index=True, nullable=True)
     key = Column(Text, unique=True, nullable=False)
     size_bytes = Column(Integer, nullable=False, default=0)
+    # Invisible watermark recorded at upload time; NULL = unknown (legacy rows)
+    has_invisible = Column(Boolean, nullable=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
@@ -8,7 +8,7 @@ import secrets
 import shutil
 from sqlalchemy.orm import Session
 
-from core.auth import get_uid_from_request, firebase_enabled, fb_auth  # type: ignore
+from core.auth import get_uid_from_request, firebase_enabled, fb_auth, revoke_cached_tokens  # type: ignore
 from core.config import logger, STATIC_DIR, s3, R2_BUCKET
 from core.database import get_db
 from models.user import User
@@ -776,6 +776,7 @@ async def email_change_confirm(request: Request, payload: dict = Body(...)):
         # Update email now that the code is verified
         try:
             fb_auth.update_user(uid, email=target_email, email_verified=False)
+            revoke_cached_tokens(uid)
         except Exception as ex:
             logger.warning(f"email change confirm failed for {uid}: {ex}")
             msg = (getattr(ex, "message", None) or str(ex) or "").lower()
@@ -894,6 +895,7 @@ async def password_change_confirm(request: Request, payload: dict = Body(...)):
         # Update password
         try:
             fb_auth.update_user(uid, password=new_password)
+            revoke_cached_tokens(uid)
         except Exception as ex:
             logger.warning(f"password change confirm failed for {uid}: {ex}")
             return JSONResponse({"error": "Failed to update password"}, status_code=400)
@@ -1032,6 +1034,7 @@ async def delete_account(request: Request, db: Session = Depends(get_db)):
     # 4) Delete Auth user
     try:
         fb_auth.delete_user(uid)
+        revoke_cached_tokens(uid)
     except Exception as ex:
         logger.warning(f"delete_account: failed to delete auth user {uid}: {ex}")
         return JSONResponse({"error": "Failed to delete account"}, status_code=400)
@@ -6,7 +6,7 @@ import random
 import hashlib
 from datetime import datetime, timedelta
 
-from core.auth import get_uid_from_request, firebase_enabled, fb_auth  # type: ignore
+from core.auth import get_uid_from_request, firebase_enabled, fb_auth, revoke_cached_tokens  # type: ignore
 from core.config import logger
 from utils.emailing import render_email, send_email_smtp
 from utils.storage import write_json_key, read_json_key
@@ -360,6 +360,7 @@ async def auth_password_reset_confirm_otp(payload: dict = Body(...)):
     try:
         # Update password in Firebase
         fb_auth.update_user(uid, password=password)
+        revoke_cached_tokens(uid)
         
         # Delete the OTP record
         write_json_key(_pw_reset_otp_key(email), {})
@@ -799,6 +800,7 @@ async def auth_password_confirm(payload: dict = Body(...)):
     uid = rec.get("uid") or ""
     try:
         fb_auth.update_user(uid, password=password)
+        revoke_cached_tokens(uid)
         rec["used"] = True
         write_json_key(_pw_reset_key(token), rec)
         return {"ok": True}
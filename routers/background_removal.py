@@ -9,6 +9,11 @@ from PIL import Image, ImageDraw
 import cv2
 import os
 import sys
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
 
 # Handle different import paths for local vs server
 try:
@@ -36,8 +41,14 @@ except Exception:
 
 # Global state
 _sam_predictor = None
+_sam_lock = threading.Lock()  # the predictor holds one image's state at a time
 _hf_rmbg = None
 
+# Editing sessions: decoded image + SAM image embedding per image hash, so click
+# refinement only runs the prompt/mask decoder instead of the vit_b image encoder
+SAM_SESSION_BUDGET_BYTES = int(os.getenv("SAM_SESSION_BUDGET_MB", "512") or "512") * 1024 * 1024
+SAM_SESSION_IDLE_SECONDS = 30 * 60
+
 # Create router
 router = APIRouter(prefix="/api/background-removal", tags=["background-removal"])
 
@@ -76,6 +87,109 @@ def _get_mobile_sam_predictor():
             return None
     return _sam_predictor
 
+class _SamSessions:
+    """LRU of editing sessions bounded by approximate memory use."""
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.bytes = 0
+        self._data: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cost(sess: dict) -> int:
+        # The PIL image and image_np are separate copies of the decoded pixels
+        img = sess["image"]
+        cost = sess["image_np"].nbytes + img.width * img.height * len(img.getbands())
+        if sess.get("mask") is not None:
+            cost += sess["mask"].nbytes
+        feats = sess.get("features")
+        if feats is not None:
+            cost += feats.element_size() * feats.nelement()
+        return cost
+
+    def get(self, sid: str) -> Optional[dict]:
+        with self._lock:
+            sess = self._data.get(sid)
+            if sess is None:
+                return None
+            if time.time() - sess["used_at"] > SAM_SESSION_IDLE_SECONDS:
+                self._drop(sid)
+                return None
+            sess["used_at"] = time.time()
+            self._data.move_to_end(sid)
+            return sess
+
+    def put(self, sid: str, sess: dict) -> None:
+        with self._lock:
+            if sid in self._data:
+                self._drop(sid)
+            sess["used_at"] = time.time()
+            sess["cost"] = self._cost(sess)
+            self._data[sid] = sess
+            self.bytes += sess["cost"]
+            while len(self._data) > 1 and self.bytes > self.budget_bytes:
+                self._drop(next(iter(self._data)))
+
+    def update(self, sid: str, **fields) -> None:
+        with self._lock:
+            sess = self._data.get(sid)
+            if sess is None:
+                return
+            sess.update(fields)
+            self.bytes -= sess["cost"]
+            sess["cost"] = self._cost(sess)
+            self.bytes += sess["cost"]
+
+    def _drop(self, sid: str) -> None:
+        sess = self._data.pop(sid, None)
+        if sess is not None:
+            self.bytes -= sess["cost"]
+
+
+_sam_sessions = _SamSessions(SAM_SESSION_BUDGET_BYTES)
+
+
+def _open_sam_session(session_id: Optional[str], image_base64: Optional[str]) -> tuple[str, dict]:
+    """Resolve the editing session from an id or (re)create it from the image.
+
+    Sending the same image again maps to the same session (id = image hash), so
+    clients that always post the image still skip re-encoding.
+    """
+    if session_id:
+        sess = _sam_sessions.get(session_id)
+        if sess is not None:
+            return session_id, sess
+    if not image_base64:
+        raise HTTPException(status_code=410, detail="Editing session expired; resend image_base64")
+    raw = base64.b64decode(image_base64)
+    sid = hashlib.sha256(raw).hexdigest()[:32]
+    sess = _sam_sessions.get(sid)
+    if sess is None:
+        img = Image.open(io.BytesIO(raw)).convert("RGB")
+        sess = {"image": img, "image_np": np.array(img), "features": None, "mask": None}
+        _sam_sessions.put(sid, sess)
+    return sid, sess
+
+
+def _predictor_for_session(predictor, sid: str, sess: dict) -> None:
+    """Load the session's embedding into the predictor, running the encoder only once."""
+    if sess.get("features") is not None:
+        predictor.reset_image()
+        predictor.features = sess["features"]
+        predictor.original_size = sess["original_size"]
+        predictor.input_size = sess["input_size"]
+        predictor.is_image_set = True
+        return
+    predictor.set_image(sess["image_np"])
+    _sam_sessions.update(
+        sid,
+        features=predictor.features,
+        original_size=predictor.original_size,
+        input_size=predictor.input_size,
+    )
+
+
 def _get_hf_rmbg():
     global _hf_rmbg
     if _hf_rmbg is None:
@@ -170,9 +284,14 @@ async def step1_rembg_cutout(
         original_b64 = _image_to_base64(img, "JPEG")
         mask_b64 = _image_to_base64(mask_img, "PNG")
         preview_b64 = _image_to_base64(preview, "PNG")
+
+        # Later SAM steps can refer to the image (and this mask) by session id
+        session_id, _ = _open_sam_session(None, original_b64)
+        _sam_sessions.update(session_id, mask=np.array(mask_img.convert("L")))
         
         return {
             "success": True,
+            "session_id": session_id,
             "original": original_b64,
             "mask": mask_b64,
             "preview": preview_b64,
@@ -187,12 +306,15 @@ async def step1_rembg_cutout(
 @router.post("/step2-mobile-sam")
 async def step2_mobile_sam_mask(
     request: Request,
-    image_base64: str = Form(...),
-    click_points: str = Form(...)  # JSON array of {x, y, type: "positive"|"negative"}
+    image_base64: Optional[str] = Form(None),
+    click_points: str = Form(...),  # JSON array of {x, y, type: "positive"|"negative"}
+    session_id: Optional[str] = Form(None),
 ):
     """
     Step 2: Use Mobile-SAM for precise mask extraction based on user clicks
     User clicks on object → model extracts precise mask → display overlay
+    Pass session_id (from step1 or a previous click) instead of image_base64 to
+    reuse the cached image embedding.
     """
     try:
         # Parse click points
@@ -200,17 +322,13 @@ async def step2_mobile_sam_mask(
         if not points:
             raise HTTPException(status_code=400, detail="No click points provided")
         
-        # Convert base64 to image
-        img = _base64_to_image(image_base64)
-        img_np = np.array(img.convert("RGB"))
-        
         # Get Mobile-SAM predictor
         predictor = _get_mobile_sam_predictor()
         if predictor is None:
             raise HTTPException(status_code=503, detail="Mobile-SAM model not available")
-        
-        # Set image for predictor
-        predictor.set_image(img_np)
+
+        sid, sess = _open_sam_session(session_id, image_base64)
+        img = sess["image"]
         
         # Prepare points and labels
         point_coords = []
@@ -222,12 +340,14 @@ async def step2_mobile_sam_mask(
         point_coords = np.array(point_coords)
         point_labels = np.array(point_labels)
         
-        # Predict mask
-        masks, scores, logits = predictor.predict(
-            point_coords=point_coords,
-            point_labels=point_labels,
-            multimask_output=True
-        )
+        # Predict mask (image embedding comes from the session cache)
+        with _sam_lock:
+            _predictor_for_session(predictor, sid, sess)
+            masks, scores, logits = predictor.predict(
+                point_coords=point_coords,
+                point_labels=point_labels,
+                multimask_output=True
+            )
         
         # Use best mask (highest score)
         best_mask_idx = np.argmax(scores)
@@ -236,6 +356,7 @@ async def step2_mobile_sam_mask(
         # Convert mask to uint8
         mask_uint8 = (mask * 255).astype(np.uint8)
         mask_img = Image.fromarray(mask_uint8, mode="L")
+        _sam_sessions.update(sid, mask=mask_uint8)
         
         # Create preview with mask overlay
         preview = img.convert("RGBA")
@@ -249,11 +370,14 @@ async def step2_mobile_sam_mask(
         
         return {
             "success": True,
+            "session_id": sid,
             "mask": mask_b64,
             "preview": preview_b64,
             "score": float(scores[best_mask_idx])
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Mobile-SAM mask extraction failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -322,13 +446,16 @@ async def step3_refine_brush_mask(
 @router.post("/step3-refine-clicks")
 async def step3_refine_clicks_mask(
     request: Request,
-    image_base64: str = Form(...),
-    mask_base64: str = Form(...),
-    click_points: str = Form(...)  # JSON array of {x, y, type: "positive"|"negative"}
+    image_base64: Optional[str] = Form(None),
+    mask_base64: Optional[str] = Form(None),
+    click_points: str = Form(...),  # JSON array of {x, y, type: "positive"|"negative"}
+    session_id: Optional[str] = Form(None),
 ):
     """
     Step 3 Alternative: Refine existing mask using SAM with click points
     This allows users to refine the final result by clicking on areas to add/remove
+    With session_id, image_base64 and mask_base64 may be omitted: the session's
+    image, embedding and latest mask are used.
     """
     try:
         # Parse click points
@@ -336,19 +463,19 @@ async def step3_refine_clicks_mask(
         if not points:
             raise HTTPException(status_code=400, detail="No click points provided")
         
-        # Convert base64 to images
-        img = _base64_to_image(image_base64).convert("RGB")
-        img_np = np.array(img)
-        existing_mask = _base64_to_image(mask_base64).convert("L")
-        existing_mask_np = np.array(existing_mask)
-        
         # Get Mobile-SAM predictor
         predictor = _get_mobile_sam_predictor()
         if predictor is None:
             raise HTTPException(status_code=503, detail="Mobile-SAM model not available")
-        
-        # Set image for predictor
-        predictor.set_image(img_np)
+
+        sid, sess = _open_sam_session(session_id, image_base64)
+        img = sess["image"]
+        if mask_base64:
+            existing_mask_np = np.array(_base64_to_image(mask_base64).convert("L"))
+        elif sess.get("mask") is not None:
+            existing_mask_np = sess["mask"]
+        else:
+            raise HTTPException(status_code=400, detail="mask_base64 required")
         
         # Prepare points and labels
         point_coords = []
@@ -372,13 +499,15 @@ async def step3_refine_clicks_mask(
         mask_input = np.array(mask_input_pil).astype(np.float32) / 255.0
         mask_input = mask_input[None, :, :]  # Add batch dimension (1, 256, 256)
         
-        # Predict refined mask
-        masks, scores, logits = predictor.predict(
-            point_coords=point_coords,
-            point_labels=point_labels,
-            mask_input=mask_input,
-            multimask_output=False  # Use single mask output for refinement
-        )
+        # Predict refined mask (image embedding comes from the session cache)
+        with _sam_lock:
+            _predictor_for_session(predictor, sid, sess)
+            masks, scores, logits = predictor.predict(
+                point_coords=point_coords,
+                point_labels=point_labels,
+                mask_input=mask_input,
+                multimask_output=False  # Use single mask output for refinement
+            )
         
         # Get the refined mask
         refined_mask = masks[0]
@@ -396,6 +525,7 @@ async def step3_refine_clicks_mask(
         
         # Convert refined mask to PIL Image
         final_mask_img = Image.fromarray(final_mask_np.astype(np.uint8), mode="L")
+        _sam_sessions.update(sid, mask=final_mask_np.astype(np.uint8))
         
         # Generate preview with transparent background
         cutout = Image.new("RGBA", img.size, (0, 0, 0, 0))
@@ -408,10 +538,13 @@ async def step3_refine_clicks_mask(
         
         return {
             "success": True,
+            "session_id": sid,
             "mask": mask_b64,
             "preview": preview_b64
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Click-based refinement failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -14,6 +14,8 @@ from datetime import datetime as _dt
 from core.auth import resolve_workspace_uid, has_role_access
 from utils.storage import upload_bytes, read_json_key, write_json_key
 from utils.metadata import auto_embed_metadata_for_user
+from utils.lut_cache import compiled_lut, content_digest
+from core import cpu_pool
 
 router = APIRouter(prefix="/api", tags=["color-grading"])
 
@@ -81,16 +83,31 @@ def safe_filename(name: str) -> str:
 
 
 def load_cube_lut(file_path: str) -> Tuple[torch.Tensor, int]:
-  """Load a .cube LUT as tensor on device.
+  """Load a .cube LUT file as tensor on device."""
+  try:
+    with open(file_path, "rb") as f:
+      data = f.read()
+  except Exception as e:
+    raise HTTPException(status_code=400, detail=f"Failed to read LUT: {e}")
+  return load_cube_lut_bytes(data)
+
+
+def load_cube_lut_bytes(data: bytes) -> Tuple[torch.Tensor, int]:
+  """Compiled LUT tensor for .cube content, shared through the LUT cache by content hash.
+
+  The returned tensor is shared between requests and must not be modified.
+  """
+  key = ("grading-cube", content_digest(data), str(DEVICE), str(DTYPE))
+  return compiled_lut(key, lambda: _compile_cube_lut(data.decode("utf-8", errors="ignore")))
+
+
+def _compile_cube_lut(text: str) -> Tuple[torch.Tensor, int]:
+  """Parse a .cube LUT into a tensor on device.
 
   Supports basic .cube with LUT_3D_SIZE N lines of R G B triplets.
   If LUT_3D_SIZE is not found, we infer size from number of rows.
   """
-  try:
-    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-      lines = [ln.strip() for ln in f.readlines()]
-  except Exception as e:
-    raise HTTPException(status_code=400, detail=f"Failed to read LUT: {e}")
+  lines = [ln.strip() for ln in text.splitlines()]
 
   size = None
   data: List[List[float]] = []
@@ -126,7 +143,7 @@ def load_cube_lut(file_path: str) -> Tuple[torch.Tensor, int]:
     if size * size * size != n:
       raise HTTPException(status_code=400, detail="LUT data is not cubic or missing LUT_3D_SIZE")
 
-  lut = torch.tensor(data, dtype=DTYPE, device=DEVICE)
+  lut = torch.from_numpy(np.asarray(data, dtype=np.float32)).to(device=DEVICE, dtype=DTYPE)
   # Reshape to (1, C=3, D=size, H=size, W=size)
   try:
     lut = lut.view(size, size, size, 3).permute(3, 0, 1, 2).unsqueeze(0)
@@ -254,12 +271,8 @@ async def apply_lut(request: Request, images: List[UploadFile] = File(...), lut:
         "message": "You have used your free generation. Upgrade to continue.",
       }, status_code=402)
 
-  # Save LUT
-  lut_name = safe_filename(lut.filename)
-  lut_path = os.path.join(UPLOAD_FOLDER, lut_name)
-  with open(lut_path, "wb") as f:
-    shutil.copyfileobj(lut.file, f)
-  lut_tensor, _ = load_cube_lut(lut_path)
+  # Load LUT (compiled once per distinct file)
+  lut_tensor, _ = load_cube_lut_bytes(await lut.read())
 
   # Save images
   input_paths: List[str] = []
@@ -270,7 +283,13 @@ async def apply_lut(request: Request, images: List[UploadFile] = File(...), lut:
       shutil.copyfileobj(img.file, f)
     input_paths.append(img_path)
 
-  output_files = process_images_dynamic_batch(input_paths, lut_tensor, OUTPUT_FOLDER)
+  try:
+    output_files = await cpu_pool.run_in_thread(
+      process_images_dynamic_batch, input_paths, lut_tensor, OUTPUT_FOLDER,
+      tenant=cpu_pool.tenant_for_request(request), priority=cpu_pool.priority_for(len(input_paths)),
+    )
+  except cpu_pool.CpuPoolBusy:
+    return cpu_pool.busy_response()
 
   if len(output_files) == 1:
     fp = output_files[0]
@@ -298,12 +317,8 @@ async def preview(request: Request, image: UploadFile = File(...), lut: UploadFi
         "message": "You have used your free generation. Upgrade to continue.",
       }, status_code=402)
 
-  # Read LUT into temp file and load
-  lut_name = safe_filename(lut.filename)
-  lut_path = os.path.join(UPLOAD_FOLDER, lut_name)
-  with open(lut_path, "wb") as f:
-    shutil.copyfileobj(lut.file, f)
-  lut_tensor, _ = load_cube_lut(lut_path)
+  # Load LUT (compiled once per distinct file)
+  lut_tensor, _ = load_cube_lut_bytes(await lut.read())
 
   # Read image from stream
   try:
@@ -313,7 +328,12 @@ async def preview(request: Request, image: UploadFile = File(...), lut: UploadFi
     raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
 
   try:
-    out_img = apply_lut_to_image_pil(img, lut_tensor)
+    out_img = await cpu_pool.run_in_thread(
+      apply_lut_to_image_pil, img, lut_tensor,
+      tenant=cpu_pool.tenant_for_request(request), priority=cpu_pool.INTERACTIVE,
+    )
+  except cpu_pool.CpuPoolBusy:
+    return cpu_pool.busy_response()
   except Exception as e:
     raise HTTPException(status_code=500, detail=f"Failed to apply LUT: {e}")
 
@@ -348,23 +368,22 @@ async def apply_to_gallery(request: Request, images: List[UploadFile] = File(...
     return JSONResponse({"error": "Forbidden"}, status_code=403)
   uid = eff_uid
 
-  # Save & load LUT
-  lut_name = safe_filename(lut.filename)
-  lut_path = os.path.join(UPLOAD_FOLDER, lut_name)
-  with open(lut_path, "wb") as f:
-    shutil.copyfileobj(lut.file, f)
-  lut_tensor, _ = load_cube_lut(lut_path)
+  # Load LUT (compiled once per distinct file)
+  lut_tensor, _ = load_cube_lut_bytes(await lut.read())
 
   uploaded = []
   date_prefix = _dt.utcnow().strftime('%Y/%m/%d')
+  priority = cpu_pool.priority_for(len(images))
+  # Images left unprocessed because the CPU pool filled up partway through the batch
+  skipped = 0
 
-  for uf in images:
+  for i, uf in enumerate(images):
     try:
       raw = await uf.read()
       if not raw:
         continue
       img = Image.open(io.BytesIO(raw)).convert("RGB")
-      out_img = apply_lut_to_image_pil(img, lut_tensor)
+      out_img = await cpu_pool.run_in_thread(apply_lut_to_image_pil, img, lut_tensor, tenant=uid, priority=priority)
 
       # Encode as JPEG
       buf = io.BytesIO()
@@ -393,7 +412,14 @@ async def apply_to_gallery(request: Request, images: List[UploadFile] = File(...
 
       url = upload_bytes(key, output_bytes, content_type='image/jpeg')
       uploaded.append({"key": key, "url": url})
+    except cpu_pool.CpuPoolBusy:
+      if not uploaded:
+        return cpu_pool.busy_response()
+      skipped = len(images) - i
+      break
     except Exception:
       continue
 
+  if skipped:
+    return {"ok": True, "uploaded": uploaded, "incomplete": True, "skipped": skipped}
   return {"ok": True, "uploaded": uploaded}
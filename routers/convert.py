@@ -2,16 +2,16 @@ from typing import List, Optional
 import os
 import io
 import zipfile
-import multiprocessing
-from concurrent.futures import ProcessPoolExecutor
 
 from fastapi import APIRouter, Request, UploadFile, File, Form, BackgroundTasks
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import StreamingResponse
 from PIL import Image
 from PIL.PngImagePlugin import PngInfo
 
 from core.config import MAX_FILES, logger
+from core import cpu_pool
 from core.auth import get_uid_from_request, resolve_workspace_uid, has_role_access, get_user_email_from_uid
 
 try:
@@ -362,7 +362,7 @@ def convert_one(raw: bytes, filename: str, target: str, artist: Optional[str]) -
         logger.error("convert_one failed for %s: %s", filename, ex)
         return filename, None
 
-# Helper for ProcessPoolExecutor
+# Helper for the shared CPU pool
 def _convert_one_unpack(args):
     return convert_one(*args)
 
@@ -416,6 +416,10 @@ async def convert_bulk(
         if raw:
             files_data.append((raw, uf.filename, t, artist))
 
+    # Fair-share scheduling key and class for the shared CPU pool
+    tenant = eff_uid
+    priority = cpu_pool.priority_for(len(files_data))
+
     # Prepare ZIP builder
     def build_zip_bytes() -> bytes:
         mem = io.BytesIO()
@@ -432,18 +436,10 @@ async def convert_bulk(
                     i += 1
                 used_names.add(cand)
                 return cand
-            if len(files_data) < 10:
-                # Sequential
-                for f in files_data:
-                    arcname, out_blob = convert_one(*f)
-                    if out_blob:
-                        zf.writestr(_unique_name(arcname), out_blob)
-            else:
-                # Parallel
-                with ProcessPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
-                    for arcname, out_blob in executor.map(_convert_one_unpack, files_data):
-                        if out_blob:
-                            zf.writestr(_unique_name(arcname), out_blob)
+            # Converted on the shared CPU pool, results written in input order
+            for arcname, out_blob in cpu_pool.imap(_convert_one_unpack, files_data, tenant=tenant, priority=priority):
+                if out_blob:
+                    zf.writestr(_unique_name(arcname), out_blob)
         mem.seek(0)
         return mem.read()
 
@@ -485,7 +481,10 @@ async def convert_bulk(
             # If email flow fails, fall back to streaming
 
     # Normal flow: stream zip
-    mem_zip = io.BytesIO(build_zip_bytes())
+    try:
+        mem_zip = io.BytesIO(await run_in_threadpool(build_zip_bytes))
+    except cpu_pool.CpuPoolBusy:
+        return cpu_pool.busy_response()
     headers = {
         "Content-Disposition": "attachment; filename=converted.zip",
         "Access-Control-Expose-Headers": "Content-Disposition",
@@ -564,18 +563,22 @@ async def aspect_batch(
     if not tasks:
         return JSONResponse({"error": "No files provided"}, status_code=400)
 
+    # Render on the shared CPU pool
+    args = [(raw, r, bg, x_center, y_center) for (raw, r, bg, x_center, y_center, _, __) in tasks]
+    try:
+        outs = await cpu_pool.amap(_letterbox_unpack, args, tenant=eff_uid, priority=cpu_pool.priority_for(len(args)))
+    except cpu_pool.CpuPoolBusy:
+        return cpu_pool.busy_response()
+
     # Build zip
     mem = io.BytesIO()
     with zipfile.ZipFile(mem, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
-        # Parallelize by CPU
-        args = [(raw, r, bg, x_center, y_center) for (raw, r, bg, x_center, y_center, _, __) in tasks]
-        with ProcessPoolExecutor(max_workers=max(1, multiprocessing.cpu_count())) as ex:
-            for (raw, r, bg, x_center, y_center, base, rstr), out_buf in zip(tasks, ex.map(_letterbox_unpack, args)):
-                if not out_buf:
-                    continue
-                safe_r = rstr.replace(':', 'x').replace('.', '_')
-                arc = f"{base}_ar-{safe_r}.png"
-                zf.writestr(arc, out_buf)
+        for (raw, r, bg, x_center, y_center, base, rstr), out_buf in zip(tasks, outs):
+            if not out_buf:
+                continue
+            safe_r = rstr.replace(':', 'x').replace('.', '_')
+            arc = f"{base}_ar-{safe_r}.png"
+            zf.writestr(arc, out_buf)
     mem.seek(0)
     headers = {
         "Content-Disposition": "attachment; filename=aspect_letterbox.zip",
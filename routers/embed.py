@@ -4,15 +4,22 @@ import json, os
 from datetime import datetime
 from routers.photos import _build_manifest
 from core.config import s3, s3_presign_client, R2_BUCKET, R2_PUBLIC_BASE_URL, R2_CUSTOM_DOMAIN, STATIC_DIR as static_dir
-from utils.storage import get_presigned_url
+from utils.storage import get_presigned_urls
+from utils.image_placeholders import attach_placeholders
 from typing import Tuple
 
 router = APIRouter(prefix="/embed", tags=["embed"])
 
 
-def _get_original_url(key: str, expires_in: int = 3600) -> str:
-    """Get the original full-quality URL for embed display."""
-    return get_presigned_url(key, expires_in=expires_in) or ""
+def _attach_urls(photos: list[dict], expires_in: int = 3600) -> list[dict]:
+    """Presign the photos actually rendered, in one batch."""
+    missing = [p["key"] for p in photos if not p.get("url")]
+    if missing:
+        urls = get_presigned_urls(missing, expires_in=expires_in)
+        for p in photos:
+            if not p.get("url"):
+                p["url"] = urls.get(p["key"], "")
+    return photos
 
 def _html_page(content: str) -> HTMLResponse:
     return HTMLResponse(content=content, media_type="text/html; charset=utf-8")
@@ -41,6 +48,16 @@ def _color_theme(theme: str | None, bg: str | None):
             card_bg = s
     return cs, bg_value, fg, border, card_bg, cap, shadow
 
+def _placeholder_attrs(p: dict) -> str:
+    """width/height (reserves the box) and a color + LQIP background shown until the image loads."""
+    ph = p.get("placeholder")
+    if not ph:
+        return ""
+    style = f"background:{ph['color']}"
+    if ph.get("lqip"):
+        style += f" url({ph['lqip']}) center/cover no-repeat"
+    return f' width="{ph["width"]}" height="{ph["height"]}" style="{style}"'
+
 def _render_html(payload: dict, theme: str, bg: str | None, title: str):
     """Render photos as Shopify-style collage/masonry gallery"""
     cs, bg_value, fg, border, card_bg, cap, shadow = _color_theme(theme, bg)
@@ -51,7 +68,7 @@ def _render_html(payload: dict, theme: str, bg: str | None, title: str):
     for i, p in enumerate(photos):
         url = p.get("url", "")
         if url:
-            photo_cards += f'<div class="item"><img src="{url}" alt="" loading="{"eager" if i < 8 else "lazy"}" decoding="async"/></div>\n'
+            photo_cards += f'<div class="item"><img src="{url}" alt="" loading="{"eager" if i < 8 else "lazy"}" decoding="async"{_placeholder_attrs(p)}/></div>\n'
     
     return f"""<!doctype html>
 <html>
@@ -169,11 +186,10 @@ def embed_gallery(
                 if "_thumb_small" in key or "_thumb_medium" in key:
                     continue
                 last = getattr(obj, "last_modified", datetime.utcnow())
-                # Use original full-quality image
-                url = _get_original_url(key, expires_in=60 * 60)
+                # Full-quality URL is presigned later, only for photos that are rendered
                 items.append({
                     "key": key,
-                    "url": url,
+                    "url": "",
                     "name": os.path.basename(key),
                     "last": last.isoformat() if hasattr(last, "isoformat") else str(last),
                 })
@@ -211,7 +227,7 @@ def embed_gallery(
             except:
                 n = 10
             photos = photos_all[:max(1, n)]
-    return _html_page(_render_html({"photos": photos}, theme, bg, "Photomark Gallery"))
+    return _html_page(_render_html({"photos": attach_placeholders(_attach_urls(photos))}, theme, bg, "Photomark Gallery"))
 
 @router.get("/myuploads")
 def embed_myuploads(
@@ -239,9 +255,8 @@ def embed_myuploads(
                     if "_thumb_small" in key or "_thumb_medium" in key:
                         continue
                     name = os.path.basename(key)
-                    # Use original full-quality image
-                    url = _get_original_url(key, expires_in=60 * 60)
-                    items.append({"key": key, "url": url, "name": name, "last": (entry.get("LastModified") or datetime.utcnow()).isoformat()})
+                    # Full-quality URL is presigned later, only for photos that are rendered
+                    items.append({"key": key, "url": "", "name": name, "last": (entry.get("LastModified") or datetime.utcnow()).isoformat()})
                 if resp.get("IsTruncated"):
                     continuation = resp.get("NextContinuationToken")
                 else:
@@ -279,7 +294,7 @@ def embed_myuploads(
             except:
                 n = 10
             photos = photos_all[:max(1, n)]
-    return _html_page(_render_html({"photos": photos}, theme, bg, "Photomark My Uploads"))
+    return _html_page(_render_html({"photos": _attach_urls(photos)}, theme, bg, "Photomark My Uploads"))
 
 
 def _vault_key(uid: str, vault: str) -> Tuple[str, str]:
@@ -290,20 +305,10 @@ def _vault_key(uid: str, vault: str) -> Tuple[str, str]:
 
 
 def _read_vault(uid: str, vault: str) -> list[str]:
-    key, _ = _vault_key(uid, vault)
+    # Vault membership moves to Postgres once migrated; reuse the vaults router reader
+    from routers.vaults import _read_vault as _read_vault_manifest
     try:
-        if s3 and R2_BUCKET:
-            obj = s3.Object(R2_BUCKET, key)
-            data = obj.get()["Body"].read()
-            doc = json.loads(data.decode("utf-8"))
-            return doc.get("keys") or []
-        else:
-            path = os.path.join(static_dir, key)
-            if not os.path.exists(path):
-                return []
-            with open(path, "r", encoding="utf-8") as f:
-                doc = json.load(f)
-                return doc.get("keys") or []
+        return _read_vault_manifest(uid, vault)
     except Exception:
         return []
 
@@ -345,10 +350,9 @@ def embed_vault(
                 # Skip thumbnail files
                 if "_thumb_small" in key or "_thumb_medium" in key:
                     continue
-                # Use original full-quality image
-                url = _get_original_url(key, expires_in=60 * 60)
+                # Full-quality URL is presigned later, only for photos that are rendered
                 name = os.path.basename(key)
-                items.append({"key": key, "url": url, "name": name})
+                items.append({"key": key, "url": "", "name": name})
             except Exception:
                 continue
         
@@ -363,7 +367,7 @@ def embed_vault(
                 n = 10
             photos = photos_all[:max(1, n)]
         
-        return _html_page(_render_html({"photos": photos}, theme, bg, f"Photomark - {vault}"))
+        return _html_page(_render_html({"photos": _attach_urls(photos)}, theme, bg, f"Photomark - {vault}"))
     except Exception as ex:
         return HTMLResponse(content=f"<!doctype html><html><body><p>Error loading vault: {str(ex)}</p></body></html>", status_code=500)
 
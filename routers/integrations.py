@@ -11,6 +11,7 @@ import hashlib
 from core.auth import get_uid_from_request
 from core.config import logger
 from utils.storage import read_json_key, write_json_key
+from utils.api_tokens import register_token, revoke_token, last_used_map
 from sqlalchemy.orm import Session
 from core.database import get_db
 from models.user import User
@@ -80,6 +81,8 @@ async def list_api_tokens(request: Request, db: Session = Depends(get_db)):
     try:
         data = read_json_key(_api_tokens_key(uid)) or {}
         tokens = data.get("tokens", [])
+        # last_used_at is tracked in the token index, not written back to the JSON
+        last_used = last_used_map(uid) if tokens else {}
         
         # Return metadata only (not the hashed tokens)
         result = []
@@ -88,7 +91,7 @@ async def list_api_tokens(request: Request, db: Session = Depends(get_db)):
                 "id": t.get("id"),
                 "name": t.get("name"),
                 "created_at": t.get("created_at"),
-                "last_used_at": t.get("last_used_at"),
+                "last_used_at": last_used.get(t.get("id")) or t.get("last_used_at"),
                 "expires_at": t.get("expires_at"),
                 "is_active": t.get("is_active", True),
             })
@@ -163,7 +166,10 @@ async def create_api_token(request: Request, payload: dict = Body(...), db: Sess
         data["updated_at"] = now.isoformat()
         write_json_key(_api_tokens_key(uid), data)
         
-        # Create lookup entry for fast token verification
+        # Index for token verification
+        register_token(uid, token_id, token_hash, name, now, expires_at)
+        
+        # Legacy lookup entry, used when the index is unavailable
         lookup_key = f"auth/api_token_lookup/{token_hash[:16]}.json"
         write_json_key(lookup_key, {
             "uid": uid,
@@ -219,8 +225,9 @@ async def revoke_api_token(request: Request, token_id: str, db: Session = Depend
         if not revoked_token:
             return JSONResponse({"error": "Token not found"}, status_code=404)
         
-        # Clean up lookup entry
+        # Clean up index and lookup entry
         if revoked_token.get("hash"):
+            revoke_token(uid, revoked_token["hash"])
             lookup_key = f"auth/api_token_lookup/{revoked_token['hash'][:16]}.json"
             write_json_key(lookup_key, {})  # Clear the lookup
         
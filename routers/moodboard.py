@@ -2,14 +2,15 @@ import os
 import uuid
 import math
 from typing import List, Optional, Tuple
-from multiprocessing import Pool, cpu_count
 from fastapi import APIRouter, File, UploadFile, Request, Form
 from fastapi.responses import JSONResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
 from PIL import Image
 import zipfile
 from io import BytesIO
 
 from core.config import STATIC_DIR
+from core import cpu_pool
 
 router = APIRouter(prefix="/api", tags=["moodboard"])  # included by app.main
 
@@ -77,7 +78,9 @@ def create_moodboard(
     bg_color=(255, 192, 203),
     fast: bool = True,
     board_max: Optional[int] = None,
-    quality: int = 85
+    quality: int = 85,
+    tenant: str = "-",
+    priority: str = cpu_pool.BATCH,
 ):
     rows, cols = grid_size
 
@@ -91,8 +94,7 @@ def create_moodboard(
     moodboard = Image.new("RGB", (board_w, board_h), bg_color)
 
     tasks = [(i, path, cell_w, cell_h, fast) for i, path in enumerate(image_paths)]
-    with Pool(processes=min(cpu_count(), len(tasks))) as pool:
-        results = pool.map(_process_tile, tasks)
+    results = list(cpu_pool.imap(_process_tile, tasks, tenant=tenant, priority=priority))
 
     for idx, size, buf in results:
         if not buf:
@@ -197,16 +199,24 @@ async def generate_moodboard(
         cols = max(3, min(cols, 10))
         rows = max(2, min(rows, 10))
 
-    create_moodboard(file_paths, output_file, grid_size=(rows, cols), padding=12, bg_color=(245, 245, 245), fast=fast, board_max=board_max, quality=88)
-
-    if pages:
-        stem = os.path.splitext(out_name)[0]
-        pages_dir = os.path.join(outputs_dir, f"{stem}_pages")
-        os.makedirs(pages_dir, exist_ok=True)
-
-        tasks = [(src, idx, fast, pages_dir) for idx, src in enumerate(file_paths, start=1)]
-        with Pool(processes=min(cpu_count(), len(tasks))) as pool:
-            pool.map(_process_page, tasks)
+    tenant = cpu_pool.tenant_for_request(request)
+    priority = cpu_pool.priority_for(n)
+    try:
+        await run_in_threadpool(
+            create_moodboard, file_paths, output_file, grid_size=(rows, cols), padding=12,
+            bg_color=(245, 245, 245), fast=fast, board_max=board_max, quality=88,
+            tenant=tenant, priority=priority,
+        )
+
+        if pages:
+            stem = os.path.splitext(out_name)[0]
+            pages_dir = os.path.join(outputs_dir, f"{stem}_pages")
+            os.makedirs(pages_dir, exist_ok=True)
+
+            tasks = [(src, idx, fast, pages_dir) for idx, src in enumerate(file_paths, start=1)]
+            await cpu_pool.amap(_process_page, tasks, tenant=tenant, priority=priority)
+    except cpu_pool.CpuPoolBusy:
+        return cpu_pool.busy_response()
 
     scheme = request.headers.get("x-forwarded-proto") or request.url.scheme
     host = request.headers.get("x-forwarded-host") or request.headers.get("host") or request.url.netloc
@@ -10,19 +10,16 @@ from sqlalchemy.orm import Session
 from core.database import get_db
 from models.gallery import GalleryAsset
 from core.auth import get_uid_from_request, resolve_workspace_uid, has_role_access
-from utils.storage import read_json_key, write_json_key, read_bytes_key, upload_bytes, get_presigned_url
+from utils.storage import read_json_key, write_json_key, read_bytes_key, upload_bytes, get_presigned_url, get_presigned_urls
 from utils.metadata import auto_embed_metadata_for_user
-from utils.invisible_mark import detect_signature, PAYLOAD_LEN
+from utils.invisible_index import resolve_invisible_flags
+from utils.image_placeholders import attach_placeholders
+from utils import vault_manifest
 from io import BytesIO
-from PIL import Image
 import mimetypes
 
 router = APIRouter(prefix="/api", tags=["photos"])
 
-# Cache key for invisible watermark detection results per user
-# Layout: users/{uid}/_cache/invisible/{sha1_of_key}.json with { ok: bool, ts: iso }
-import hashlib
-
 
 def _get_url_for_key(key: str, expires_in: int = 3600) -> str:
     return get_presigned_url(key, expires_in=expires_in) or ""
@@ -51,38 +48,6 @@ def _get_thumbnail_url(key_or_url: str, expires_in: int = 3600) -> Optional[str]
         return None
 
 
-def _cache_key_for_invisible(uid: str, photo_key: str) -> str:
-    h = hashlib.sha1(photo_key.encode('utf-8')).hexdigest()
-    return f"users/{uid}/_cache/invisible/{h}.json"
-
-
-def _has_invisible_mark(uid: str, key: str) -> bool:
-    """Best-effort detection with caching; returns True if invisible mark is detected."""
-    try:
-        ckey = _cache_key_for_invisible(uid, key)
-        rec = read_json_key(ckey)
-        if isinstance(rec, dict) and "ok" in rec:
-            return bool(rec.get("ok"))
-        data = read_bytes_key(key)
-        if not data:
-            write_json_key(ckey, {"ok": False, "ts": datetime.utcnow().isoformat()})
-            return False
-        try:
-            img = Image.open(BytesIO(data))
-        except Exception:
-            write_json_key(ckey, {"ok": False, "ts": datetime.utcnow().isoformat()})
-            return False
-        try:
-            payload = detect_signature(img, payload_len_bytes=PAYLOAD_LEN)
-            ok = bool(payload)
-        except Exception:
-            ok = False
-        write_json_key(ckey, {"ok": ok, "ts": datetime.utcnow().isoformat()})
-        return ok
-    except Exception:
-        return False
-
-
 def _build_manifest(uid: str) -> dict:
     items: list[dict] = []
     prefix = f"users/{uid}/watermarked/"
@@ -318,12 +283,11 @@ async def api_photos(
                 if '_thumb_' in key:
                     continue
                 name = os.path.basename(key)
-                url = _get_url_for_key(key, expires_in=60 * 60)
                 # Get thumbnail URL if available (for optimized grid loading)
                 thumb_url = _get_thumbnail_url(key, expires_in=60 * 60)
                 item = {
                     "key": key,
-                    "url": url,
+                    "url": "",  # presigned for the whole page below
                     "thumb_url": thumb_url,  # Small thumbnail for grid views
                     "name": name,
                     "size": int(entry.get("Size", 0) or 0),
@@ -338,20 +302,8 @@ async def api_photos(
                             date_part = "/".join(os.path.dirname(key).split("/")[-3:])
                             original_key = f"users/{uid}/originals/{date_part}/{base_part}-{stamp}-orig.{oext}"
                             item["original_key"] = original_key
-                            item["original_url"] = _get_url_for_key(original_key, expires_in=60 * 60)
                     except Exception:
                         pass
-                # Optional: invisible mark flag using cache only unless compute_invisible is True
-                if include_invisible:
-                    try:
-                        if compute_invisible:
-                            item["has_invisible"] = _has_invisible_mark(uid, key)
-                        else:
-                            ckey = _cache_key_for_invisible(uid, key)
-                            rec = read_json_key(ckey)
-                            item["has_invisible"] = bool(rec.get("ok")) if isinstance(rec, dict) else False
-                    except Exception:
-                        item["has_invisible"] = False
                 # Optional friend note sidecar read (lightweight)
                 try:
                     if "-fromfriend-" in name:
@@ -366,6 +318,13 @@ async def api_photos(
                 except Exception:
                     pass
                 items.append(item)
+            # Presign the page in one batch
+            page_keys = [it["key"] for it in items] + [it["original_key"] for it in items if it.get("original_key")]
+            urls = get_presigned_urls(page_keys, expires_in=60 * 60)
+            for it in items:
+                it["url"] = urls.get(it["key"], "")
+                if it.get("original_key"):
+                    it["original_url"] = urls.get(it["original_key"], "")
             if resp.get("IsTruncated"):
                 next_token = resp.get("NextContinuationToken")
         except Exception as ex:
@@ -414,16 +373,6 @@ async def api_photos(
                                 item["original_url"] = f"/static/{original_key}"
                         except Exception:
                             pass
-                    if include_invisible:
-                        try:
-                            if compute_invisible:
-                                item["has_invisible"] = _has_invisible_mark(uid, rel)
-                            else:
-                                ckey = _cache_key_for_invisible(uid, rel)
-                                rec = read_json_key(ckey)
-                                item["has_invisible"] = bool(rec.get("ok")) if isinstance(rec, dict) else False
-                        except Exception:
-                            item["has_invisible"] = False
                     if "-fromfriend-" in name:
                         try:
                             meta_key = f"{os.path.splitext(rel)[0]}.json"
@@ -443,6 +392,19 @@ async def api_photos(
             logger.exception(f"Local listing failed: {ex}")
             return JSONResponse({"error": "List failed"}, status_code=500)
 
+    # Invisible mark flags come from one index lookup for the whole page
+    if include_invisible and items:
+        try:
+            flags = resolve_invisible_flags(None, uid, [it["key"] for it in items], compute=compute_invisible)
+        except Exception:
+            flags = {}
+        for it in items:
+            it["has_invisible"] = bool(flags.get(it["key"]))
+
+    # Dimensions, dominant color and LQIP for the whole page in one lookup
+    if items:
+        attach_placeholders(items)
+
     resp = {"photos": items}
     if next_token:
         resp["next"] = next_token
@@ -513,16 +475,6 @@ async def api_photos_partners(
                             item["original_url"] = _get_url_for_key(original_key, expires_in=60 * 60)
                     except Exception:
                         pass
-                if include_invisible:
-                    try:
-                        if compute_invisible:
-                            item["has_invisible"] = _has_invisible_mark(uid, key)
-                        else:
-                            ckey = _cache_key_for_invisible(uid, key)
-                            rec = read_json_key(ckey)
-                            item["has_invisible"] = bool(rec.get("ok")) if isinstance(rec, dict) else False
-                    except Exception:
-                        item["has_invisible"] = False
                 try:
                     if "-fromfriend-" in name or "-fromfriend" in name:
                         meta_key = f"{os.path.splitext(key)[0]}.json"
@@ -582,16 +534,6 @@ async def api_photos_partners(
                                 item["original_url"] = f"/static/{original_key}"
                         except Exception:
                             pass
-                    if include_invisible:
-                        try:
-                            if compute_invisible:
-                                item["has_invisible"] = _has_invisible_mark(uid, rel)
-                            else:
-                                ckey = _cache_key_for_invisible(uid, rel)
-                                rec = read_json_key(ckey)
-                                item["has_invisible"] = bool(rec.get("ok")) if isinstance(rec, dict) else False
-                        except Exception:
-                            item["has_invisible"] = False
                     if "-fromfriend-" in name or "-fromfriend" in name:
                         try:
                             meta_key = f"{os.path.splitext(rel)[0]}.json"
@@ -611,6 +553,15 @@ async def api_photos_partners(
             logger.exception(f"Local listing failed: {ex}")
             return JSONResponse({"error": "List failed"}, status_code=500)
 
+    # Invisible mark flags come from one index lookup for the whole page
+    if include_invisible and items:
+        try:
+            flags = resolve_invisible_flags(None, uid, [it["key"] for it in items], compute=compute_invisible)
+        except Exception:
+            flags = {}
+        for it in items:
+            it["has_invisible"] = bool(flags.get(it["key"]))
+
     resp = {"photos": items}
     if next_token:
         resp["next"] = next_token
@@ -1068,7 +1019,10 @@ async def api_photos_delete(request: Request, keys: List[str] = Body(..., embed=
             except Exception as ex:
                 errors.append(f"{k}: {ex}")
 
-    # 2) Purge deleted keys from all user vault manifests so links don't reappear
+    # 2) Purge deleted keys from all user vault manifests so links don't reappear.
+    # Migrated vaults keep membership in Postgres; their JSON is only a stub.
+    if deleted:
+        vault_manifest.purge_keys(uid, deleted)
     try:
         to_purge = set(deleted)
         if to_purge:
@@ -27,7 +27,6 @@ import io
 import hashlib
 import zipfile
 import os
-import concurrent.futures as cf
 
 import numpy as np
 from PIL import Image
@@ -35,6 +34,7 @@ import cv2
 
 from core.auth import resolve_workspace_uid, has_role_access
 from core.config import logger
+from core import cpu_pool
 from utils.storage import read_json_key, write_json_key, upload_bytes
 from utils.metadata import auto_embed_metadata_for_user
 from sqlalchemy.orm import Session
@@ -321,6 +321,15 @@ def _process_blob(
     raise
 
 
+# Unpack helpers for the shared CPU pool (one picklable argument per task)
+def _process_blob_unpack(args) -> Tuple[str, bytes]:
+  return _process_blob(*args)
+
+
+def _process_blob_reinhard_unpack(args) -> Tuple[str, bytes]:
+  return _process_blob_reinhard(*args)
+
+
 @router.post('/hist-match')
 async def hist_match(
   request: Request,
@@ -407,44 +416,23 @@ async def hist_match(
     if not inputs:
       return JSONResponse({"error": "No images processed"}, status_code=400)
 
-    # Determine worker count
-    cpu = os.cpu_count() or 2
-    # Keep it modest to reduce overhead and memory spikes
-    max_workers = min(max(1, cpu), max(1, len(inputs)))
-
     results: List[Tuple[int, str, bytes]] = []
 
-    if len(inputs) == 1 or max_workers == 1:
-      # Sequential path for single image or constrained env
-      for i, name, blob in inputs:
-        try:
-          out_name, out_bytes = _process_blob(
-            blob, name, ref_cdf, fmt or 'jpg', float(quality or 0.92),
-            1600 if (preview and len(inputs) == 1) else None,
-          )
-          results.append((i, out_name, out_bytes))
-        except Exception:
-          continue
-    else:
-      # Parallel path using process pool
-      with cf.ProcessPoolExecutor(max_workers=max_workers) as ex:
-        futures = []
-        for i, name, blob in inputs:
-          futures.append((
-            i, name,
-            ex.submit(
-              _process_blob,
-              blob, name, ref_cdf, fmt or 'jpg', float(quality or 0.92),
-              1600 if (preview and len(inputs) == 1) else None,
-            )
-          ))
-        for i, name, fut in futures:
-          try:
-            out_name, out_bytes = fut.result()
-            results.append((i, out_name, out_bytes))
-          except Exception as exn:
-            logger.exception(f"Processing failed for {name}: {exn}")
-            continue
+    # Shared CPU pool, fair-shared per workspace (single previews are interactive)
+    preview_side = 1600 if (preview and len(inputs) == 1) else None
+    try:
+      outs = await cpu_pool.amap(_process_blob_unpack, [
+        (blob, name, ref_cdf, fmt or 'jpg', float(quality or 0.92), preview_side)
+        for _, name, blob in inputs
+      ], return_exceptions=True, tenant=eff_uid, priority=cpu_pool.priority_for(len(inputs)))
+    except cpu_pool.CpuPoolBusy:
+      return cpu_pool.busy_response()
+    for (i, name, _), out in zip(inputs, outs):
+      if isinstance(out, Exception):
+        logger.error(f"Processing failed for {name}: {out}")
+        continue
+      out_name, out_bytes = out
+      results.append((i, out_name, out_bytes))
 
     if not results:
       return JSONResponse({"error": "No images processed"}, status_code=400)
@@ -553,38 +541,22 @@ async def reinhard_match(
     if not inputs:
       return JSONResponse({"error": "No images processed"}, status_code=400)
 
-    # Workers
-    cpu = os.cpu_count() or 2
-    max_workers = min(max(1, cpu), max(1, len(inputs)))
-
     results: List[Tuple[int, str, bytes]] = []
 
-    if len(inputs) == 1 or max_workers == 1:
-      for i, name, blob in inputs:
-        out_name, out_bytes = _process_blob_reinhard(
-          blob, name, ref_mean, ref_std, fmt or 'jpg', float(quality or 0.92),
-          1600 if (preview and len(inputs) == 1) else None,
-        )
-        results.append((i, out_name, out_bytes))
-    else:
-      with cf.ProcessPoolExecutor(max_workers=max_workers) as ex:
-        futures = []
-        for i, name, blob in inputs:
-          futures.append((
-            i, name,
-            ex.submit(
-              _process_blob_reinhard,
-              blob, name, ref_mean, ref_std, fmt or 'jpg', float(quality or 0.92),
-              1600 if (preview and len(inputs) == 1) else None,
-            )
-          ))
-        for i, name, fut in futures:
-          try:
-            out_name, out_bytes = fut.result()
-            results.append((i, out_name, out_bytes))
-          except Exception as exn:
-            logger.exception(f"Processing failed for {name}: {exn}")
-            continue
+    preview_side = 1600 if (preview and len(inputs) == 1) else None
+    try:
+      outs = await cpu_pool.amap(_process_blob_reinhard_unpack, [
+        (blob, name, ref_mean, ref_std, fmt or 'jpg', float(quality or 0.92), preview_side)
+        for _, name, blob in inputs
+      ], return_exceptions=True, tenant=eff_uid, priority=cpu_pool.priority_for(len(inputs)))
+    except cpu_pool.CpuPoolBusy:
+      return cpu_pool.busy_response()
+    for (i, name, _), out in zip(inputs, outs):
+      if isinstance(out, Exception):
+        logger.error(f"Processing failed for {name}: {out}")
+        continue
+      out_name, out_bytes = out
+      results.append((i, out_name, out_bytes))
 
     if not results:
       return JSONResponse({"error": "No images processed"}, status_code=400)
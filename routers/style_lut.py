@@ -20,6 +20,8 @@ except Exception:
 from core.auth import resolve_workspace_uid, has_role_access
 from core.config import logger
 from utils.storage import read_json_key, write_json_key
+from utils.lut_cache import compiled_lut, content_digest, settings_digest
+from core import cpu_pool
 
 router = APIRouter(prefix="/api/style", tags=["style"])  # includes /lut-apply and /lut/generate
 
@@ -319,9 +321,82 @@ def _apply_settings_to_rgb(r: float, g: float, b: float, s: Dict[str, Any]) -> T
     return r, g, b
 
 
+def _eval_curve_np(points: List[Dict[str, float]], x: np.ndarray) -> np.ndarray:
+    """Vectorized _eval_curve: piecewise-linear, clamped to the end points."""
+    if not points:
+        return x
+    pts = sorted(points, key=lambda p: p['x'])
+    xs = np.asarray([float(p['x']) for p in pts], dtype=np.float64)
+    ys = np.asarray([float(p['y']) for p in pts], dtype=np.float64)
+    return np.interp(x, xs, ys)
+
+
+def _apply_settings_to_rgb_np(r: np.ndarray, g: np.ndarray, b: np.ndarray, s: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Array version of _apply_settings_to_rgb (same steps, evaluated for all voxels at once)."""
+    k_exp = 2.0 ** float(s.get('exposure', 0.0))
+    r = r * k_exp; g = g * k_exp; b = b * k_exp
+
+    c = float(s.get('contrast', 1.0))
+    r = 0.5 + (r - 0.5) * c
+    g = 0.5 + (g - 0.5) * c
+    b = 0.5 + (b - 0.5) * c
+
+    gamma = max(0.01, float(s.get('gamma', 1.0)))
+    inv_g = 1.0 / gamma
+    if inv_g != 1.0:
+        # Fractional powers of negatives (possible after contrast) are undefined; clamp at black
+        r = np.power(np.maximum(r, 0.0), inv_g)
+        g = np.power(np.maximum(g, 0.0), inv_g)
+        b = np.power(np.maximum(b, 0.0), inv_g)
+
+    hue = float(s.get('hue', 0.0))
+    sat = float(s.get('saturation', 1.0))
+    vib = float(s.get('vibrance', 1.0))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mx = np.maximum(np.maximum(r, g), b)
+        mn = np.minimum(np.minimum(r, g), b)
+        l = (mx + mn) / 2.0
+        d = mx - mn
+        flat = d == 0
+        s_hsl = np.where(flat, 0.0, d / (1 - np.abs(2 * l - 1) + 1e-6))
+        h = np.where(
+            mx == r, np.mod((g - b) / (d + 1e-6), 6),
+            np.where(mx == g, (b - r) / (d + 1e-6) + 2, (r - g) / (d + 1e-6) + 4),
+        ) * 60
+        h = np.where(flat, 0.0, h)
+
+        h = np.mod(h + hue, 360)
+
+        s_boost = sat * (1 + (vib - 1) * (1 - s_hsl))
+        s_hsl = np.clip(s_hsl * s_boost, 0.0, 1.0)
+
+        c_h = (1 - np.abs(2 * l - 1)) * s_hsl
+        x_h = c_h * (1 - np.abs(np.mod(h / 60, 2) - 1))
+        m = l - c_h / 2
+
+    zero = np.zeros_like(c_h)
+    sectors = [(h >= 0) & (h < 60), (h >= 60) & (h < 120), (h >= 120) & (h < 180),
+               (h >= 180) & (h < 240), (h >= 240) & (h < 300)]
+    rp = np.select(sectors, [c_h, x_h, zero, zero, x_h], default=c_h)
+    gp = np.select(sectors, [x_h, c_h, c_h, x_h, zero], default=zero)
+    bp = np.select(sectors, [zero, zero, x_h, c_h, c_h], default=x_h)
+
+    r = rp + m; g = gp + m; b = bp + m
+
+    curves = s.get('curves', {})
+    r = _eval_curve_np(curves.get('r', [{'x': 0, 'y': 0}, {'x': 1, 'y': 1}]), r)
+    g = _eval_curve_np(curves.get('g', [{'x': 0, 'y': 0}, {'x': 1, 'y': 1}]), g)
+    b = _eval_curve_np(curves.get('b', [{'x': 0, 'y': 0}, {'x': 1, 'y': 1}]), b)
+    mcurve = curves.get('master', [{'x': 0, 'y': 0}, {'x': 1, 'y': 1}])
+    r = _eval_curve_np(mcurve, r); g = _eval_curve_np(mcurve, g); b = _eval_curve_np(mcurve, b)
+
+    return np.clip(r, 0.0, 1.0), np.clip(g, 0.0, 1.0), np.clip(b, 0.0, 1.0)
+
+
 def _build_lut_volume_from_settings(settings: Dict[str, Any], size: int = 33) -> Tuple[np.ndarray, Tuple[float, float, float], Tuple[float, float, float]]:
     """
-    Build a 3D LUT volume [S,S,S,3] in [0,1] by evaluating _apply_settings_to_rgb
+    Build a 3D LUT volume [S,S,S,3] in [0,1] by evaluating the settings transform
     across a uniform grid in [0,1]^3. Returns (volume, domain_min, domain_max).
     """
     try:
@@ -330,20 +405,34 @@ def _build_lut_volume_from_settings(settings: Dict[str, Any], size: int = 33) ->
     except Exception:
         size = size
 
-    vol = np.zeros((size, size, size, 3), dtype=np.float32)
-    grid = np.linspace(0.0, 1.0, size, dtype=np.float32)
-
-    for ri, r in enumerate(grid):
-        for gi, g in enumerate(grid):
-            for bi, b in enumerate(grid):
-                rr, gg, bb = _apply_settings_to_rgb(float(r), float(g), float(b), settings)
-                vol[ri, gi, bi, 0] = rr
-                vol[ri, gi, bi, 1] = gg
-                vol[ri, gi, bi, 2] = bb
+    grid = np.linspace(0.0, 1.0, size, dtype=np.float32).astype(np.float64)
+    r, g, b = np.meshgrid(grid, grid, grid, indexing='ij')
+    rr, gg, bb = _apply_settings_to_rgb_np(r, g, b, settings)
+    vol = np.stack([rr, gg, bb], axis=-1).astype(np.float32)
 
     return vol, (0.0, 0.0, 0.0), (1.0, 1.0, 1.0)
 
 
+def _torch_device() -> torch.device:
+    return torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+
+def compiled_cube_lut(lut_bytes: bytes, device: torch.device) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """(lut_volume, domain_min, domain_max) for a .cube file, cached by content hash."""
+    def build():
+        vol_np, dmin, dmax = parse_cube_lut(lut_bytes.decode('utf-8', errors='ignore'))
+        return to_torch_lut(vol_np, dmin, dmax, device)
+    return compiled_lut(("style-cube", content_digest(lut_bytes), str(device)), build)
+
+
+def compiled_settings_lut(settings: Dict[str, Any], device: torch.device) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """(lut_volume, domain_min, domain_max) for UI settings, cached by canonical settings."""
+    def build():
+        vol_np, dmin, dmax = _build_lut_volume_from_settings(settings, int(settings.get('resolution') or 33))
+        return to_torch_lut(vol_np, dmin, dmax, device)
+    return compiled_lut(("style-settings", settings_digest(settings), str(device)), build)
+
+
 # -----------------------------
 # API routes
 # -----------------------------
@@ -386,18 +475,20 @@ async def lut_apply(
     if not valid:
         return {"error": err}
     
-    lut_text = (await lut.read()).decode('utf-8', errors='ignore')
+    lut_bytes = await lut.read()
     if not raw:
         return {"error": "empty file"}
-    if not lut_text:
+    if not lut_bytes.decode('utf-8', errors='ignore'):
         return {"error": "empty lut"}
 
     try:
         img = Image.open(io.BytesIO(raw)).convert('RGB')
-        vol_np, dmin, dmax = parse_cube_lut(lut_text)
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        vol_th, dm_th, dM_th = to_torch_lut(vol_np, dmin, dmax, device)
-        out = apply_lut_image(img, vol_th, dm_th, dM_th, float(intensity), device)
+        device = _torch_device()
+        vol_th, dm_th, dM_th = compiled_cube_lut(lut_bytes, device)
+        out = await cpu_pool.run_in_thread(
+            apply_lut_image, img, vol_th, dm_th, dM_th, float(intensity), device,
+            tenant=eff_uid, priority=cpu_pool.INTERACTIVE,
+        )
 
         buf = io.BytesIO()
         f = (fmt or 'png').lower()
@@ -411,6 +502,8 @@ async def lut_apply(
         buf.seek(0)
         headers = {"Access-Control-Expose-Headers": "Content-Disposition"}
         return StreamingResponse(buf, media_type=ct, headers=headers)
+    except cpu_pool.CpuPoolBusy:
+        return cpu_pool.busy_response()
     except Exception as ex:
         logger.exception(f"LUT apply failed: {ex}")
         return {"error": str(ex)}
@@ -506,16 +599,20 @@ async def lut_preview(
         img = Image.open(io.BytesIO(img_bytes)).convert('RGB')
 
         # Build LUT from settings and apply
-        vol_np, dmin, dmax = _build_lut_volume_from_settings(payload, int(payload.get('resolution') or 33))
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        vol_th, dm_th, dM_th = to_torch_lut(vol_np, dmin, dmax, device)
-        out = apply_lut_image(img, vol_th, dm_th, dM_th, strength=1.0, device=device)
+        device = _torch_device()
+        vol_th, dm_th, dM_th = compiled_settings_lut(payload, device)
+        out = await cpu_pool.run_in_thread(
+            apply_lut_image, img, vol_th, dm_th, dM_th, strength=1.0, device=device,
+            tenant=rate_key, priority=cpu_pool.INTERACTIVE,
+        )
 
         buf = io.BytesIO()
         out.save(buf, format='PNG')
         buf.seek(0)
         headers = {"Access-Control-Expose-Headers": "Content-Disposition"}
         return StreamingResponse(buf, media_type='image/png', headers=headers)
+    except cpu_pool.CpuPoolBusy:
+        return cpu_pool.busy_response()
     except Exception as ex:
         logger.exception(f"LUT preview failed: {ex}")
         return {"error": str(ex)}
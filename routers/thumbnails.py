@@ -3,21 +3,28 @@ Thumbnail generation API endpoints.
 Handles on-demand thumbnail generation for existing images.
 """
 from fastapi import APIRouter, Request, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from typing import Optional
+import asyncio
+import hashlib
 import os
 from datetime import datetime
 
+from core import cpu_pool
 from core.config import s3, R2_BUCKET, s3_backup, BACKUP_BUCKET, logger
 from core.auth import resolve_workspace_uid, has_role_access
-from utils.thumbnails import generate_thumbnail, get_thumbnail_key, THUMB_SMALL
-from utils.storage import read_bytes_key, backup_read_bytes_key, get_presigned_url
+from utils.thumbnails import (
+    covers_width, generate_rendition, generate_thumbnail_with_placeholder, get_thumbnail_key, RENDITION_FORMATS,
+    THUMB_SMALL,
+)
+from utils.storage import read_bytes_key, read_bytes_if_exists, backup_read_bytes_key, get_presigned_url
+from utils import thumbnail_backfill
+from utils.single_flight import FailureCache, SingleFlight
+from utils import rendition_cache
+from utils.image_placeholders import record_placeholder
 
 router = APIRouter(prefix="/api", tags=["thumbnails"])
 
-# Image extensions to process
-IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.tif', '.tiff'}
-
 # Prefixes to scan for images
 SCAN_PREFIXES = [
     "watermarked/",
@@ -29,82 +36,24 @@ SCAN_PREFIXES = [
     "partners/",  # Team chat / collaboration photos
 ]
 
+# On-demand generation: one check/generate per key at a time; failures are remembered briefly
+THUMBNAIL_FAILURE_TTL_SECONDS = 60
+_thumbnail_flight = SingleFlight()
+_thumbnail_failures = FailureCache(THUMBNAIL_FAILURE_TTL_SECONDS)
 
-def _is_image_key(key: str) -> bool:
-    """Check if a key is an image file."""
-    lower = key.lower()
-    return any(lower.endswith(ext) for ext in IMAGE_EXTENSIONS)
-
-
-def _generate_thumbnail_for_key(key: str, bucket, read_func) -> bool:
-    """Generate and upload a thumbnail for a single key."""
-    try:
-        thumb_key = get_thumbnail_key(key, 'small')
-        
-        # Check if thumbnail already exists
-        try:
-            bucket.Object(thumb_key).load()
-            return False  # Already exists
-        except Exception:
-            pass  # Doesn't exist, continue
-        
-        # Read original image
-        data = read_func(key)
-        if not data:
-            return False
-        
-        # Generate thumbnail
-        thumb_data = generate_thumbnail(data, THUMB_SMALL, quality=98)
-        if not thumb_data:
-            return False
-        
-        # Upload thumbnail
-        bucket.put_object(
-            Key=thumb_key,
-            Body=thumb_data,
-            ContentType='image/jpeg',
-            ACL='private',
-            CacheControl='public, max-age=31536000'
-        )
-        logger.info(f"Generated thumbnail: {thumb_key}")
-        return True
-    except Exception as ex:
-        logger.warning(f"Thumbnail generation failed for {key}: {ex}")
-        return False
+# /img renditions: only these parameters are accepted, so the cache stays bounded per source
+RENDITION_WIDTHS = (320, 480, 640, 800, 1024, 1200, 1600, 2048)
+RENDITION_QUALITIES = (60, 75, 85, 95)
+RENDITION_DEFAULT_QUALITY = 85
+_rendition_flight = SingleFlight()
+_rendition_failures = FailureCache(THUMBNAIL_FAILURE_TTL_SECONDS)
 
 
 def _generate_thumbnails_for_user(uid: str, bucket, read_func, limit: int = 50) -> dict:
     """Generate missing thumbnails for a user's images."""
-    generated = 0
-    skipped = 0
-    errors = 0
-    
-    for prefix_suffix in SCAN_PREFIXES:
-        if generated >= limit:
-            break
-            
-        prefix = f"users/{uid}/{prefix_suffix}"
-        try:
-            for obj in bucket.objects.filter(Prefix=prefix):
-                if generated >= limit:
-                    break
-                    
-                key = obj.key
-                
-                # Skip non-images and existing thumbnails
-                if not _is_image_key(key) or '_thumb_' in key:
-                    continue
-                
-                # Try to generate thumbnail
-                if _generate_thumbnail_for_key(key, bucket, read_func):
-                    generated += 1
-                else:
-                    skipped += 1
-        except Exception as ex:
-            logger.warning(f"Error scanning {prefix}: {ex}")
-            errors += 1
-    
-    return {"generated": generated, "skipped": skipped, "errors": errors}
+    prefixes = [f"users/{uid}/{prefix_suffix}" for prefix_suffix in SCAN_PREFIXES]
+    result = thumbnail_backfill.backfill(bucket, prefixes, read_func, limit=limit, tenant=uid)
+    return {"generated": result["generated"], "skipped": result["failed"], "errors": result["errors"]}
 
 
 def _background_generate_thumbnails(uid: str, source: str = "r2"):
@@ -182,29 +131,15 @@ async def get_thumbnail_status(request: Request, source: str = "r2"):
     
     try:
         for prefix_suffix in SCAN_PREFIXES:
-            prefix = f"users/{uid}/{prefix_suffix}"
-            for obj in bucket.objects.filter(Prefix=prefix):
-                key = obj.key
-                
-                if not _is_image_key(key) or '_thumb_' in key:
-                    continue
-                
-                total_images += 1
-                
-                # Check if thumbnail exists
-                thumb_key = get_thumbnail_key(key, 'small')
-                try:
-                    bucket.Object(thumb_key).load()
-                    with_thumbnails += 1
-                except Exception:
-                    without_thumbnails += 1
-                
-                # Limit scan to avoid timeout
-                if total_images >= 500:
-                    break
-            
+            # Limit scan to avoid timeout
             if total_images >= 500:
                 break
+            counts = thumbnail_backfill.scan_prefix(
+                bucket, f"users/{uid}/{prefix_suffix}", max_sources=500 - total_images
+            )
+            total_images += counts["total"]
+            with_thumbnails += counts["with_thumbnails"]
+            without_thumbnails += counts["without_thumbnails"]
     except Exception as ex:
         logger.warning(f"Error checking thumbnail status: {ex}")
     
@@ -216,11 +151,70 @@ async def get_thumbnail_status(request: Request, source: str = "r2"):
     }
 
 
+class _ThumbnailUnavailable(Exception):
+    # cacheable=False for transient storage errors, which must not be replayed as failures
+    def __init__(self, status_code: int, error: str, cacheable: bool = True):
+        super().__init__(error)
+        self.status_code = status_code
+        self.error = error
+        self.cacheable = cacheable
+
+
+async def _ensure_thumbnail(bucket, key: str, thumb_key: str, tenant: str) -> bool:
+    """Make sure `thumb_key` exists. Returns True if it was generated now."""
+    # Check if thumbnail exists
+    try:
+        await asyncio.to_thread(bucket.Object(thumb_key).load)
+        return False
+    except Exception:
+        pass  # Doesn't exist
+    
+    try:
+        data = await asyncio.to_thread(read_bytes_if_exists, key)
+    except Exception as ex:
+        logger.error(f"On-demand thumbnail read failed for {key}: {ex}")
+        raise _ThumbnailUnavailable(500, "Thumbnail generation failed", cacheable=False)
+    if data is None:
+        raise _ThumbnailUnavailable(404, "Image not found")
+    
+    try:
+        thumb_data, placeholder = await cpu_pool.run(
+            generate_thumbnail_with_placeholder, data, THUMB_SMALL, 98, tenant=tenant
+        )
+    except cpu_pool.CpuPoolBusy:
+        raise
+    except Exception as ex:
+        logger.error(f"On-demand thumbnail generation failed for {key}: {ex}")
+        thumb_data = None
+    del data
+    if not thumb_data:
+        raise _ThumbnailUnavailable(500, "Could not generate thumbnail")
+    
+    # Upload thumbnail
+    try:
+        await asyncio.to_thread(
+            bucket.put_object,
+            Key=thumb_key,
+            Body=thumb_data,
+            ContentType='image/jpeg',
+            ACL='private',
+            CacheControl='public, max-age=31536000'
+        )
+    except Exception as ex:
+        logger.error(f"On-demand thumbnail upload failed for {key}: {ex}")
+        raise _ThumbnailUnavailable(500, "Thumbnail generation failed", cacheable=False)
+    await asyncio.to_thread(record_placeholder, key, placeholder)
+    return True
+
+
 @router.get("/thumbnail/{key:path}")
 async def get_or_generate_thumbnail(request: Request, key: str, background_tasks: BackgroundTasks):
     """
     Get thumbnail URL for an image, generating it on-demand if it doesn't exist.
     This is the key endpoint for automatic thumbnail generation.
+    
+    Concurrent requests for the same key share one check/generate, and keys that
+    could not be thumbnailed are answered from a short-lived failure cache.
     """
     eff_uid, req_uid = resolve_workspace_uid(request)
     if not eff_uid or not req_uid:
@@ -235,39 +229,113 @@ async def get_or_generate_thumbnail(request: Request, key: str, background_tasks
     if not s3 or not R2_BUCKET:
         return JSONResponse({"error": "Storage unavailable"}, status_code=503)
     
+    failed = _thumbnail_failures.get(key)
+    if failed is not None:
+        return JSONResponse({"error": failed.error}, status_code=failed.status_code)
+    
     bucket = s3.Bucket(R2_BUCKET)
     thumb_key = get_thumbnail_key(key, 'small')
-    
-    # Check if thumbnail exists
-    try:
-        bucket.Object(thumb_key).load()
-        # Thumbnail exists, return URL
-        url = get_presigned_url(thumb_key, expires_in=3600)
-        return {"thumb_url": url, "generated": False}
-    except Exception:
-        pass  # Doesn't exist
-    
-    # Generate thumbnail on-demand
     try:
-        data = read_bytes_key(key)
-        if not data:
-            return JSONResponse({"error": "Image not found"}, status_code=404)
-        
-        thumb_data = generate_thumbnail(data, THUMB_SMALL, quality=98)
-        if not thumb_data:
-            return JSONResponse({"error": "Could not generate thumbnail"}, status_code=500)
-        
-        # Upload thumbnail
-        bucket.put_object(
-            Key=thumb_key,
-            Body=thumb_data,
-            ContentType='image/jpeg',
-            ACL='private',
-            CacheControl='public, max-age=31536000'
+        generated = await _thumbnail_flight.do(
+            key, lambda: _ensure_thumbnail(bucket, key, thumb_key, uid)
         )
-        
-        url = get_presigned_url(thumb_key, expires_in=3600)
-        return {"thumb_url": url, "generated": True}
-    except Exception as ex:
-        logger.error(f"On-demand thumbnail generation failed for {key}: {ex}")
-        return JSONResponse({"error": "Thumbnail generation failed"}, status_code=500)
+    except cpu_pool.CpuPoolBusy:
+        return cpu_pool.busy_response()
+    except _ThumbnailUnavailable as ex:
+        if ex.cacheable:
+            _thumbnail_failures.put(key, ex)
+        return JSONResponse({"error": ex.error}, status_code=ex.status_code)
+    
+    url = get_presigned_url(thumb_key, expires_in=3600)
+    return {"thumb_url": url, "generated": generated}
+
+
+async def _build_rendition(key: str, width: int, fmt: str, quality: int, name: str, tenant: str) -> bytes:
+    # Up to the small thumbnail's size, render from the thumbnail when it exists. It is
+    # capped on its longest side, so a portrait's thumbnail can be narrower than `width`.
+    data = None
+    if width <= THUMB_SMALL:
+        data = await asyncio.to_thread(read_bytes_key, get_thumbnail_key(key, 'small'))
+        if data and not covers_width(data, width):
+            data = None
+    if not data:
+        # Read errors other than a missing key propagate and are not cached
+        data = await asyncio.to_thread(read_bytes_if_exists, key)
+    if data is None:
+        raise _ThumbnailUnavailable(404, "Image not found")
+    out = await cpu_pool.run(generate_rendition, data, width, fmt, quality, tenant=tenant)
+    del data
+    if not out:
+        raise _ThumbnailUnavailable(500, "Could not render image")
+    await asyncio.to_thread(rendition_cache.put, name, out)
+    return out
+
+
+@router.get("/img/{key:path}")
+async def get_image_rendition(
+    request: Request,
+    key: str,
+    w: int = THUMB_SMALL,
+    fmt: str = "auto",
+    q: int = RENDITION_DEFAULT_QUALITY,
+):
+    """
+    Serve an image scaled down to width `w`, encoded as `fmt` at quality `q`.
+    
+    Args:
+        w: Width in pixels, one of RENDITION_WIDTHS (never upscaled)
+        fmt: "jpeg", "webp", or "auto" (WebP when the client accepts it)
+        q: Encoder quality, one of RENDITION_QUALITIES
+    
+    Renditions are kept in a size-bounded on-disk LRU; concurrent requests for the
+    same rendition share one render.
+    """
+    eff_uid, req_uid = resolve_workspace_uid(request)
+    if not eff_uid or not req_uid:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    
+    uid = eff_uid
+    
+    # Validate key belongs to user
+    if not key.startswith(f"users/{uid}/"):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    
+    if fmt == "auto":
+        fmt = "webp" if "image/webp" in (request.headers.get("accept") or "") else "jpeg"
+    if w not in RENDITION_WIDTHS or q not in RENDITION_QUALITIES or fmt not in RENDITION_FORMATS:
+        return JSONResponse({
+            "error": "Unsupported rendition",
+            "widths": list(RENDITION_WIDTHS),
+            "formats": ["auto", *RENDITION_FORMATS],
+            "qualities": list(RENDITION_QUALITIES),
+        }, status_code=400)
+    
+    name = rendition_cache.rendition_id(key, w, fmt, q)
+    data = await asyncio.to_thread(rendition_cache.get, name)
+    if data is None:
+        failed = _rendition_failures.get(name)
+        if failed is not None:
+            return JSONResponse({"error": failed.error}, status_code=failed.status_code)
+        try:
+            data = await _rendition_flight.do(
+                name, lambda: _build_rendition(key, w, fmt, q, name, uid)
+            )
+        except cpu_pool.CpuPoolBusy:
+            return cpu_pool.busy_response()
+        except _ThumbnailUnavailable as ex:
+            if ex.cacheable:
+                _rendition_failures.put(name, ex)
+            return JSONResponse({"error": ex.error}, status_code=ex.status_code)
+        except Exception as ex:
+            logger.error(f"Rendition failed for {key} ({w}px {fmt} q{q}): {ex}")
+            return JSONResponse({"error": "Could not render image"}, status_code=500)
+    
+    # The ETag follows the bytes, so a re-render of a changed source is not answered with 304
+    headers = {
+        "Cache-Control": "private, max-age=86400",
+        "ETag": f'"{hashlib.sha256(data).hexdigest()[:32]}"',
+        "Vary": "Accept",
+    }
+    if headers["ETag"] in [t.strip() for t in (request.headers.get("if-none-match") or "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=RENDITION_FORMATS[fmt], headers=headers)
@@ -1,5 +1,7 @@
 from typing import List, Optional
+import asyncio
 import io
+import json
 import os
 from datetime import datetime as _dt
 
@@ -9,6 +11,7 @@ from PIL import Image
 import zipfile
 
 from core.config import MAX_FILES, logger
+from core import cpu_pool
 
 # SECURITY: File magic bytes for image validation
 IMAGE_MAGIC_BYTES = {
@@ -41,6 +44,7 @@ from utils.watermark import (
     add_signature_watermark,
     add_text_watermark_tiled,
     add_signature_watermark_tiled,
+    is_large_image,
 )
 from utils.storage import upload_bytes, read_json_key
 from utils.invisible_mark import embed_signature as embed_invisible, build_payload_for_uid
@@ -52,13 +56,14 @@ from utils.rate_limit import (
     MAX_FILE_SIZE_BYTES,
     MAX_FILES_PER_BATCH,
 )
+from sqlalchemy import text
 from sqlalchemy.orm import Session
-from core.database import get_db
+from core.database import get_db, SessionLocal
 from models.gallery import GalleryAsset
 
 # Import vault helpers to update vaults after upload
 from routers.vaults import (
-    _read_vault, _write_vault, _vault_key,
+    _write_vault, _vault_key, _vault_add_keys,
     _read_vault_meta, _write_vault_meta, _unlock_vault,
     _vault_salt, _hash_password_bcrypt
 )
@@ -82,6 +87,200 @@ except ImportError:
 router = APIRouter(prefix="", tags=["upload"])  # no prefix to serve /upload
 
 
+def _watermark_options(
+    watermark: Optional[str],
+    wm_pos: str,
+    wm_color: Optional[str],
+    wm_opacity: Optional[float],
+    wm_layout: Optional[str],
+    tile_angle: Optional[float],
+    tile_spacing: Optional[float],
+    tile_scale: Optional[float],
+    wm_bg_box: Optional[str],
+    wm_text_rel: Optional[float],
+    wm_logo_rel: Optional[float],
+    wm_logo_size: Optional[int],
+    artist: Optional[str],
+    invisible: Optional[str],
+) -> dict:
+    """Form fields as a plain dict that can be shipped to pool workers."""
+    return {
+        "watermark": watermark or '',
+        "wm_pos": wm_pos,
+        "wm_color": wm_color or None,
+        "wm_opacity": wm_opacity,
+        "layout": (wm_layout or 'single').strip().lower(),
+        "tile_angle": float(tile_angle or 0.0),
+        "tile_spacing": float(tile_spacing or 0.3),
+        "tile_scale": float(tile_scale or 1.0),
+        "bg_box": (wm_bg_box or '').strip() == '1',
+        "text_rel": float(wm_text_rel) if wm_text_rel is not None else None,
+        "logo_rel": float(wm_logo_rel) if wm_logo_rel is not None else None,
+        "logo_size": int(wm_logo_size) if wm_logo_size is not None else None,
+        "artist": artist or '',
+        "invisible": (invisible or '').strip() == '1',
+    }
+
+
+def _read_metadata_settings(uid: str) -> dict:
+    return read_json_key(f"users/{uid}/settings/metadata.json") or {}
+
+
+def _render_watermarked(
+    raw: bytes,
+    logo_bytes: Optional[bytes],
+    opts: dict,
+    uid: str,
+    meta_data: dict,
+) -> tuple[bytes, bool]:
+    """Decode, watermark, optionally mark invisibly and JPEG-encode one image.
+
+    The decoded image is watermarked in place, so very large files hold roughly one
+    RGB copy plus a strip (see utils.watermark STRIP_MIN_PIXELS).
+
+    Runs on a cpu_pool worker, so everything it needs is passed in (the user's
+    metadata settings are read once per request). Returns (jpeg_bytes, has_invisible).
+    """
+    img = Image.open(io.BytesIO(raw))
+    img.load()
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    # Build watermark (supports single or tiled layout)
+    layout = opts.get("layout") or 'single'
+    if logo_bytes:
+        sig = Image.open(io.BytesIO(logo_bytes)).convert("RGBA")
+        if layout == 'tiled':
+            out = add_signature_watermark_tiled(
+                img,
+                sig,
+                angle_deg=opts["tile_angle"],
+                spacing_rel=opts["tile_spacing"],
+                scale_mul=opts["tile_scale"],
+                inplace=True,
+            )
+        else:
+            out = add_signature_watermark(
+                img,
+                sig,
+                opts["wm_pos"],
+                bg_box=opts["bg_box"],
+                target_w_override=opts["logo_size"],
+                rel_w=opts["logo_rel"],
+                inplace=True,
+            )
+    else:
+        if layout == 'tiled':
+            out = add_text_watermark_tiled(
+                img,
+                opts["watermark"],
+                color=opts["wm_color"],
+                opacity=opts["wm_opacity"],
+                angle_deg=opts["tile_angle"],
+                spacing_rel=opts["tile_spacing"],
+                scale_mul=opts["tile_scale"],
+                inplace=True,
+            )
+        else:
+            out = add_text_watermark(
+                img,
+                opts["watermark"],
+                opts["wm_pos"],
+                color=opts["wm_color"],
+                opacity=opts["wm_opacity"],
+                bg_box=opts["bg_box"],
+                base_size_rel=opts["text_rel"],
+                inplace=True,
+            )
+
+    # Optionally embed invisible signature linked to the account uid
+    has_invisible = False
+    try:
+        if opts.get("invisible"):
+            payload = build_payload_for_uid(uid)
+            out = embed_invisible(out, payload)
+            has_invisible = True
+    except Exception as _ex:
+        logger.warning(f"invisible embed failed: {_ex}")
+
+    # Encode watermarked JPEG with optional EXIF metadata. Progressive/optimized output
+    # makes libjpeg buffer the whole image again, so very large images stay baseline.
+    jpeg_opts = dict(quality=95, subsampling=0, progressive=True, optimize=True)
+    if is_large_image(out.size):
+        jpeg_opts.update(progressive=False, optimize=False)
+    buf = io.BytesIO()
+    try:
+        from utils.metadata import MetadataSettings, embed_metadata
+        if bool(meta_data.get("auto_embed", False)) and meta_data.get("photographer_name"):
+            # Use full metadata settings
+            settings = MetadataSettings.from_dict(meta_data)
+            _, jpeg_bytes = embed_metadata(out, settings)
+            buf.write(jpeg_bytes)
+        else:
+            # Fallback to basic artist field
+            import piexif  # type: ignore
+            exif_dict = {"0th": {}, "Exif": {}, "GPS": {}, "1st": {}}
+            if (opts.get("artist") or '').strip():
+                exif_dict["0th"][piexif.ImageIFD.Artist] = opts["artist"]  # type: ignore[attr-defined]
+            exif_bytes = piexif.dump(exif_dict)
+            out.save(buf, format="JPEG", exif=exif_bytes, **jpeg_opts)
+    except Exception:
+        buf = io.BytesIO()
+        out.save(buf, format="JPEG", **jpeg_opts)
+    return buf.getvalue(), has_invisible
+
+
+def _record_uploaded_assets(db: Session, uid: str, items: list[dict]) -> None:
+    """Upsert the GalleryAsset rows for one upload batch in a single statement."""
+    # ON CONFLICT cannot touch the same row twice in one statement; last write wins
+    rows = list({it["key"]: it for it in items}.values())
+    if not rows:
+        return
+    values = []
+    params: dict = {"uid": uid}
+    for n, it in enumerate(rows):
+        values.append(f"(:uid, NULL, :k{n}, :s{n}, :h{n})")
+        params[f"k{n}"] = it["key"]
+        params[f"s{n}"] = int(it["size_bytes"])
+        params[f"h{n}"] = bool(it["has_invisible"])
+    try:
+        db.execute(text(
+            "INSERT INTO gallery_assets (user_uid, vault, key, size_bytes, has_invisible) VALUES "
+            + ", ".join(values)
+            + " ON CONFLICT (key) DO UPDATE SET user_uid=EXCLUDED.user_uid, vault=NULL,"
+              " size_bytes=EXCLUDED.size_bytes, has_invisible=EXCLUDED.has_invisible, updated_at=NOW()"
+        ), params)
+        db.commit()
+    except Exception as ex:
+        logger.warning(f"[upload] gallery asset insert failed for {uid} ({len(rows)} rows): {ex}")
+        try:
+            db.rollback()
+        except Exception:
+            pass
+
+
+def _read_upload(fh) -> bytes:
+    fh.seek(0)
+    return fh.read()
+
+
+def _detach_upload(uf: UploadFile):
+    """Take over the file behind `uf`; closing the request form then leaves it open."""
+    fh = uf.file
+    uf.file = io.BytesIO()
+    return fh
+
+
+# Streamed upload batches outlive their request; keep a reference until they finish
+_background_batches: set = set()
+
+
+def _start_background(coro) -> None:
+    task = asyncio.create_task(coro)
+    _background_batches.add(task)
+    task.add_done_callback(_background_batches.discard)
+
+
 @router.post("/upload")
 async def upload(
     request: Request,
@@ -109,6 +308,8 @@ async def upload(
     vault_name: Optional[str] = Form(None),
     vault_protect: Optional[str] = Form(None),  # '1' to protect new vault
     vault_password: Optional[str] = Form(None),
+    # '1' (or Accept: application/x-ndjson) to stream per-file results as NDJSON
+    stream: Optional[str] = Form(None),
     db: Session = Depends(get_db)
 ):
     eff_uid, req_uid = resolve_workspace_uid(request)
@@ -143,172 +344,146 @@ async def upload(
     if not use_logo and not (watermark or '').strip():
         return JSONResponse({"error": "watermark text required or provide logo"}, status_code=400)
 
-    uploaded = []
+    opts = _watermark_options(
+        watermark, wm_pos, wm_color, wm_opacity, wm_layout, tile_angle, tile_spacing,
+        tile_scale, wm_bg_box, wm_text_rel, wm_logo_rel, wm_logo_size, artist, invisible,
+    )
+    meta_data = await asyncio.to_thread(_read_metadata_settings, uid)
+    suffix = 'logo' if use_logo else 'txt'
 
-    idx = 0
-    total_size = 0
-    for uf in files:
-        try:
-            raw = await uf.read()
-            if not raw:
-                continue
-            
-            # SECURITY: Validate individual file size
-            file_valid, file_err = validate_file_size(len(raw), uf.filename or '')
-            if not file_valid:
-                logger.warning(f"[upload] File too large: {uf.filename} ({len(raw)} bytes)")
-                continue
-            
-            total_size += len(raw)
-            
-            # SECURITY: Validate file content matches image magic bytes
-            if not _validate_image_content(raw):
-                logger.warning(f"[upload] Invalid image content for {getattr(uf, 'filename', 'unknown')}")
-                continue
-            
-            img = Image.open(io.BytesIO(raw)).convert("RGB")
+    # Files are rendered on the shared CPU pool and uploaded concurrently; the window
+    # bounds how many are read into memory at once.
+    priority = cpu_pool.priority_for(len(files))
+    window = asyncio.Semaphore(cpu_pool.CALL_WINDOW)
 
-            # Determine original file extension and content-type
-            orig_ext = (os.path.splitext(uf.filename or '')[1] or '.jpg').lower()
-            # Normalize some odd cases
-            if orig_ext not in ('.jpg', '.jpeg', '.png', '.webp', '.heic', '.tif', '.tiff'):
-                orig_ext = orig_ext if len(orig_ext) <= 6 and orig_ext.startswith('.') else '.bin'
-            ct_map = {
-                '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.webp': 'image/webp',
-                '.heic': 'image/heic', '.tif': 'image/tiff', '.tiff': 'image/tiff', '.bin': 'application/octet-stream'
-            }
-            orig_ct = ct_map.get(orig_ext, 'application/octet-stream')
-
-            # Build watermark (supports single or tiled layout)
-            layout = (wm_layout or 'single').strip().lower()
-            if use_logo:
-                sig = Image.open(io.BytesIO(logo_bytes)).convert("RGBA")  # type: ignore[arg-type]
-                if layout == 'tiled':
-                    out = add_signature_watermark_tiled(
-                        img,
-                        sig,
-                        angle_deg=float(tile_angle or 0.0),
-                        spacing_rel=float(tile_spacing or 0.3),
-                        scale_mul=float(tile_scale or 1.0),
-                    )
-                else:
-                    out = add_signature_watermark(
-                        img,
-                        sig,
-                        wm_pos,
-                        bg_box=((wm_bg_box or '').strip() == '1'),
-                        target_w_override=int(wm_logo_size) if wm_logo_size is not None else None,
-                        rel_w=float(wm_logo_rel) if wm_logo_rel is not None else None
-                    )
-            else:
-                if layout == 'tiled':
-                    out = add_text_watermark_tiled(
-                        img,
-                        watermark or '',
-                        color=wm_color or None,
-                        opacity=wm_opacity if wm_opacity is not None else None,
-                        angle_deg=float(tile_angle or 0.0),
-                        spacing_rel=float(tile_spacing or 0.3),
-                        scale_mul=float(tile_scale or 1.0),
-                    )
-                else:
-                    out = add_text_watermark(
-                        img,
-                        watermark or '',
-                        wm_pos,
-                        color=wm_color or None,
-                        opacity=wm_opacity if wm_opacity is not None else None,
-                        bg_box=((wm_bg_box or '').strip() == '1'),
-                        base_size_rel=float(wm_text_rel) if wm_text_rel is not None else None
-                    )
-
-            # Optionally embed invisible signature linked to the account uid
-            try:
-                if (invisible or '').strip() == '1':
-                    payload = build_payload_for_uid(uid)
-                    out = embed_invisible(out, payload)
-            except Exception as _ex:
-                logger.warning(f"invisible embed failed: {_ex}")
-
-            # Encode watermarked JPEG with optional EXIF metadata
-            buf = io.BytesIO()
+    async def _process_one(i: int, name: str, fh) -> dict:
+        async with window:
             try:
-                # Check if user has auto-embed metadata enabled
-                from utils.metadata import MetadataSettings, embed_metadata
-                meta_data = read_json_key(f"users/{uid}/settings/metadata.json") or {}
-                auto_embed = bool(meta_data.get("auto_embed", False))
-                
-                if auto_embed and meta_data.get("photographer_name"):
-                    # Use full metadata settings
-                    settings = MetadataSettings.from_dict(meta_data)
-                    _, jpeg_bytes = embed_metadata(out, settings)
-                    buf.write(jpeg_bytes)
-                else:
-                    # Fallback to basic artist field
-                    import piexif  # type: ignore
-                    exif_dict = {"0th": {}, "Exif": {}, "GPS": {}, "1st": {}}
-                    if (artist or '').strip():
-                        exif_dict["0th"][piexif.ImageIFD.Artist] = artist  # type: ignore[attr-defined]
-                    exif_bytes = piexif.dump(exif_dict)
-                    out.save(buf, format="JPEG", quality=95, subsampling=0, progressive=True, optimize=True, exif=exif_bytes)
-            except Exception:
-                out.save(buf, format="JPEG", quality=95, subsampling=0, progressive=True, optimize=True)
-            buf.seek(0)
-
-            date_prefix = _dt.utcnow().strftime('%Y/%m/%d')
-            base = os.path.splitext(os.path.basename(uf.filename or 'image'))[0] or 'image'
-            stamp = int(_dt.utcnow().timestamp())
-            suffix = 'logo' if use_logo else 'txt'
-
-            # Upload only the WATERMARKED jpeg (no original to save storage and bandwidth)
-            key = f"users/{uid}/watermarked/{date_prefix}/{base}-{stamp}-{suffix}.jpg"
-            data = buf.getvalue()
-            url = upload_bytes(key, data, content_type='image/jpeg')
-
-            uploaded.append({"key": key, "url": url})
-            idx += 1
+                raw = await asyncio.to_thread(_read_upload, fh)
+                if not raw:
+                    return {"index": i, "name": name, "error": "empty file"}
+
+                # SECURITY: Validate individual file size
+                file_valid, file_err = validate_file_size(len(raw), name)
+                if not file_valid:
+                    logger.warning(f"[upload] File too large: {name} ({len(raw)} bytes)")
+                    return {"index": i, "name": name, "error": file_err or "file too large"}
+
+                # SECURITY: Validate file content matches image magic bytes
+                if not _validate_image_content(raw):
+                    logger.warning(f"[upload] Invalid image content for {name or 'unknown'}")
+                    return {"index": i, "name": name, "error": "invalid image content"}
+
+                data, has_invisible = await cpu_pool.run(
+                    _render_watermarked, raw, logo_bytes if use_logo else None, opts, uid, meta_data,
+                    tenant=uid, priority=priority,
+                )
+                del raw
+
+                date_prefix = _dt.utcnow().strftime('%Y/%m/%d')
+                base = os.path.splitext(os.path.basename(name or 'image'))[0] or 'image'
+                stamp = int(_dt.utcnow().timestamp())
+
+                # Upload only the WATERMARKED jpeg (no original to save storage and bandwidth)
+                key = f"users/{uid}/watermarked/{date_prefix}/{base}-{stamp}-{suffix}.jpg"
+                url = await asyncio.to_thread(upload_bytes, key, data, 'image/jpeg')
+                return {
+                    "index": i, "name": name, "key": key, "url": url,
+                    "size_bytes": len(data), "has_invisible": has_invisible,
+                }
+            except cpu_pool.CpuPoolBusy:
+                return {"index": i, "name": name, "error": "busy", "busy": True}
+            except Exception as ex:
+                logger.warning(f"upload failed for {name}: {ex}")
+                return {"index": i, "name": name, "error": "processing failed"}
+
+    def _finish(session: Session, results: list[dict]) -> Optional[str]:
+        """Record the batch in one insert and apply the vault destination."""
+        done = sorted((r for r in results if r.get("key")), key=lambda r: r["index"])
+        _record_uploaded_assets(session, uid, done)
+
+        final_vault = None
+        try:
+            vm = (vault_mode or 'all').strip().lower()
+            if vm == 'existing':
+                name = (vault_name or '').strip()
+                if name and done:
+                    _vault_add_keys(uid, name, [u['key'] for u in done])
+                    final_vault = _vault_key(uid, name)[1]
+            elif vm == 'new':
+                name = (vault_name or '').strip()
+                if name:
+                    keys_now = [u['key'] for u in done]
+                    _write_vault(uid, name, keys_now)
+                    prot = (vault_protect or '').strip() == '1'
+                    if prot and (vault_password or '').strip():
+                        _write_vault_meta(uid, name, {"protected": True, "password_hash": _hash_password_bcrypt(vault_password or '')})
+                    final_vault = _vault_key(uid, name)[1]
+        except Exception as ex:
+            logger.warning(f"vault update failed: {ex}")
+        return final_vault
+
+    def _public(r: dict) -> dict:
+        return {"key": r["key"], "url": r["url"]}
+
+    want_stream = (stream or '').strip() == '1' or 'application/x-ndjson' in (request.headers.get('accept') or '').lower()
+    if not want_stream:
+        results = await asyncio.gather(*(_process_one(i, uf.filename or '', uf.file) for i, uf in enumerate(files)))
+        if results and all(r.get("busy") for r in results):
+            return cpu_pool.busy_response()
+        final_vault = await asyncio.to_thread(_finish, db, results)
+        uploaded = [_public(r) for r in sorted(results, key=lambda r: r["index"]) if r.get("key")]
+        return {"ok": True, "uploaded": uploaded, "vault": final_vault}
+
+    # NDJSON: one line per file as it finishes, then a final summary line. The batch
+    # runs as its own task and the response only relays its results, so a client that
+    # disconnects mid-stream does not cancel uploads or skip recording them. The form
+    # closes its files when the handler returns, so the batch takes them over first.
+    handles = [(i, uf.filename or '', _detach_upload(uf)) for i, uf in enumerate(files)]
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def _run_one(i: int, name: str, fh, results: list[dict]) -> None:
+        try:
+            r = await _process_one(i, name, fh)
+        finally:
+            fh.close()
+        results.append(r)
+        events.put_nowait(r)
+
+    async def _run_batch() -> None:
+        results: list[dict] = []
+        final_vault = None
+        try:
+            await asyncio.gather(*(_run_one(i, name, fh, results) for i, name, fh in handles))
+            # The request-scoped session is closed by the time the batch finishes
+            session = SessionLocal()
             try:
-                existing = db.query(GalleryAsset).filter(GalleryAsset.key == key).first()
-                if existing:
-                    existing.user_uid = uid
-                    existing.vault = None
-                    existing.size_bytes = len(data)
-                else:
-                    db.add(GalleryAsset(user_uid=uid, vault=None, key=key, size_bytes=len(data)))
-                db.commit()
-            except Exception:
-                try:
-                    db.rollback()
-                except Exception:
-                    pass
+                final_vault = await asyncio.to_thread(_finish, session, results)
+            finally:
+                session.close()
         except Exception as ex:
-            logger.warning(f"upload failed for {getattr(uf,'filename', '')}: {ex}")
-            continue
-
-    # Vault handling
-    final_vault = None
-    try:
-        vm = (vault_mode or 'all').strip().lower()
-        if vm == 'existing':
-            name = (vault_name or '').strip()
-            if name and uploaded:
-                exist = _read_vault(uid, name)
-                merged = sorted(set(exist) | {u['key'] for u in uploaded})
-                _write_vault(uid, name, merged)
-                final_vault = _vault_key(uid, name)[1]
-        elif vm == 'new':
-            name = (vault_name or '').strip()
-            if name:
-                keys_now = [u['key'] for u in uploaded]
-                _write_vault(uid, name, keys_now)
-                prot = (vault_protect or '').strip() == '1'
-                if prot and (vault_password or '').strip():
-                    _write_vault_meta(uid, name, {"protected": True, "password_hash": _hash_password_bcrypt(vault_password or '')})
-                final_vault = _vault_key(uid, name)[1]
-    except Exception as ex:
-        logger.warning(f"vault update failed: {ex}")
+            logger.warning(f"[upload] streamed batch failed for {uid}: {ex}")
+        finally:
+            events.put_nowait({"done": True, "vault": final_vault})
+
+    _start_background(_run_batch())
+
+    async def _events():
+        results: list[dict] = []
+        while True:
+            r = await events.get()
+            if r.get("done"):
+                break
+            results.append(r)
+            if r.get("key"):
+                line = {"type": "file", "index": r["index"], "name": r["name"], **_public(r)}
+            else:
+                line = {"type": "error", "index": r["index"], "name": r["name"], "error": r["error"]}
+            yield json.dumps(line) + "\n"
+        uploaded = [_public(r) for r in sorted(results, key=lambda r: r["index"]) if r.get("key")]
+        yield json.dumps({"type": "done", "ok": True, "uploaded": uploaded, "vault": r["vault"]}) + "\n"
 
-    return {"ok": True, "uploaded": uploaded, "vault": final_vault}
+    return StreamingResponse(_events(), media_type='application/x-ndjson', headers={'Cache-Control': 'no-store'})
 
 
 @router.post("/api/uploads")
@@ -502,7 +677,15 @@ async def process_watermark_zip(
     if not use_logo and not (watermark or '').strip():
         return JSONResponse({"error": "watermark text required or provide logo"}, status_code=400)
 
-    # Helper to process a single file and return (filename, jpeg_bytes)
+    opts = _watermark_options(
+        watermark, wm_pos, wm_color, wm_opacity, wm_layout, tile_angle, tile_spacing,
+        tile_scale, wm_bg_box, wm_text_rel, wm_logo_rel, wm_logo_size, artist, invisible,
+    )
+    meta_data = await asyncio.to_thread(_read_metadata_settings, uid)
+
+    # Fair-share scheduling class for the CPU work (keyed by workspace uid)
+    priority = cpu_pool.priority_for(len(files))
+
     async def _process_one(uf: UploadFile) -> Optional[tuple[str, bytes]]:
         try:
             raw = await uf.read()
@@ -514,93 +697,24 @@ async def process_watermark_zip(
             if not file_valid:
                 return None
             
-            img = Image.open(io.BytesIO(raw)).convert("RGB")
-
-            layout = (wm_layout or 'single').strip().lower()
-            if use_logo:
-                sig = Image.open(io.BytesIO(logo_bytes)).convert("RGBA")  # type: ignore[arg-type]
-                if layout == 'tiled':
-                    out = add_signature_watermark_tiled(
-                        img,
-                        sig,
-                        angle_deg=float(tile_angle or 0.0),
-                        spacing_rel=float(tile_spacing or 0.3),
-                        scale_mul=float(tile_scale or 1.0),
-                    )
-                else:
-                    out = add_signature_watermark(
-                        img,
-                        sig,
-                        wm_pos,
-                        bg_box=((wm_bg_box or '').strip() == '1'),
-                        target_w_override=int(wm_logo_size) if wm_logo_size is not None else None,
-                        rel_w=float(wm_logo_rel) if wm_logo_rel is not None else None
-                    )
-            else:
-                if layout == 'tiled':
-                    out = add_text_watermark_tiled(
-                        img,
-                        watermark or '',
-                        color=wm_color or None,
-                        opacity=wm_opacity if wm_opacity is not None else None,
-                        angle_deg=float(tile_angle or 0.0),
-                        spacing_rel=float(tile_spacing or 0.3),
-                        scale_mul=float(tile_scale or 1.0),
-                    )
-                else:
-                    out = add_text_watermark(
-                        img,
-                        watermark or '',
-                        wm_pos,
-                        color=wm_color or None,
-                        opacity=wm_opacity if wm_opacity is not None else None,
-                        bg_box=((wm_bg_box or '').strip() == '1'),
-                        base_size_rel=float(wm_text_rel) if wm_text_rel is not None else None
-                    )
-
-            # Optional invisible signature
-            try:
-                if (invisible or '').strip() == '1':
-                    payload = build_payload_for_uid(uid)
-                    out = embed_invisible(out, payload)
-            except Exception as _ex:
-                logger.warning(f"invisible embed (zip) failed: {_ex}")
-
-            # Encode JPEG with optional EXIF metadata
-            buf = io.BytesIO()
-            try:
-                # Check if user has auto-embed metadata enabled
-                from utils.metadata import MetadataSettings, embed_metadata
-                meta_data = read_json_key(f"users/{uid}/settings/metadata.json") or {}
-                auto_embed = bool(meta_data.get("auto_embed", False))
-                
-                if auto_embed and meta_data.get("photographer_name"):
-                    # Use full metadata settings
-                    settings = MetadataSettings.from_dict(meta_data)
-                    _, jpeg_bytes = embed_metadata(out, settings)
-                    buf.write(jpeg_bytes)
-                else:
-                    # Fallback to basic artist field
-                    import piexif  # type: ignore
-                    exif_dict = {"0th": {}, "Exif": {}, "GPS": {}, "1st": {}}
-                    if (artist or '').strip():
-                        exif_dict["0th"][piexif.ImageIFD.Artist] = artist  # type: ignore[attr-defined]
-                    exif_bytes = piexif.dump(exif_dict)
-                    out.save(buf, format="JPEG", quality=95, subsampling=0, progressive=True, optimize=True, exif=exif_bytes)
-            except Exception:
-                out.save(buf, format="JPEG", quality=95, subsampling=0, progressive=True, optimize=True)
-            buf.seek(0)
-
+            data, _ = await cpu_pool.run(
+                _render_watermarked, raw, logo_bytes if use_logo else None, opts, uid, meta_data,
+                tenant=uid, priority=priority,
+            )
             base = os.path.splitext(os.path.basename(uf.filename or 'image'))[0] or 'image'
-            name = f"{base}-watermarked.jpg"
-            return (name, buf.getvalue())
+            return (f"{base}-watermarked.jpg", data)
+        except cpu_pool.CpuPoolBusy:
+            raise
         except Exception as ex:
             logger.warning(f"zip process failed for {getattr(uf,'filename','')}: {ex}")
             return None
 
     # If only one file, return the single JPEG directly
     if len(files) == 1:
-        one = await _process_one(files[0])
+        try:
+            one = await _process_one(files[0])
+        except cpu_pool.CpuPoolBusy:
+            return cpu_pool.busy_response()
         if not one:
             return JSONResponse({"error": "processing failed"}, status_code=400)
         name, data = one
@@ -623,7 +737,10 @@ async def process_watermark_zip(
         return cand
     
     for uf in files:
-        res = await _process_one(uf)
+        try:
+            res = await _process_one(uf)
+        except cpu_pool.CpuPoolBusy:
+            return cpu_pool.busy_response()
         if not res:
             continue
         name, data = res
@@ -18,7 +18,8 @@ from pydantic import BaseModel
 import bcrypt
 
 from core.config import s3, s3_presign_client, R2_BUCKET, R2_PUBLIC_BASE_URL, R2_CUSTOM_DOMAIN, logger, DODO_API_BASE, DODO_CHECKOUT_PATH, DODO_PRODUCTS_PATH, DODO_API_KEY, DODO_WEBHOOK_SECRET, LICENSE_SECRET, LICENSE_PRIVATE_KEY, LICENSE_PUBLIC_KEY, LICENSE_ISSUER
-from utils.storage import read_json_key, write_json_key, read_bytes_key, upload_bytes, get_presigned_url
+from utils.storage import read_json_key, write_json_key, upload_bytes, get_presigned_url, get_presigned_urls, list_key_sizes
+from utils.zip_stream import iter_zip
 from utils.metadata import auto_embed_metadata_for_user
 from core.auth import get_uid_from_request, get_user_email_from_uid
 from utils.emailing import render_email, send_email_smtp
@@ -29,6 +30,7 @@ from core.database import get_db
 from models.gallery import GalleryAsset
 from models.user import User
 from models.vault_trash import VaultTrash, VaultVersion
+from utils import vault_manifest
 
 router = APIRouter(prefix="/api", tags=["vaults"])
 
@@ -232,59 +234,51 @@ def _write_retouch_queue(uid: str, items: list[dict]):
     _write_json_key(_retouch_queue_key(uid), items or [])
 
 
-from utils.invisible_mark import detect_signature, PAYLOAD_LEN
-from io import BytesIO
-from PIL import Image
-
-
-def _cache_key_for_invisible(uid: str, photo_key: str) -> str:
-    h = hashlib.sha1(photo_key.encode('utf-8')).hexdigest()
-    return f"users/{uid}/_cache/invisible/{h}.json"
+from utils.invisible_index import resolve_invisible_flags
+from utils.image_placeholders import attach_placeholders
 
 
 def _has_invisible_mark(uid: str, key: str) -> bool:
     try:
-        ckey = _cache_key_for_invisible(uid, key)
-        rec = _read_json_key(ckey)
-        if isinstance(rec, dict) and "ok" in rec:
-            return bool(rec.get("ok"))
-        data = read_bytes_key(key)
-        if not data:
-            _write_json_key(ckey, {"ok": False, "ts": datetime.utcnow().isoformat()})
-            return False
-        try:
-            img = Image.open(BytesIO(data))
-        except Exception:
-            _write_json_key(ckey, {"ok": False, "ts": datetime.utcnow().isoformat()})
-            return False
-        try:
-            payload = detect_signature(img, payload_len_bytes=PAYLOAD_LEN)
-            ok = bool(payload)
-        except Exception:
-            ok = False
-        _write_json_key(ckey, {"ok": ok, "ts": datetime.utcnow().isoformat()})
-        return ok
+        return bool(resolve_invisible_flags(None, uid, [key]).get(key))
     except Exception:
         return False
 
 
-def _make_item_from_key(uid: str, key: str) -> dict:
+def _make_item_from_key(uid: str, key: str, has_invisible: Optional[bool] = None, url: Optional[str] = None) -> dict:
     if not key.startswith(f"users/{uid}/"):
         raise ValueError("forbidden key")
     name = os.path.basename(key)
-    if s3 and R2_BUCKET:
+    if url is not None:
+        pass
+    elif s3 and R2_BUCKET:
         url = _get_url_for_key(key, expires_in=60 * 60)
     else:
         url = f"/static/{key}"
     item = {"key": key, "url": url, "name": name}
-    # Attach invisible watermark flag (cached)
+    # Attach invisible watermark flag (indexed; pass has_invisible from a page lookup when available)
     try:
-        item["has_invisible"] = _has_invisible_mark(uid, key)
+        item["has_invisible"] = bool(has_invisible) if has_invisible is not None else _has_invisible_mark(uid, key)
     except Exception:
         item["has_invisible"] = False
     return item
 
 
+def _presign_page(keys: list[str], expires_in: int = 60 * 60) -> dict[str, str]:
+    """Presigned URLs for a page of keys in one batch; local mode serves /static paths."""
+    if s3 and R2_BUCKET:
+        return get_presigned_urls(keys, expires_in=expires_in)
+    return {k: f"/static/{k}" for k in keys}
+
+
+def _invisible_flags_for_page(uid: str, keys: list[str], db: Optional[Session] = None) -> dict[str, bool]:
+    """One index lookup for a page of keys instead of one storage round trip per photo."""
+    try:
+        return resolve_invisible_flags(db, uid, [k for k in keys if k.startswith(f"users/{uid}/")])
+    except Exception:
+        return {}
+
+
 def _vault_key(uid: str, vault: str) -> Tuple[str, str]:
     safe = "".join(c for c in vault if c.isalnum() or c in ("-", "_", " ")).strip().replace(" ", "_")
     if not safe:
@@ -333,7 +327,7 @@ def _read_json_key(key: str) -> Optional[dict]:
         return None
 
 
-def _read_vault(uid: str, vault: str) -> list[str]:
+def _read_vault_json(uid: str, vault: str) -> Optional[dict]:
     key, _ = _vault_key(uid, vault)
     try:
         if s3 and R2_BUCKET:
@@ -343,24 +337,23 @@ def _read_vault(uid: str, vault: str) -> list[str]:
             except ClientError as ce:
                 # Treat missing object as empty vault without warning noise
                 if ce.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
-                    return []
+                    return None
                 raise
-            data = json.loads(body)
+            return json.loads(body)
         else:
             path = os.path.join(STATIC_DIR, key)
             if not os.path.isfile(path):
-                return []
+                return None
             with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        return list(data.get("keys", []))
+                return json.load(f)
     except Exception as ex:
         logger.warning(f"_read_vault failed for {key}: {ex}")
-        return []
+        return None
 
 
-def _write_vault(uid: str, vault: str, keys: list[str]):
+def _write_vault_json(uid: str, vault: str, doc: dict):
     key, _ = _vault_key(uid, vault)
-    payload = json.dumps({"keys": sorted(set(keys))})
+    payload = json.dumps(doc)
     if s3 and R2_BUCKET:
         bucket = s3.Bucket(R2_BUCKET)
         bucket.put_object(Key=key, Body=payload.encode("utf-8"), ContentType="application/json", ACL="private")
@@ -371,10 +364,109 @@ def _write_vault(uid: str, vault: str, keys: list[str]):
             f.write(payload)
 
 
+# Once a vault lives in Postgres its JSON object is reduced to this stub. The object
+# still marks the vault's existence for prefix listings, and a stale key list can
+# never be served if the database is briefly unreachable.
+_VAULT_JSON_STUB = {"keys": [], "manifest": "db"}
+
+
+def _read_vault(uid: str, vault: str) -> list[str]:
+    _, safe = _vault_key(uid, vault)
+    keys = vault_manifest.read_keys(uid, safe)
+    if keys is not None:
+        return keys
+    data = _read_vault_json(uid, vault)
+    if not data or data.get("manifest") == "db":
+        return []
+    keys = list(data.get("keys", []))
+    # Lazy migration: seed vault_photos from the JSON list (and persisted order) on first read
+    order = None
+    try:
+        order = (_read_vault_meta(uid, vault) or {}).get("order")
+    except Exception:
+        pass
+    if vault_manifest.import_keys(uid, safe, keys, order=order if isinstance(order, list) else None):
+        try:
+            _write_vault_json(uid, vault, _VAULT_JSON_STUB)
+        except Exception as ex:
+            logger.warning(f"vault JSON stub write failed for {safe}: {ex}")
+    return keys
+
+
+def _write_vault(uid: str, vault: str, keys: list[str]):
+    _, safe = _vault_key(uid, vault)
+    migrated = vault_manifest.is_migrated(uid, safe)
+    if vault_manifest.replace_keys(uid, safe, keys):
+        if not migrated:
+            _write_vault_json(uid, vault, _VAULT_JSON_STUB)
+        return
+    _write_vault_json(uid, vault, {"keys": sorted(set(keys))})
+
+
+def _vault_add_keys(uid: str, vault: str, keys: list[str]) -> int:
+    """Add keys without rewriting the whole manifest. Returns the new photo count."""
+    _, safe = _vault_key(uid, vault)
+    count = vault_manifest.add_keys(uid, safe, keys)
+    if count is not None:
+        return count
+    merged = sorted(set(_read_vault(uid, vault)) | set(keys))
+    _write_vault(uid, vault, merged)
+    return len(merged)
+
+
+def _vault_remove_keys(uid: str, vault: str, keys: list[str]) -> int:
+    """Remove keys without rewriting the whole manifest. Returns the new photo count."""
+    _, safe = _vault_key(uid, vault)
+    count = vault_manifest.remove_keys(uid, safe, keys)
+    if count is not None:
+        return count
+    drop = set(keys)
+    remain = [k for k in _read_vault(uid, vault) if k not in drop]
+    _write_vault(uid, vault, remain)
+    return len(remain)
+
+
+def _vault_page(uid: str, vault: str, limit: Optional[int] = None, cursor: Optional[str] = None) -> dict:
+    """Page of vault keys in display order: {"keys", "next_cursor", "total"}.
+
+    Migrated vaults page with a keyset cursor in SQL; the JSON fallback keeps the old
+    offset cursor and in-memory ordering by the `order` meta.
+    """
+    _, safe = _vault_key(uid, vault)
+    is_friends = (safe == FRIENDS_VAULT_SAFE)
+    page = vault_manifest.page_keys(uid, safe, limit=limit, cursor=cursor, exclude_friend_uploads=is_friends)
+    if page is not None:
+        return page
+
+    keys = _read_vault(uid, vault)
+    if is_friends:
+        keys = [k for k in keys if ('/partners/' not in k and '-fromfriend' not in os.path.basename(k))]
+    total = len(keys)
+    try:
+        vmeta = _read_vault_meta(uid, vault)
+        order = vmeta.get("order") if isinstance(vmeta, dict) else None
+        if isinstance(order, list) and order:
+            order_index = {k: i for i, k in enumerate(order)}
+            keys = sorted(keys, key=lambda k: order_index.get(k, 10**9))
+    except Exception:
+        pass
+    start = int(cursor) if (cursor and str(cursor).isdigit()) else 0
+    next_cursor = None
+    if limit:
+        if start + limit < total:
+            next_cursor = str(start + limit)
+        keys = keys[start:start + limit]
+    elif start:
+        keys = keys[start:]
+    keys = [k for k in keys if not k.lower().endswith('.json')]
+    return {"keys": keys, "next_cursor": next_cursor, "total": total}
+
+
 def _delete_vault(uid: str, vault: str) -> bool:
     try:
         key, safe = _vault_key(uid, vault)
         meta_key = _vault_meta_key(uid, vault)
+        vault_manifest.delete_manifest(uid, safe)
         if s3 and R2_BUCKET:
             bucket = s3.Bucket(R2_BUCKET)
             to_delete = [{"Key": key}, {"Key": meta_key}]
@@ -409,6 +501,13 @@ def _read_vault_meta(uid: str, vault: str) -> dict:
 def _write_vault_meta(uid: str, vault: str, meta: dict):
     key = _vault_meta_key(uid, vault)
     _write_json_key(key, meta or {})
+    _sync_vault_summary_meta(uid, vault, meta or {})
+
+
+def _sync_vault_summary_meta(uid: str, vault: str, meta: dict):
+    """Mirror the fields shown in the vault list into public.vault_summaries."""
+    dn = meta.get("display_name") if isinstance(meta, dict) else None
+    vault_manifest.update_summary_meta(uid, vault, bool(meta.get("protected")), str(dn) if dn else None)
 
 
 def _vault_salt(uid: str, vault: str) -> str:
@@ -474,89 +573,116 @@ def _lock_vault(uid: str, vault: str):
         s.remove(vault)
 
 
-@router.get("/vaults")
-async def vaults_list(request: Request, db: Session = Depends(get_db)):
-    uid = get_uid_from_request(request)
-    if not uid:
-        return JSONResponse({"error": "Unauthorized"}, status_code=401)
-    # List vaults by scanning directory/objects
+def _list_vault_names(uid: str) -> list[str]:
+    """Names of the top-level vault JSON objects; skips _meta/, _approvals/, etc."""
     prefix = f"users/{uid}/vaults/"
-    results: list[dict] = []
+    names: set[str] = set()
     try:
         if s3 and R2_BUCKET:
-            bucket = s3.Bucket(R2_BUCKET)
-            names: list[str] = []
-            for obj in bucket.objects.filter(Prefix=prefix):
-                key = obj.key
-                if not key.endswith(".json"):
-                    continue
-                # Only consider top-level vault JSON files; skip subdirectories like _meta/, _approvals/, etc.
-                tail = key[len(prefix):]
-                if "/" in tail:
-                    continue
-                base = os.path.basename(key)[:-5]
-                names.append(base)
-            for n in sorted(set(names)):
-                keys_list = _read_vault(uid, n)
-                if n == FRIENDS_VAULT_SAFE:
-                    try:
-                        filtered = [k for k in keys_list if ('/partners/' not in k and '-fromfriend' not in os.path.basename(k))]
-                    except Exception:
-                        filtered = [k for k in keys_list if '/partners/' not in k]
-                    count = len(filtered)
-                else:
-                    count = len(keys_list)
-                results.append({"name": n, "count": count})
+            paginator = s3.meta.client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=R2_BUCKET, Prefix=prefix, Delimiter='/'):
+                for obj in page.get('Contents', []):
+                    key = obj.get('Key', '')
+                    if key.endswith(".json"):
+                        names.add(os.path.basename(key)[:-5])
         else:
             dir_path = os.path.join(STATIC_DIR, prefix)
             if os.path.isdir(dir_path):
                 for f in os.listdir(dir_path):
                     if f.endswith(".json") and f != "_meta.json":
-                        name = f[:-5]
-                        keys_list = _read_vault(uid, name)
-                        if name == FRIENDS_VAULT_SAFE:
-                            try:
-                                filtered = [k for k in keys_list if ('/partners/' not in k and '-fromfriend' not in os.path.basename(k))]
-                            except Exception:
-                                filtered = [k for k in keys_list if '/partners/' not in k]
-                            count = len(filtered)
-                        else:
-                            count = len(keys_list)
-                        results.append({"name": name, "count": count})
+                        names.add(f[:-5])
     except Exception as ex:
         logger.warning(f"_list_vaults failed: {ex}")
-    # Mark protection state and attach display name + persistent status from DB
-    for v in results:
-        name = v.get("name")
-        if not isinstance(name, str):
-            continue
-        meta = _read_vault_meta(uid, name)
-        v["protected"] = bool(meta.get("protected"))
-        v["unlocked"] = _is_vault_unlocked(uid, name)
+    return sorted(names)
+
+
+def _cover_url(key: Optional[str]) -> Optional[str]:
+    if not key:
+        return None
+    try:
+        return _get_url_for_key(key, expires_in=60 * 60) or None
+    except Exception:
+        return None
+
+
+def _vault_list_entry_legacy(db: Session, uid: str, name: str) -> dict:
+    """Per-vault reads for vaults without a summary row; syncs the summary for next time."""
+    keys_list = _read_vault(uid, name)
+    if name == FRIENDS_VAULT_SAFE:
         try:
-            dn = meta.get("display_name") if isinstance(meta, dict) else None
-            v["display_name"] = str(dn or name.replace("_", " "))
+            filtered = [k for k in keys_list if ('/partners/' not in k and '-fromfriend' not in os.path.basename(k))]
         except Exception:
-            v["display_name"] = name
-        
-        # Get persistent status from PostgreSQL database
-        try:
-            db_meta = _pg_read_vault_meta(db, uid, name)
-            if db_meta:
-                v["status"] = db_meta.get("status", "awaiting_proofing")
-                v["proofing_completed_at"] = db_meta.get("proofing_completed_at")
-                v["final_delivery_prepared_at"] = db_meta.get("final_delivery_prepared_at")
+            filtered = [k for k in keys_list if '/partners/' not in k]
+        count = len(filtered)
+    else:
+        count = len(keys_list)
+    v: dict = {"name": name, "count": count}
+    meta = _read_vault_meta(uid, name)
+    v["protected"] = bool(meta.get("protected"))
+    v["unlocked"] = (not v["protected"]) or (name in (_unlocked_vaults.get(uid) or set()))
+    try:
+        dn = meta.get("display_name") if isinstance(meta, dict) else None
+        v["display_name"] = str(dn or name.replace("_", " "))
+    except Exception:
+        v["display_name"] = name
+
+    # Get persistent status from PostgreSQL database
+    try:
+        db_meta = _pg_read_vault_meta(db, uid, name)
+        if db_meta:
+            v["status"] = db_meta.get("status", "awaiting_proofing")
+            v["proofing_completed_at"] = db_meta.get("proofing_completed_at")
+            v["final_delivery_prepared_at"] = db_meta.get("final_delivery_prepared_at")
+        else:
+            # Check file-based meta for legacy status
+            if meta.get("final_delivery", {}).get("prepared"):
+                v["status"] = "delivered"
+            elif meta.get("proofing_complete", {}).get("completed"):
+                v["status"] = "proofing_completed"
             else:
-                # Check file-based meta for legacy status
-                if meta.get("final_delivery", {}).get("prepared"):
-                    v["status"] = "delivered"
-                elif meta.get("proofing_complete", {}).get("completed"):
-                    v["status"] = "proofing_completed"
-                else:
-                    v["status"] = "awaiting_proofing"
-        except Exception as ex:
-            logger.warning(f"Failed to get vault status from DB: {ex}")
-            v["status"] = "awaiting_proofing"
+                v["status"] = "awaiting_proofing"
+    except Exception as ex:
+        logger.warning(f"Failed to get vault status from DB: {ex}")
+        v["status"] = "awaiting_proofing"
+    # _read_vault above migrated the manifest; this fills the meta half of the summary
+    _sync_vault_summary_meta(uid, name, meta)
+    return v
+
+
+@router.get("/vaults")
+async def vaults_list(request: Request, db: Session = Depends(get_db)):
+    uid = get_uid_from_request(request)
+    if not uid:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    names = _list_vault_names(uid)
+    # One query for every migrated vault; vaults without a synced summary take the slow path
+    summaries = vault_manifest.list_summaries(uid) or {}
+    unlocked = _unlocked_vaults.get(uid) or set()
+    results: list[dict] = []
+    for n in names:
+        summ = summaries.get(n)
+        if summ and summ.get("meta_synced"):
+            if n == FRIENDS_VAULT_SAFE:
+                page = vault_manifest.page_keys(uid, n, limit=1, exclude_friend_uploads=True)
+                count = page["total"] if page else summ["count"]
+            else:
+                count = summ["count"]
+            results.append({
+                "name": n,
+                "count": count,
+                "protected": summ["protected"],
+                "unlocked": (not summ["protected"]) or (n in unlocked),
+                "display_name": summ.get("display_name") or n.replace("_", " "),
+                "status": summ["status"],
+                "proofing_completed_at": summ["proofing_completed_at"],
+                "final_delivery_prepared_at": summ["final_delivery_prepared_at"],
+                "cover_key": summ["cover_key"],
+                "cover_url": _cover_url(summ["cover_key"]),
+                "size_bytes": summ["size_bytes"],
+                "updated_at": summ["updated_at"],
+            })
+        else:
+            results.append(_vault_list_entry_legacy(db, uid, n))
     return {"vaults": results}
 
 
@@ -779,16 +905,14 @@ async def vaults_add(request: Request, vault: str = Body(..., embed=True), keys:
         return JSONResponse({"error": "Unauthorized"}, status_code=401)
     # Owner always has access to their own vaults, no password needed
     try:
-        exist = _read_vault(uid, vault)
         filtered = [k for k in keys if k.startswith(f"users/{uid}/")]
-        merged = sorted(set(exist) | set(filtered))
-        _write_vault(uid, vault, merged)
+        count = _vault_add_keys(uid, vault, filtered)
         try:
             safe_vault = _vault_key(uid, vault)[1]
             _pg_upsert_vault_meta(db, uid, safe_vault, {}, visibility="private")
         except Exception:
             pass
-        return {"vault": _vault_key(uid, vault)[1], "count": len(merged)}
+        return {"vault": _vault_key(uid, vault)[1], "count": count}
     except Exception as ex:
         return JSONResponse({"error": str(ex)}, status_code=400)
 
@@ -920,10 +1044,8 @@ async def vaults_upload(
     
     # Add uploaded keys to vault
     try:
-        exist = _read_vault(uid, vault)
         new_keys = [item["key"] for item in uploaded]
-        merged = sorted(set(exist) | set(new_keys))
-        _write_vault(uid, vault, merged)
+        _vault_add_keys(uid, vault, new_keys)
     except Exception as ex:
         logger.error(f"Failed to add keys to vault: {ex}")
         return JSONResponse({"error": f"Files uploaded but failed to add to vault: {str(ex)}"}, status_code=500)
@@ -943,12 +1065,12 @@ async def vaults_remove(request: Request, vault: str = Body(..., embed=True), ke
         return JSONResponse({"error": "Unauthorized"}, status_code=401)
     # Owner always has access to their own vaults, no password needed
     try:
-        exist = _read_vault(uid, vault)
         to_remove = set(keys)
         
         # Auto-create snapshot before bulk removal (if removing 5+ photos)
         if len(to_remove) >= 5:
             try:
+                exist = _read_vault(uid, vault)
                 _, safe_vault = _vault_key(uid, vault)
                 meta = _read_vault_meta(uid, vault) or {}
                 max_ver = db.query(func.max(VaultVersion.version_number)).filter(
@@ -974,8 +1096,7 @@ async def vaults_remove(request: Request, vault: str = Body(..., embed=True), ke
                 except:
                     pass
         
-        remain = [k for k in exist if k not in to_remove]
-        _write_vault(uid, vault, remain)
+        _vault_remove_keys(uid, vault, list(to_remove))
         try:
             if to_remove:
                 db.query(GalleryAsset).filter(GalleryAsset.user_uid == uid, GalleryAsset.key.in_(list(to_remove))).delete(synchronize_session=False)
@@ -1111,6 +1232,7 @@ async def vaults_set_meta(request: Request, payload: VaultMetaUpdate, db: Sessio
             existing = set(_read_vault(uid, safe_vault))
             clean = [k for k in payload.order if isinstance(k, str) and k in existing]
             meta["order"] = clean
+            vault_manifest.set_order(uid, safe_vault, clean)
         # Share customization
         if payload.share_hide_ui is not None:
             meta["share_hide_ui"] = bool(payload.share_hide_ui)
@@ -1408,16 +1530,19 @@ def _get_thumbnail_urls_batch(uid: str, keys: list[str], expires_in: int = 3600)
     
     try:
         from utils.thumbnails import get_thumbnail_key
+        thumb_keys: dict[str, str] = {}
         for key in keys:
             try:
                 if 'cloudinary.com' in key:
                     from utils.cloudinary import get_cloudinary_thumbnail_url
                     result[key] = get_cloudinary_thumbnail_url(key)
                 else:
-                    thumb_key = get_thumbnail_key(key, 'small')
-                    result[key] = _get_url_for_key(thumb_key, expires_in=expires_in)
+                    thumb_keys[key] = get_thumbnail_key(key, 'small')
             except Exception:
                 result[key] = None
+        urls = get_presigned_urls(list(thumb_keys.values()), expires_in=expires_in)
+        for key, thumb_key in thumb_keys.items():
+            result[key] = urls.get(thumb_key) or None
     except Exception:
         return {k: None for k in keys}
     
@@ -1446,43 +1571,14 @@ async def vaults_photos(request: Request, vault: str, password: Optional[str] =
     # Owner always has access to their own vaults, no password needed
     # Password protection only applies to shared access via tokens
     try:
-        all_keys = _read_vault(uid, vault)
-        total_count = len(all_keys)
-        
-        start_index = 0
-        if cursor:
-            try:
-                start_index = max(0, int(cursor))
-            except Exception:
-                start_index = 0
         eff_limit = None
         if isinstance(limit, int) and limit > 0:
             eff_limit = max(1, min(limit, 1000))
-        
-        keys = all_keys
-        try:
-            if vault == FRIENDS_VAULT_SAFE:
-                keys = [k for k in keys if ('/partners/' not in k and '-fromfriend' not in os.path.basename(k))]
-                total_count = len(keys)
-        except Exception:
-            pass
-        
-        # Apply optional explicit order from meta if present
-        try:
-            vmeta = _read_vault_meta(uid, vault)
-            order = vmeta.get("order") if isinstance(vmeta, dict) else None
-            if isinstance(order, list) and order:
-                order_index = {k: i for i, k in enumerate(order)}
-                keys = sorted(keys, key=lambda k: order_index.get(k, 10**9))
-        except Exception:
-            pass
-        
-        # Apply pagination slice
-        if eff_limit is not None or cursor:
-            keys = keys[start_index : (start_index + (eff_limit or len(keys)))]
 
-        # Filter out JSON sidecars early
-        keys = [k for k in keys if not k.lower().endswith('.json')]
+        # Keyset page in display order (explicit `order` meta first, then by key)
+        page = _vault_page(uid, vault, limit=eff_limit, cursor=cursor)
+        keys = page["keys"]
+        total_count = page["total"]
 
         items: list[dict] = []
         
@@ -1491,15 +1587,15 @@ async def vaults_photos(request: Request, vault: str, password: Optional[str] =
         if fast:
             # Batch generate thumbnail URLs for better performance
             thumb_urls = _get_thumbnail_urls_batch(uid, keys, expires_in=60 * 60)
+            urls = _presign_page(keys)
             for key in keys:
                 try:
                     if not key.startswith(f"users/{uid}/"):
                         continue
                     name = os.path.basename(key)
-                    url = _get_url_for_key(key, expires_in=60 * 60) if s3 and R2_BUCKET else f"/static/{key}"
                     item = {
                         "key": key,
-                        "url": url,
+                        "url": urls.get(key, ""),
                         "thumb_url": thumb_urls.get(key),
                         "name": name
                     }
@@ -1508,11 +1604,13 @@ async def vaults_photos(request: Request, vault: str, password: Optional[str] =
                     pass
         else:
             # FULL MODE: Include originals lookup (for download/export features)
+            invisible_flags = _invisible_flags_for_page(uid, keys)
+            urls = _presign_page(keys)
             if s3 and R2_BUCKET:
                 # Only look up originals for the specific keys we need, not ALL originals
                 for key in keys:
                     try:
-                        item = _make_item_from_key(uid, key)
+                        item = _make_item_from_key(uid, key, invisible_flags.get(key, False), url=urls.get(key, ""))
                         name = os.path.basename(key)
                         
                         # Try to find original for this specific photo
@@ -1531,7 +1629,6 @@ async def vaults_photos(request: Request, vault: str, password: Optional[str] =
                                     try:
                                         s3.Object(R2_BUCKET, cand).load()
                                         item["original_key"] = cand
-                                        item["original_url"] = _get_url_for_key(cand, expires_in=60 * 60)
                                         break
                                     except Exception:
                                         continue
@@ -1554,20 +1651,22 @@ async def vaults_photos(request: Request, vault: str, password: Optional[str] =
                         items.append(item)
                     except Exception:
                         pass
+                original_urls = _presign_page([it["original_key"] for it in items if it.get("original_key")])
+                for it in items:
+                    if it.get("original_key"):
+                        it["original_url"] = original_urls.get(it["original_key"], "")
             else:
                 # Local storage fallback
                 for key in keys:
                     try:
-                        item = _make_item_from_key(uid, key)
+                        item = _make_item_from_key(uid, key, invisible_flags.get(key, False), url=urls.get(key))
                         items.append(item)
                     except Exception:
                         pass
         
         result = {"photos": items, "total": total_count}
-        if eff_limit is not None:
-            next_start = start_index + eff_limit
-            if next_start < total_count:
-                result["next_cursor"] = str(next_start)
+        if page.get("next_cursor"):
+            result["next_cursor"] = page["next_cursor"]
         return result
     except Exception as ex:
         return JSONResponse({"error": str(ex)}, status_code=400)
@@ -1653,9 +1752,11 @@ async def vaults_get_preview(token: str, limit: Optional[int] = None, cursor: Op
         if eff_limit is not None or cursor:
             keys = keys[start_index : (start_index + (eff_limit or len(keys)))]
         items = []
+        invisible_flags = _invisible_flags_for_page(uid, keys, db)
+        urls = _presign_page(keys)
         for k in keys:
             try:
-                item = _make_item_from_key(uid, k)
+                item = _make_item_from_key(uid, k, invisible_flags.get(k, False), url=urls.get(k))
                 items.append(item)
             except Exception:
                 pass
@@ -1838,10 +1939,8 @@ async def vaults_share(request: Request, payload: dict = Body(...), db: Session
             # Only enable if at least one photo has invisible watermark
             has_any_invisible = False
             try:
-                for k in keys[:50]:  # cap detection for performance
-                    if _has_invisible_mark(uid, k):
-                        has_any_invisible = True
-                        break
+                flags = _invisible_flags_for_page(uid, keys[:50], db)  # cap detection for performance
+                has_any_invisible = any(flags.values())
             except Exception:
                 has_any_invisible = False
             if has_any_invisible:
@@ -2809,7 +2908,7 @@ async def update_vault_display_name(request: Request, vault: str = Body(..., emb
 
 
 @router.get("/vaults/shared/photos")
-async def vaults_shared_photos(token: str, password: Optional[str] = None, db: Session = Depends(get_db)):
+async def vaults_shared_photos(token: str, password: Optional[str] = None, limit: Optional[int] = None, cursor: Optional[str] = None, db: Session = Depends(get_db)):
     if not token or len(token) < 10:
         return JSONResponse({"error": "invalid token"}, status_code=400)
 
@@ -2839,11 +2938,21 @@ async def vaults_shared_photos(token: str, password: Optional[str] = None, db: S
         if not _check_password(password or '', meta, uid, vault):
             return JSONResponse({"error": "Vault is protected. Invalid or missing password."}, status_code=403)
 
+    page = None
     try:
-        keys = _read_vault(uid, vault)
-        items = [_make_item_from_key(uid, k) for k in keys]
+        if (isinstance(limit, int) and limit > 0) or cursor:
+            # Paged client: keyset page in display order
+            eff_limit = max(1, min(limit, 1000)) if (isinstance(limit, int) and limit > 0) else None
+            page = _vault_page(uid, vault, limit=eff_limit, cursor=cursor)
+            keys = page["keys"]
+        else:
+            keys = _read_vault(uid, vault)
+        invisible_flags = _invisible_flags_for_page(uid, keys, db)
+        urls = _presign_page(keys)
+        items = [_make_item_from_key(uid, k, invisible_flags.get(k, False), url=urls.get(k)) for k in keys]
     except Exception as ex:
         return JSONResponse({"error": str(ex)}, status_code=400)
+    attach_placeholders(items)
 
     # If licensed, or password matches the removal password, attach original_url where available
     licensed = bool(rec.get("licensed"))
@@ -3125,6 +3234,11 @@ async def vaults_shared_photos(token: str, password: Optional[str] = None, db: S
     # Add final delivery data if available
     if final_delivery:
         response_data["final_delivery"] = final_delivery
+
+    if page is not None:
+        response_data["total"] = page["total"]
+        if page.get("next_cursor"):
+            response_data["next_cursor"] = page["next_cursor"]
     
     return response_data
 
@@ -4365,54 +4479,7 @@ async def vaults_shared_originals_zip(request: Request, token: str, password: Op
     except Exception:
         selected = vault_keys
 
-    original_items: list[tuple[str, bytes]] = []  # (arcname, content)
-
-    def map_original_key(wm_key: str) -> Optional[str]:
-        try:
-            dir_part = os.path.dirname(wm_key)
-            date_part = "/".join(dir_part.split("/")[-3:])
-            name = os.path.basename(wm_key)
-            base_part = name.rsplit("-o", 1)[0] if "-o" in name else os.path.splitext(name)[0]
-            for suf in ("-logo", "-txt"):
-                if base_part.endswith(suf):
-                    base_part = base_part[: -len(suf)]
-                    break
-            for ext in ("jpg","jpeg","png","webp","heic","tif","tiff","bin"):
-                cand = f"users/{uid}/originals/{date_part}/{base_part}-orig.{ext}" if ext != 'bin' else f"users/{uid}/originals/{date_part}/{base_part}-orig.bin"
-                # We don't know existence fast; try fetch
-                if s3 and R2_BUCKET:
-                    try:
-                        obj = s3.Object(R2_BUCKET, cand)
-                        _ = obj.content_length  # triggers head request
-                        return cand
-                    except Exception:
-                        continue
-                else:
-                    local_path = os.path.join(STATIC_DIR, cand)
-                    if os.path.isfile(local_path):
-                        return cand
-        except Exception:
-            return None
-        return None
-
-    try:
-        for k in selected:
-            ok = map_original_key(k)
-            if not ok:
-                continue
-            arcname = os.path.basename(ok)
-            try:
-                if s3 and R2_BUCKET:
-                    obj = s3.Object(R2_BUCKET, ok)
-                    content = obj.get()["Body"].read()
-                else:
-                    with open(os.path.join(STATIC_DIR, ok), "rb") as f:
-                        content = f.read()
-                original_items.append((arcname, content))
-            except Exception:
-                continue
-    except Exception:
-        pass
+    original_items = _resolve_original_entries(uid, selected)  # (arcname, key, size)
 
     if not original_items:
         return JSONResponse({"error": "no originals available"}, status_code=404)
@@ -4425,7 +4492,7 @@ async def vaults_shared_originals_zip(request: Request, token: str, password: Op
         pass
 
     # Calculate total size for analytics
-    total_size = sum(len(content) for _, content in original_items)
+    total_size = sum(size for _, _, size in original_items)
     
     # Track download analytics
     try:
@@ -4445,14 +4512,49 @@ async def vaults_shared_originals_zip(request: Request, token: str, password: Op
     except Exception as e:
         logger.error(f"Failed to track download analytics: {e}")
 
-    # Build zip in-memory
-    mem = io.BytesIO()
-    with zipfile.ZipFile(mem, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for name, content in original_items:
-            zf.writestr(name, content)
-    mem.seek(0)
+    # Stream the archive while originals are fetched in ranged chunks
     headers = {"Content-Disposition": f"attachment; filename=\"{vault}-originals.zip\""}
-    return StreamingResponse(mem, media_type="application/zip", headers=headers)
+    return StreamingResponse(iter_zip(original_items), media_type="application/zip", headers=headers)
+
+
+_ORIGINAL_EXTS = ("jpg", "jpeg", "png", "webp", "heic", "tif", "tiff", "bin")
+
+
+def _resolve_original_entries(uid: str, wm_keys: list[str]) -> list[tuple[str, str, int]]:
+    """Map watermarked keys to (arcname, original key, size).
+
+    One LIST per originals date folder instead of a HEAD per candidate extension.
+    """
+    wanted: list[tuple[str, str]] = []  # (date folder prefix, base name)
+    for wm_key in wm_keys:
+        try:
+            date_part = "/".join(os.path.dirname(wm_key).split("/")[-3:])
+            name = os.path.basename(wm_key)
+            base_part = name.rsplit("-o", 1)[0] if "-o" in name else os.path.splitext(name)[0]
+            for suf in ("-logo", "-txt"):
+                if base_part.endswith(suf):
+                    base_part = base_part[: -len(suf)]
+                    break
+            wanted.append((f"users/{uid}/originals/{date_part}/", base_part))
+        except Exception:
+            continue
+
+    listings: dict[str, dict[str, int]] = {}
+    entries: list[tuple[str, str, int]] = []
+    seen: set[str] = set()
+    for prefix, base_part in wanted:
+        if prefix not in listings:
+            listings[prefix] = list_key_sizes(prefix)
+        sizes = listings[prefix]
+        for ext in _ORIGINAL_EXTS:
+            cand = f"{prefix}{base_part}-orig.{ext}"
+            if cand in sizes:
+                if cand in seen:
+                    break
+                seen.add(cand)
+                entries.append((os.path.basename(cand), cand, sizes[cand]))
+                break
+    return entries
 
 
 @router.get("/vaults/shared/lowres.zip")
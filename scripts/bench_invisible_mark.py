@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark the batched block-DCT invisible watermark engine against the previous
+per-block implementation (one cv2.dct/cv2.idct call per 8x8 block).
+
+Also checks that both implementations agree on the decoded PMK1 payload, both for
+images marked by the new engine and for images marked by the legacy loop.
+
+Usage:
+    python -m scripts.bench_invisible_mark [--width 6000] [--height 4000] [--runs 3]
+"""
+import os
+import sys
+import time
+import argparse
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import cv2
+from PIL import Image
+
+from utils.invisible_mark import (
+    BLOCK, C1, C2, PAYLOAD_LEN,
+    _to_y, _from_y, _block_view, _payload_to_bits, _bits_to_bytes,
+    build_payload_for_uid, payload_matches_uid, embed_signature, detect_signature,
+)
+
+
+def legacy_embed(img: Image.Image, payload: bytes, strength: float = 6.0) -> Image.Image:
+    """Reference per-block embed loop (pre-vectorization behaviour, minus the final scramble)."""
+    y = _to_y(img).astype(np.float32)
+    blocks = _block_view(y, BLOCK)
+    bh, bw = blocks.shape[:2]
+    bits = _payload_to_bits(payload)
+    repeat = max(8, (bh * bw) // max(1, len(bits) * 2))
+    sequence = bits * repeat
+    idx = 0
+    for i in range(bh):
+        for j in range(bw):
+            if idx >= len(sequence):
+                break
+            b = sequence[idx]
+            idx += 1
+            d = cv2.dct(blocks[i, j].astype(np.float32) - 128.0)
+            c1, c2 = d[C1], d[C2]
+            if b == 1:
+                if c1 <= c2 + strength:
+                    d[C1] = c2 + strength
+            else:
+                if c2 <= c1 + strength:
+                    d[C2] = c1 + strength
+            blocks[i, j, :, :] = cv2.idct(d) + 128.0
+        if idx >= len(sequence):
+            break
+    # `blocks` is a strided view, so the writes above already landed in `y`. The old
+    # code then re-assigned `blocks.reshape(...)`, which interleaves rows of different
+    # blocks; that scramble is left out here so the pixel comparison is meaningful.
+    return _from_y(y, img)
+
+
+def legacy_detect(img: Image.Image, payload_len_bytes: int = PAYLOAD_LEN):
+    """Reference per-block detection loop (pre-vectorization behaviour)."""
+    y = _to_y(img).astype(np.float32)
+    blocks = _block_view(y, BLOCK)
+    bh, bw = blocks.shape[:2]
+    bits_len = payload_len_bytes * 8
+    reps = (bh * bw) // bits_len
+    if reps <= 0:
+        return None
+    votes = np.zeros(bits_len, dtype=np.int32)
+    idx = 0
+    for i in range(bh):
+        for j in range(bw):
+            d = cv2.dct(blocks[i, j].astype(np.float32) - 128.0)
+            votes[idx % bits_len] += 1 if (d[C1] - d[C2]) > 0 else -1
+            idx += 1
+    conf = float(np.mean(np.clip(np.abs(votes) / max(1, reps), 0, 1)))
+    if conf < 0.15:
+        return None
+    return _bits_to_bytes((votes > 0).astype(np.uint8).tolist())[:payload_len_bytes]
+
+
+def _timed(fn, runs: int):
+    best = float("inf")
+    result = None
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark invisible watermark embed/detect")
+    parser.add_argument("--width", type=int, default=6000)
+    parser.add_argument("--height", type=int, default=4000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1234)
+    # Smooth-ish synthetic photo: low-res noise upscaled, plus a little grain
+    base = rng.integers(0, 256, size=(args.height // 16 + 1, args.width // 16 + 1, 3), dtype=np.uint8)
+    arr = cv2.resize(base, (args.width, args.height), interpolation=cv2.INTER_CUBIC)
+    arr = np.clip(arr.astype(np.int16) + rng.integers(-6, 7, size=arr.shape), 0, 255).astype(np.uint8)
+    img = Image.fromarray(arr, mode="RGB")
+    payload = build_payload_for_uid("bench-user")
+
+    print(f"Image: {args.width}x{args.height} ({args.width * args.height / 1e6:.1f} MP), best of {args.runs}")
+
+    t_old_embed, marked_old = _timed(lambda: legacy_embed(img, payload), args.runs)
+    t_new_embed, marked_new = _timed(lambda: embed_signature(img, payload), args.runs)
+    print(f"embed   legacy: {t_old_embed:8.3f}s   batched: {t_new_embed:8.3f}s   speedup: {t_old_embed / t_new_embed:6.1f}x")
+
+    t_old_detect, got_old = _timed(lambda: legacy_detect(marked_new), args.runs)
+    t_new_detect, got_new = _timed(lambda: detect_signature(marked_new), args.runs)
+    print(f"detect  legacy: {t_old_detect:8.3f}s   batched: {t_new_detect:8.3f}s   speedup: {t_old_detect / t_new_detect:6.1f}x")
+
+    diff = np.abs(np.asarray(marked_old, dtype=np.int16) - np.asarray(marked_new, dtype=np.int16))
+    print(f"pixel diff legacy vs batched embed: max={int(diff.max())} mean={float(diff.mean()):.5f}")
+
+    checks = {
+        "legacy detect on batched embed": got_old == payload,
+        "batched detect on batched embed": got_new == payload,
+        "batched detect on legacy embed": detect_signature(marked_old) == payload,
+        "payload matches uid": bool(got_new) and payload_matches_uid(got_new, "bench-user"),
+    }
+    for name, ok in checks.items():
+        print(f"  {'OK ' if ok else 'FAIL'} {name}")
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
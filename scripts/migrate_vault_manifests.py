@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Migrate vault key lists from users/{uid}/vaults/{name}.json objects into the
+public.vault_photos table (see sql/32_vault_photos.sql).
+
+Vaults are also migrated lazily on first read, so this script is only needed to move
+everything up front. It is idempotent: already-migrated vaults are skipped.
+
+Usage:
+    python -m scripts.migrate_vault_manifests [--dry-run] [--user UID]
+"""
+import os
+import sys
+import argparse
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import s3, R2_BUCKET, logger
+from routers.vaults import _read_vault_json, _write_vault_json, _read_vault_meta, _VAULT_JSON_STUB
+from utils import vault_manifest
+
+
+def list_user_uids(client) -> list[str]:
+    uids = set()
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=R2_BUCKET, Prefix='users/', Delimiter='/'):
+        for prefix in page.get('CommonPrefixes', []):
+            parts = prefix.get('Prefix', '').strip('/').split('/')
+            if len(parts) >= 2:
+                uids.add(parts[1])
+    return sorted(uids)
+
+
+def list_vault_names(client, uid: str) -> list[str]:
+    """Top-level vault JSON objects only; skips _meta/, _approvals/ and friends."""
+    names = []
+    prefix = f"users/{uid}/vaults/"
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=R2_BUCKET, Prefix=prefix, Delimiter='/'):
+        for obj in page.get('Contents', []):
+            key = obj.get('Key', '')
+            if key.endswith('.json'):
+                names.append(os.path.basename(key)[:-5])
+    return names
+
+
+def migrate_vault(uid: str, name: str, dry_run: bool = False) -> str:
+    if vault_manifest.is_migrated(uid, name):
+        return "skipped"
+    doc = _read_vault_json(uid, name)
+    if not doc or doc.get("manifest") == "db":
+        return "skipped"
+    keys = list(doc.get("keys", []))
+    if dry_run:
+        logger.info(f"[DRY-RUN] Would migrate {uid}/{name} ({len(keys)} keys)")
+        return "migrated"
+    meta = _read_vault_meta(uid, name) or {}
+    order = meta.get("order")
+    if not vault_manifest.import_keys(uid, name, keys, order=order if isinstance(order, list) else None):
+        return "failed"
+    dn = meta.get("display_name")
+    vault_manifest.update_summary_meta(uid, name, bool(meta.get("protected")), str(dn) if dn else None)
+    _write_vault_json(uid, name, _VAULT_JSON_STUB)
+    logger.info(f"Migrated {uid}/{name} ({len(keys)} keys)")
+    return "migrated"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate vault JSON manifests to Postgres')
+    parser.add_argument('--dry-run', action='store_true', help='Show what would be done without making changes')
+    parser.add_argument('--user', type=str, help='Process only this user UID')
+    args = parser.parse_args()
+
+    if not s3 or not R2_BUCKET:
+        logger.error("Primary storage not configured")
+        sys.exit(1)
+    client = s3.meta.client
+
+    uids = [args.user] if args.user else list_user_uids(client)
+    totals = {"migrated": 0, "skipped": 0, "failed": 0}
+    for uid in uids:
+        for name in list_vault_names(client, uid):
+            try:
+                totals[migrate_vault(uid, name, dry_run=args.dry_run)] += 1
+            except Exception as ex:
+                logger.error(f"Failed to migrate {uid}/{name}: {ex}")
+                totals["failed"] += 1
+
+    logger.info(f"{'[DRY-RUN] ' if args.dry_run else ''}Complete: {totals['migrated']} migrated, "
+                f"{totals['skipped']} skipped, {totals['failed']} failed")
+    if totals["failed"]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
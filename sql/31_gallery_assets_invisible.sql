@@ -0,0 +1,6 @@
+-- Invisible watermark index on gallery assets
+-- Records whether an invisible signature was embedded at upload time so photo listings
+-- can resolve has_invisible for a whole page in one query instead of per-photo R2 reads.
+-- NULL means unknown (rows created before this column); those are backfilled lazily.
+ALTER TABLE public.gallery_assets ADD COLUMN IF NOT EXISTS has_invisible BOOLEAN;
+-- Lookups go through the existing unique index on gallery_assets.key.
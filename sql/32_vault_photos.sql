@@ -0,0 +1,31 @@
+-- Vault membership table (replaces users/{uid}/vaults/{name}.json key lists)
+-- One row per photo in a vault. position holds the explicit display order set via
+-- /vaults/meta (1000000000 = unordered, sorted by key after ordered photos).
+-- Vaults are migrated lazily on first read/write, or in bulk with
+--   python -m scripts.migrate_vault_manifests
+CREATE TABLE IF NOT EXISTS public.vault_photos (
+  vault_id INTEGER NOT NULL REFERENCES public.vaults(id) ON DELETE CASCADE,
+  key TEXT NOT NULL,
+  position INTEGER NOT NULL DEFAULT 1000000000,
+  added_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (vault_id, key)
+);
+
+-- Keyset pagination in display order
+CREATE INDEX IF NOT EXISTS ix_vault_photos_order ON public.vault_photos (vault_id, position, key);
+
+-- Set once a vault's JSON key list has been imported; from then on vault_photos is authoritative
+ALTER TABLE public.vaults ADD COLUMN IF NOT EXISTS manifest_in_db BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- One vaults row per (owner_uid, name), so concurrent lazy migrations of the same vault
+-- cannot create two. Earlier duplicates are folded into the oldest row (the one every
+-- reader picks) before the index is built.
+INSERT INTO public.vault_photos (vault_id, key, position, added_at)
+SELECT k.id, vp.key, vp.position, vp.added_at
+FROM public.vault_photos vp
+JOIN public.vaults d ON d.id = vp.vault_id
+JOIN public.vaults k ON k.owner_uid = d.owner_uid AND k.name = d.name AND k.id < d.id
+ON CONFLICT (vault_id, key) DO NOTHING;
+DELETE FROM public.vaults d USING public.vaults k
+WHERE k.owner_uid = d.owner_uid AND k.name = d.name AND k.id < d.id;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_vaults_owner_name ON public.vaults (owner_uid, name);
@@ -0,0 +1,15 @@
+-- Per-vault summary row for the vault list endpoint (one query per user instead of
+-- reading every vault's key list and meta JSON).
+-- photo_count / total_size_bytes / cover_key are maintained in the same transaction as
+-- vault_photos changes; is_protected / display_name are synced from vault meta writes.
+-- meta_synced = FALSE means the meta fields have not been populated yet.
+CREATE TABLE IF NOT EXISTS public.vault_summaries (
+  vault_id INTEGER PRIMARY KEY REFERENCES public.vaults(id) ON DELETE CASCADE,
+  photo_count INTEGER NOT NULL DEFAULT 0,
+  total_size_bytes BIGINT NOT NULL DEFAULT 0,
+  cover_key TEXT,
+  is_protected BOOLEAN NOT NULL DEFAULT FALSE,
+  display_name TEXT,
+  meta_synced BOOLEAN NOT NULL DEFAULT FALSE,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
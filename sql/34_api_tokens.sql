@@ -0,0 +1,15 @@
+-- Index of Photomark API tokens (pm_ tokens used by Lightroom/Photoshop plugins).
+-- Verification looks tokens up by hash here instead of reading R2 JSON objects.
+-- last_used_at is written in batches by the API process, not on every request.
+CREATE TABLE IF NOT EXISTS public.api_tokens (
+  token_hash TEXT PRIMARY KEY,
+  uid TEXT NOT NULL,
+  token_id TEXT,
+  name TEXT,
+  is_active BOOLEAN NOT NULL DEFAULT TRUE,
+  created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+  expires_at TIMESTAMP,
+  last_used_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_api_tokens_uid ON public.api_tokens (uid);
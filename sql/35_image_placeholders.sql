@@ -0,0 +1,11 @@
+-- Compact image placeholders (dimensions, dominant color, 16px LQIP) keyed by storage key.
+-- Written when the small thumbnail is generated; photo listings read a whole page with
+-- one query and inline the values so grids can lay out and paint before images load.
+CREATE TABLE IF NOT EXISTS public.image_placeholders (
+  key TEXT PRIMARY KEY,
+  width INTEGER NOT NULL,
+  height INTEGER NOT NULL,
+  color VARCHAR(7) NOT NULL,
+  lqip TEXT,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
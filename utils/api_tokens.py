@@ -0,0 +1,241 @@
+"""
+Postgres-backed API token index (public.api_tokens) for `pm_` integration tokens.
+
+Verifying a token used to read `auth/api_token_lookup/{hash[:16]}.json` and the
+user's `integrations/api_tokens.json`, then rewrite the latter to bump
+`last_used_at` (two GETs and a PUT per API call, racing with concurrent calls).
+Now:
+
+- Token rows are looked up by hash in one indexed query; tokens created before the
+  table existed are imported from the JSON objects on first use.
+- Verification results (including misses) are cached in-process for a short TTL.
+  Revocation drops the entry in this process; other workers stop accepting a revoked
+  token once their entry expires.
+- `last_used_at` is buffered in memory and written by a background thread in one
+  batched UPDATE every FLUSH_SECONDS, so token-authenticated requests do no writes.
+
+The JSON object under `users/{uid}/integrations/api_tokens.json` stays the source for
+token names/listing; `last_used_at` for listings comes from `last_used_map`.
+"""
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import text
+
+from core.config import logger
+from core.database import engine
+
+POSITIVE_TTL_SECONDS = 60
+NEGATIVE_TTL_SECONDS = 30
+MAX_CACHED = 10_000
+FLUSH_SECONDS = 60
+
+# token_hash -> (cache_expires_at, uid | None, token_expires_at_epoch | None)
+_cache: "OrderedDict[str, tuple[float, Optional[str], Optional[float]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+# token_hash -> last use (naive UTC), not yet written
+_pending: dict[str, datetime] = {}
+_pending_lock = threading.Lock()
+_flusher_lock = threading.Lock()
+_flusher_started = False
+
+
+def _parse_iso(value) -> Optional[datetime]:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    try:
+        return datetime.fromisoformat(str(value)).replace(tzinfo=None)
+    except Exception:
+        return None
+
+
+def _epoch(dt: Optional[datetime]) -> Optional[float]:
+    if dt is None:
+        return None
+    return (dt - datetime(1970, 1, 1)).total_seconds()
+
+
+def _cache_put(token_hash: str, uid: Optional[str], expires_at: Optional[datetime]) -> None:
+    ttl = POSITIVE_TTL_SECONDS if uid else NEGATIVE_TTL_SECONDS
+    with _cache_lock:
+        _cache[token_hash] = (time.monotonic() + ttl, uid, _epoch(expires_at))
+        _cache.move_to_end(token_hash)
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+
+
+def invalidate(token_hash: str) -> None:
+    with _cache_lock:
+        _cache.pop(token_hash, None)
+
+
+def register_token(uid: str, token_id: str, token_hash: str, name: str,
+                   created_at: datetime, expires_at: Optional[datetime]) -> bool:
+    """Index a newly created token. Returns False if the database is unavailable."""
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO public.api_tokens (token_hash, uid, token_id, name, is_active, created_at, expires_at)
+                VALUES (:h, :uid, :tid, :name, TRUE, :created, :expires)
+                ON CONFLICT (token_hash) DO NOTHING
+            """), {"h": token_hash, "uid": uid, "tid": token_id, "name": name,
+                   "created": created_at, "expires": expires_at})
+    except Exception as ex:
+        logger.warning(f"api token index insert failed for {uid}: {ex}")
+        return False
+    invalidate(token_hash)
+    return True
+
+
+def revoke_token(uid: str, token_hash: str) -> None:
+    """Remove a token from the index and from this process's verification cache."""
+    invalidate(token_hash)
+    with _pending_lock:
+        _pending.pop(token_hash, None)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM public.api_tokens WHERE token_hash=:h AND uid=:uid"),
+                         {"h": token_hash, "uid": uid})
+    except Exception as ex:
+        logger.warning(f"api token index delete failed for {uid}: {ex}")
+
+
+def _import_legacy(token_hash: str) -> Optional[tuple[str, Optional[datetime]]]:
+    """Find a pre-index token in the JSON objects and add it to the table."""
+    from utils.storage import read_json_key
+    lookup = read_json_key(f"auth/api_token_lookup/{token_hash[:16]}.json") or {}
+    uid = lookup.get("uid")
+    if not uid:
+        return None
+    data = read_json_key(f"users/{uid}/integrations/api_tokens.json") or {}
+    for t in data.get("tokens", []):
+        if t.get("hash") != token_hash or not t.get("is_active", True):
+            continue
+        expires_at = _parse_iso(t.get("expires_at"))
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("""
+                    INSERT INTO public.api_tokens
+                      (token_hash, uid, token_id, name, is_active, created_at, expires_at, last_used_at)
+                    VALUES (:h, :uid, :tid, :name, TRUE, COALESCE(:created, NOW()), :expires, :last_used)
+                    ON CONFLICT (token_hash) DO NOTHING
+                """), {"h": token_hash, "uid": uid, "tid": t.get("id"), "name": t.get("name"),
+                       "created": _parse_iso(t.get("created_at")), "expires": expires_at,
+                       "last_used": _parse_iso(t.get("last_used_at"))})
+        except Exception as ex:
+            logger.warning(f"api token import failed for {uid}: {ex}")
+        return uid, expires_at
+    return None
+
+
+def _lookup(token_hash: str) -> tuple[Optional[str], Optional[datetime]]:
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT uid, expires_at FROM public.api_tokens WHERE token_hash=:h AND is_active"
+            ), {"h": token_hash}).first()
+        if row:
+            return row[0], _parse_iso(row[1])
+    except Exception as ex:
+        # Table missing or database down: the JSON objects still answer
+        logger.warning(f"api token index lookup failed: {ex}")
+    found = _import_legacy(token_hash)
+    return found if found else (None, None)
+
+
+def verify_token_hash(token_hash: str) -> Optional[str]:
+    """UID owning an active, unexpired token with this hash, or None. Records the use."""
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(token_hash)
+        if hit and hit[0] > now:
+            _cache.move_to_end(token_hash)
+            uid, exp = hit[1], hit[2]
+        else:
+            hit = None
+    if hit is None:
+        uid, expires_at = _lookup(token_hash)
+        exp = _epoch(expires_at)
+        _cache_put(token_hash, uid, expires_at)
+    if not uid:
+        return None
+    utcnow = datetime.utcnow()
+    if exp is not None and _epoch(utcnow) > exp:
+        return None
+    _record_use(token_hash, utcnow)
+    return uid
+
+
+def _record_use(token_hash: str, when: datetime) -> None:
+    with _pending_lock:
+        _pending[token_hash] = when
+    _start_flusher()
+
+
+def flush_last_used() -> int:
+    """Write buffered last-use times in one batch. Returns the number of tokens written."""
+    with _pending_lock:
+        if not _pending:
+            return 0
+        batch = [{"h": h, "ts": ts} for h, ts in _pending.items()]
+        _pending.clear()
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                UPDATE public.api_tokens SET last_used_at=:ts
+                WHERE token_hash=:h AND (last_used_at IS NULL OR last_used_at < :ts)
+            """), batch)
+    except Exception as ex:
+        logger.warning(f"api token last_used flush failed ({len(batch)} tokens): {ex}")
+        with _pending_lock:
+            for item in batch:
+                if item["h"] not in _pending:
+                    _pending[item["h"]] = item["ts"]
+        return 0
+    return len(batch)
+
+
+def _flusher_loop() -> None:
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        try:
+            flush_last_used()
+        except Exception as ex:
+            logger.warning(f"api token flusher error: {ex}")
+
+
+def _start_flusher() -> None:
+    global _flusher_started
+    if _flusher_started:
+        return
+    with _flusher_lock:
+        if _flusher_started:
+            return
+        threading.Thread(target=_flusher_loop, name="api-token-flush", daemon=True).start()
+        atexit.register(flush_last_used)
+        _flusher_started = True
+
+
+def last_used_map(uid: str) -> dict[str, str]:
+    """token_id -> last_used_at (ISO) for a user's tokens, including unflushed uses."""
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT token_hash, token_id, last_used_at FROM public.api_tokens WHERE uid=:uid"
+            ), {"uid": uid}).fetchall()
+    except Exception as ex:
+        logger.warning(f"api token last_used read failed for {uid}: {ex}")
+        return {}
+    out: dict[str, str] = {}
+    with _pending_lock:
+        for token_hash, token_id, last_used in rows:
+            ts = _pending.get(token_hash) or _parse_iso(last_used)
+            if token_id and ts:
+                out[token_id] = ts.isoformat()
+    return out
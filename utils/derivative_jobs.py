@@ -0,0 +1,191 @@
+"""
+Durable local job queue for post-upload derivatives (thumbnails, backup mirroring, ...).
+
+`upload_bytes` only performs the primary PUT and enqueues follow-up work here. Jobs
+are rows in a SQLite file, so they survive restarts and can be shared by all worker
+processes on the host; a small thread pool per process claims and runs them.
+
+- Idempotency: each job has an idempotency key (by default kind + storage key +
+  content digest); enqueueing a key that already exists is a no-op.
+- Retries: failed jobs are retried with exponential backoff up to MAX_ATTEMPTS,
+  then kept with status 'failed' for inspection.
+- Leases: a claimed job that is not finished within LEASE_SECONDS (crashed worker)
+  becomes claimable again.
+
+Handlers are registered by kind with `register_handler` and receive
+`(key, payload)`; raising marks the attempt as failed.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+from core.config import logger
+
+QUEUE_PATH = os.getenv("DERIVATIVE_QUEUE_PATH") or os.path.join(os.getcwd(), "data", "jobs", "derivatives.sqlite3")
+WORKERS = int(os.getenv("DERIVATIVE_WORKERS", "2") or "2")
+MAX_ATTEMPTS = 5
+LEASE_SECONDS = 600
+POLL_SECONDS = 1.0
+# Finished jobs are kept this long so repeated enqueues stay idempotent
+RETAIN_DONE_SECONDS = 7 * 24 * 3600
+
+_handlers: dict[str, Callable[[str, dict], None]] = {}
+_local = threading.local()
+_start_lock = threading.Lock()
+_wakeup = threading.Event()
+_started = False
+
+
+def register_handler(kind: str, fn: Callable[[str, dict], None]) -> None:
+    _handlers[kind] = fn
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(QUEUE_PATH), exist_ok=True)
+        conn = sqlite3.connect(QUEUE_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+              id INTEGER PRIMARY KEY AUTOINCREMENT,
+              idem_key TEXT NOT NULL UNIQUE,
+              kind TEXT NOT NULL,
+              key TEXT NOT NULL,
+              payload TEXT NOT NULL DEFAULT '{}',
+              status TEXT NOT NULL DEFAULT 'pending',
+              attempts INTEGER NOT NULL DEFAULT 0,
+              run_after REAL NOT NULL,
+              leased_until REAL,
+              last_error TEXT,
+              created_at REAL NOT NULL,
+              updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_ready ON jobs (status, run_after)")
+        _local.conn = conn
+    return conn
+
+
+def enqueue(kind: str, key: str, payload: Optional[dict] = None, idem_key: Optional[str] = None) -> bool:
+    """Queue a job; returns False if the queue is unavailable (caller may run it inline)."""
+    now = time.time()
+    try:
+        _conn().execute(
+            "INSERT OR IGNORE INTO jobs (idem_key, kind, key, payload, run_after, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (idem_key or f"{kind}:{key}", kind, key, json.dumps(payload or {}), now, now, now),
+        )
+    except Exception as ex:
+        logger.warning(f"derivative enqueue failed for {kind}:{key}: {ex}")
+        return False
+    start_workers()
+    _wakeup.set()
+    return True
+
+
+def _claim() -> Optional[tuple]:
+    conn = _conn()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT id, kind, key, payload, attempts FROM jobs"
+            " WHERE (status='pending' AND run_after<=?) OR (status='running' AND leased_until<?)"
+            " ORDER BY id LIMIT 1",
+            (now, now),
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE jobs SET status='running', leased_until=?, attempts=attempts+1, updated_at=? WHERE id=?",
+                (now + LEASE_SECONDS, now, row[0]),
+            )
+        conn.execute("COMMIT")
+        return row
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _finish(job_id: int, attempts: int, error: Optional[str]) -> None:
+    now = time.time()
+    if error is None:
+        _conn().execute(
+            "UPDATE jobs SET status='done', leased_until=NULL, last_error=NULL, updated_at=? WHERE id=?",
+            (now, job_id),
+        )
+    elif attempts >= MAX_ATTEMPTS:
+        _conn().execute(
+            "UPDATE jobs SET status='failed', leased_until=NULL, last_error=?, updated_at=? WHERE id=?",
+            (error[:1000], now, job_id),
+        )
+    else:
+        backoff = min(300, 5 * (2 ** (attempts - 1)))
+        _conn().execute(
+            "UPDATE jobs SET status='pending', leased_until=NULL, run_after=?, last_error=?, updated_at=? WHERE id=?",
+            (now + backoff, error[:1000], now, job_id),
+        )
+
+
+def run_once() -> bool:
+    """Claim and run one ready job. Returns False when nothing was ready."""
+    row = _claim()
+    if not row:
+        return False
+    job_id, kind, key, payload, attempts = row
+    attempts += 1
+    handler = _handlers.get(kind)
+    if handler is None:
+        _finish(job_id, MAX_ATTEMPTS, f"no handler for kind {kind}")
+        return True
+    try:
+        handler(key, json.loads(payload or "{}"))
+        _finish(job_id, attempts, None)
+    except Exception as ex:
+        logger.warning(f"derivative job {kind}:{key} attempt {attempts} failed: {ex}")
+        _finish(job_id, attempts, str(ex) or ex.__class__.__name__)
+    return True
+
+
+def _purge_done() -> None:
+    _conn().execute(
+        "DELETE FROM jobs WHERE status='done' AND updated_at<?",
+        (time.time() - RETAIN_DONE_SECONDS,),
+    )
+
+
+def _worker_loop() -> None:
+    last_purge = 0.0
+    while True:
+        try:
+            if run_once():
+                continue
+            if time.time() - last_purge > 3600:
+                last_purge = time.time()
+                _purge_done()
+        except Exception as ex:
+            logger.warning(f"derivative worker error: {ex}")
+        _wakeup.wait(POLL_SECONDS)
+        _wakeup.clear()
+
+
+def start_workers() -> None:
+    """Start the per-process worker threads once. Also resumes jobs left from a restart."""
+    global _started
+    if _started:
+        return
+    with _start_lock:
+        if _started:
+            return
+        for i in range(max(1, WORKERS)):
+            threading.Thread(target=_worker_loop, name=f"derivatives-{i}", daemon=True).start()
+        _started = True
+
+
+def stats() -> dict[str, int]:
+    rows = _conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+    return {status: int(n) for status, n in rows}
@@ -0,0 +1,75 @@
+"""
+Listing placeholders (public.image_placeholders), keyed by storage key.
+
+Each row holds the original dimensions, the dominant color and a 16px LQIP data URI.
+The row is computed from the same decode as the small thumbnail
+(`utils.thumbnails.generate_thumbnail_with_placeholder`) and written wherever that
+thumbnail is generated: the post-upload derivative job, the backfill and on-demand
+generation. Listings resolve a whole page with one query and inline the values, so
+grids reserve each photo's box and paint its color/LQIP before any image arrives.
+
+Keys whose thumbnail predates the table have no row. Listings simply omit the
+placeholder for them.
+"""
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+
+from core.config import logger
+from core.database import engine
+
+# Bound the array parameter per statement; listings page at most 1000 keys
+_LOOKUP_CHUNK = 500
+
+
+def record_placeholder(key: str, placeholder: Optional[dict]) -> bool:
+    """Store (or replace) the placeholder for `key`. Returns False if it was not written."""
+    if not key or not placeholder:
+        return False
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO public.image_placeholders (key, width, height, color, lqip, updated_at)
+                VALUES (:key, :width, :height, :color, :lqip, NOW())
+                ON CONFLICT (key) DO UPDATE SET
+                  width = EXCLUDED.width,
+                  height = EXCLUDED.height,
+                  color = EXCLUDED.color,
+                  lqip = EXCLUDED.lqip,
+                  updated_at = NOW()
+            """), {"key": key, "width": int(placeholder["width"]), "height": int(placeholder["height"]),
+                   "color": placeholder["color"], "lqip": placeholder.get("lqip")})
+    except Exception as ex:
+        logger.warning(f"placeholder write failed for {key}: {ex}")
+        return False
+    return True
+
+
+def lookup_placeholders(keys: Iterable[str]) -> dict[str, dict]:
+    """Batched lookup: key -> {"width", "height", "color", "lqip"} for keys with a row."""
+    wanted = [k for k in dict.fromkeys(keys or []) if k]
+    found: dict[str, dict] = {}
+    if not wanted:
+        return found
+    try:
+        with engine.connect() as conn:
+            for i in range(0, len(wanted), _LOOKUP_CHUNK):
+                rows = conn.execute(text(
+                    "SELECT key, width, height, color, lqip FROM public.image_placeholders"
+                    " WHERE key = ANY(CAST(:keys AS text[]))"
+                ), {"keys": wanted[i:i + _LOOKUP_CHUNK]}).fetchall()
+                for key, width, height, color, lqip in rows:
+                    found[key] = {"width": int(width), "height": int(height), "color": color, "lqip": lqip}
+    except Exception as ex:
+        logger.warning(f"placeholder lookup failed ({len(wanted)} keys): {ex}")
+    return found
+
+
+def attach_placeholders(items: list[dict], key_field: str = "key") -> list[dict]:
+    """Inline `placeholder` into listing items that have one. Returns `items`."""
+    found = lookup_placeholders(it.get(key_field) for it in items)
+    for it in items:
+        ph = found.get(it.get(key_field))
+        if ph:
+            it["placeholder"] = ph
+    return items
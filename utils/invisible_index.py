@@ -0,0 +1,134 @@
+"""
+Persistent index of invisible-watermark presence, keyed by storage key.
+
+The embed outcome is recorded on `gallery_assets.has_invisible` when a photo is
+uploaded, so listings resolve a whole page with one query instead of reading a
+`users/{uid}/_cache/invisible/*.json` sidecar (or downloading the original) per photo.
+
+Keys without an indexed value (uploads that predate the column, or objects with no
+GalleryAsset row) fall back to the legacy sidecar and, when requested, to on-demand
+detection. Results found that way are written back to the index when a row exists.
+"""
+import hashlib
+from datetime import datetime
+from io import BytesIO
+from typing import Iterable, Optional
+
+from PIL import Image
+from sqlalchemy.orm import Session
+
+from core.config import logger
+from core.database import SessionLocal
+from models.gallery import GalleryAsset
+from utils.storage import read_json_key, write_json_key, read_bytes_key
+from utils.invisible_mark import detect_signature, PAYLOAD_LEN
+
+# Bound the IN (...) list per statement; listings page at most 1000 keys
+_LOOKUP_CHUNK = 500
+
+
+def _legacy_cache_key(uid: str, photo_key: str) -> str:
+    h = hashlib.sha1(photo_key.encode('utf-8')).hexdigest()
+    return f"users/{uid}/_cache/invisible/{h}.json"
+
+
+def lookup_invisible_flags(db: Session, keys: Iterable[str]) -> dict[str, bool]:
+    """Batched index lookup. Returns only keys with a recorded value."""
+    wanted = [k for k in dict.fromkeys(keys or []) if k]
+    found: dict[str, bool] = {}
+    for i in range(0, len(wanted), _LOOKUP_CHUNK):
+        chunk = wanted[i:i + _LOOKUP_CHUNK]
+        rows = (
+            db.query(GalleryAsset.key, GalleryAsset.has_invisible)
+            .filter(GalleryAsset.key.in_(chunk), GalleryAsset.has_invisible.isnot(None))
+            .all()
+        )
+        for key, flag in rows:
+            found[key] = bool(flag)
+    return found
+
+
+def record_invisible_flags(db: Session, flags: dict[str, bool]) -> int:
+    """Persist detection/embed outcomes for existing GalleryAsset rows.
+
+    Returns the number of rows updated; keys without a row are left alone.
+    """
+    updated = 0
+    try:
+        for value in (True, False):
+            keys = [k for k, v in flags.items() if bool(v) is value]
+            for i in range(0, len(keys), _LOOKUP_CHUNK):
+                updated += (
+                    db.query(GalleryAsset)
+                    .filter(GalleryAsset.key.in_(keys[i:i + _LOOKUP_CHUNK]))
+                    .update({GalleryAsset.has_invisible: value}, synchronize_session=False)
+                )
+        db.commit()
+    except Exception as ex:
+        logger.warning(f"record_invisible_flags failed: {ex}")
+        try:
+            db.rollback()
+        except Exception:
+            pass
+    return updated
+
+
+def detect_invisible_for_key(key: str) -> bool:
+    """Download the stored image and run DCT detection. Slow; use only on index misses."""
+    data = read_bytes_key(key)
+    if not data:
+        return False
+    try:
+        img = Image.open(BytesIO(data))
+    except Exception:
+        return False
+    try:
+        return bool(detect_signature(img, payload_len_bytes=PAYLOAD_LEN))
+    except Exception:
+        return False
+
+
+def resolve_invisible_flags(db: Optional[Session], uid: str, keys: Iterable[str], compute: bool = True) -> dict[str, bool]:
+    """Resolve `has_invisible` for a page of keys with one index query.
+
+    Misses consult the legacy sidecar; if `compute` is set, remaining misses are
+    detected from the image bytes. Everything learned is written back to the index.
+    """
+    keys = [k for k in dict.fromkeys(keys or []) if k]
+    if not keys:
+        return {}
+    own_session = db is None
+    if own_session:
+        db = SessionLocal()
+    try:
+        try:
+            flags = lookup_invisible_flags(db, keys)
+        except Exception as ex:
+            logger.warning(f"invisible index lookup failed: {ex}")
+            flags = {}
+        learned: dict[str, bool] = {}
+        for key in keys:
+            if key in flags:
+                continue
+            ckey = _legacy_cache_key(uid, key)
+            rec = read_json_key(ckey)
+            if isinstance(rec, dict) and "ok" in rec:
+                learned[key] = bool(rec.get("ok"))
+            elif compute:
+                ok = detect_invisible_for_key(key)
+                learned[key] = ok
+                # Keep the sidecar for objects that have no GalleryAsset row to hold the flag
+                try:
+                    if not db.query(GalleryAsset.id).filter(GalleryAsset.key == key).first():
+                        write_json_key(ckey, {"ok": ok, "ts": datetime.utcnow().isoformat()})
+                except Exception:
+                    pass
+            else:
+                flags[key] = False
+        if learned:
+            record_invisible_flags(db, learned)
+            flags.update(learned)
+        return flags
+    finally:
+        if own_session:
+            db.close()
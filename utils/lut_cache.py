@@ -0,0 +1,104 @@
+"""
+Process-wide cache of compiled 3D LUT volumes.
+
+Parsing a 33^3 / 65^3 `.cube` file and uploading it as a tensor costs far more than
+sampling it for a preview-sized image, and slider-driven previews resend the same LUT
+(or the same settings) many times. Compiled volumes are cached here keyed by a digest
+of the LUT content (or canonical settings JSON) plus the layout, device and dtype they
+were built for, so every router that applies LUTs shares one bounded cache.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+LUT_CACHE_BUDGET_MB = int(os.getenv("LUT_CACHE_BUDGET_MB", "256") or "256")
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def settings_digest(settings: Any) -> str:
+    """Digest of a settings payload that ignores key order."""
+    raw = json.dumps(settings, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _cost(value: Any) -> int:
+    """Approximate bytes held by a compiled LUT (tensors / arrays, possibly in a tuple)."""
+    if isinstance(value, (tuple, list)):
+        return sum(_cost(v) for v in value)
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    if hasattr(value, "element_size") and hasattr(value, "nelement"):
+        return int(value.element_size() * value.nelement())
+    return 64
+
+
+class _LutCache:
+    """Thread-safe LRU bounded by approximate memory use."""
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.bytes = 0
+        self._data: "OrderedDict[Hashable, tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # One build per key at a time; concurrent requests for the same LUT wait for it
+        self._building: dict[Hashable, threading.Lock] = {}
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            self._data.move_to_end(key)
+            return hit[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        cost = _cost(value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._data[key] = (value, cost)
+            self.bytes += cost
+            while len(self._data) > 1 and self.bytes > self.budget_bytes:
+                _, (_, c) = self._data.popitem(last=False)
+                self.bytes -= c
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            try:
+                value = self.get(key)
+                if value is None:
+                    value = build()
+                    self.put(key, value)
+                return value
+            finally:
+                with self._lock:
+                    self._building.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_cache = _LutCache(LUT_CACHE_BUDGET_MB * 1024 * 1024)
+
+
+def compiled_lut(key: tuple, build: Callable[[], Any]) -> Any:
+    """Cached result of `build()` for `key`.
+
+    `key` should include the content/settings digest and everything that changes the
+    compiled form (layout, device, dtype). Exceptions from `build` propagate and
+    nothing is cached.
+    """
+    return _cache.get_or_build(key, build)
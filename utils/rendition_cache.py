@@ -0,0 +1,143 @@
+"""
+Size-bounded on-disk LRU for image renditions (`GET /api/img/{key}`).
+
+A rendition is addressed by a digest of (source key, width, format, quality). Each
+entry is one file in RENDITION_CACHE_DIR, written atomically. A file's mtime is when
+it was written and its atime is when it was last served; hits set atime explicitly,
+so noatime mounts do not matter. Eviction removes the least recently served files
+once the directory exceeds RENDITION_CACHE_MB. Every worker process shares the
+directory. Each process rescans it every RESCAN_SECONDS, so files written by other
+workers count toward the budget.
+
+Entries written more than RENDITION_MAX_AGE_SECONDS ago are treated as misses. A
+source overwritten in place therefore shows a stale rendition for at most that long.
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from core.config import logger
+
+RENDITION_CACHE_DIR = os.getenv("RENDITION_CACHE_DIR") or os.path.join(os.getcwd(), "data", "renditions")
+RENDITION_CACHE_MB = int(os.getenv("RENDITION_CACHE_MB", "1024") or "1024")
+RENDITION_MAX_AGE_SECONDS = int(os.getenv("RENDITION_MAX_AGE_SECONDS", "86400") or "86400")
+RESCAN_SECONDS = 60.0
+# Bump when rendering changes so entries written by older code are not served
+RENDITION_VERSION = 2
+
+
+def rendition_id(key: str, width: int, fmt: str, quality: int) -> str:
+    raw = f"{RENDITION_VERSION}\0{key}\0{width}\0{fmt}\0{quality}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class _DiskLru:
+    def __init__(self, root: str, budget_bytes: int, max_age: float):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.max_age = max_age
+        self.bytes = 0
+        # file name -> size, least recently used first
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._scanned_at = 0.0
+
+    def _path(self, name: str) -> str:
+        # Two-level fan-out keeps directories small
+        return os.path.join(self.root, name[:2], name)
+
+    def _rescan(self) -> None:
+        entries = []
+        try:
+            with os.scandir(self.root) as shards:
+                for shard in shards:
+                    if not shard.is_dir():
+                        continue
+                    with os.scandir(shard.path) as files:
+                        for f in files:
+                            if f.name.endswith(".tmp"):
+                                continue
+                            try:
+                                st = f.stat()
+                            except FileNotFoundError:
+                                continue
+                            entries.append((st.st_atime, f.name, st.st_size))
+        except FileNotFoundError:
+            pass
+        entries.sort()
+        self._index = OrderedDict((name, size) for _, name, size in entries)
+        self.bytes = sum(size for _, _, size in entries)
+        self._scanned_at = time.monotonic()
+
+    def _evict(self) -> None:
+        while self._index and self.bytes > self.budget_bytes:
+            name, size = self._index.popitem(last=False)
+            self.bytes -= size
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+            except Exception as ex:
+                logger.warning(f"rendition cache evict failed for {name}: {ex}")
+
+    def get(self, name: str) -> Optional[bytes]:
+        path = self._path(name)
+        try:
+            st = os.stat(path)
+            now = time.time()
+            if now - st.st_mtime > self.max_age:
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path, (now, st.st_mtime))
+        except FileNotFoundError:
+            return None
+        except Exception as ex:
+            logger.warning(f"rendition cache read failed for {name}: {ex}")
+            return None
+        with self._lock:
+            if name in self._index:
+                self._index.move_to_end(name)
+        return data
+
+    def put(self, name: str, data: bytes) -> None:
+        path = self._path(name)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception as ex:
+            logger.warning(f"rendition cache write failed for {name}: {ex}")
+            try:
+                os.remove(tmp)
+            except Exception:
+                pass
+            return
+        with self._lock:
+            if time.monotonic() - self._scanned_at >= RESCAN_SECONDS:
+                self._rescan()
+            old = self._index.pop(name, None)
+            if old is not None:
+                self.bytes -= old
+            self._index[name] = len(data)
+            self.bytes += len(data)
+            self._evict()
+
+
+_cache = _DiskLru(RENDITION_CACHE_DIR, RENDITION_CACHE_MB * 1024 * 1024, RENDITION_MAX_AGE_SECONDS)
+
+
+def get(name: str) -> Optional[bytes]:
+    """Cached rendition bytes for `name` (see `rendition_id`), or None."""
+    return _cache.get(name)
+
+
+def put(name: str, data: bytes) -> None:
+    """Store a rendition; evicts least recently used entries past the budget."""
+    _cache.put(name, data)
@@ -1,13 +1,14 @@
 import os
 import json
 from typing import Optional
-from core.config import s3, s3_presign_client, R2_BUCKET, R2_PUBLIC_BASE_URL, R2_CUSTOM_DOMAIN, STATIC_DIR, logger, R2_ACCESS_KEY_ID, R2_SECRET_ACCESS_KEY, s3_backup, BACKUP_BUCKET
+from core.config import s3, s3_presign_client, R2_ACCOUNT_ID, R2_BUCKET, R2_PUBLIC_BASE_URL, R2_CUSTOM_DOMAIN, STATIC_DIR, logger, R2_ACCESS_KEY_ID, R2_SECRET_ACCESS_KEY, s3_backup, BACKUP_BUCKET
 import hashlib, hmac
 from urllib.parse import quote, urlencode
 import time
+import threading
+from collections import OrderedDict
 
-# Simple in-process cache for presigned URLs
-_URL_CACHE: dict[str, tuple[str, float]] = {}
+# Presigned URLs are cached in-process (see _UrlCache below)
 _CACHE_TTL = int(os.getenv("URL_CACHE_TTL_SEC", "300") or "300")
 from botocore.exceptions import ClientError
 
@@ -91,6 +92,76 @@ def _should_generate_thumbnail(key: str) -> bool:
     return False
 
 
+def _queue_derivative(kind: str, key: str, payload: dict, digest: str) -> None:
+    """Enqueue a post-upload job; runs it inline if the queue is unavailable."""
+    from utils import derivative_jobs
+    if derivative_jobs.enqueue(kind, key, payload, idem_key=f"{kind}:{key}:{digest}"):
+        return
+    try:
+        _DERIVATIVE_HANDLERS[kind](key, payload)
+    except Exception as ex:
+        logger.warning(f"{kind} for {key} failed: {ex}")
+
+
+def _derive_thumbnail(key: str, payload: dict) -> None:
+    from utils.thumbnails import generate_thumbnail_with_placeholder, get_thumbnail_key, THUMB_SMALL
+    from utils.image_placeholders import record_placeholder
+    data = read_bytes_key(key)
+    if data is None:
+        raise IOError(f"source missing: {key}")
+    thumb_data, placeholder = generate_thumbnail_with_placeholder(data, THUMB_SMALL, quality=98)
+    if not thumb_data:
+        # Undecodable image; retrying will not help
+        logger.info(f"Thumbnail skipped (not decodable): {key}")
+        return
+    thumb_key = get_thumbnail_key(key, 'small')
+    s3.Bucket(R2_BUCKET).put_object(Key=thumb_key, Body=thumb_data, ContentType='image/jpeg', ACL="private", CacheControl="public, max-age=31536000")
+    logger.info(f"Thumbnail generated: {thumb_key}")
+    record_placeholder(key, placeholder)
+
+
+def _mirror_backup(key: str, payload: dict) -> None:
+    """Copy an uploaded object to the backup bucket unless a file of the same name is already there."""
+    # Key format: users/{uid}/path/to/filename.jpg
+    base_name = os.path.basename(key).lower()
+    parts = key.split("/")
+    user_prefix = "/".join(parts[:2]) + "/" if len(parts) >= 2 else ""
+
+    # Prevents duplicate backups by checking if same filename already exists
+    if user_prefix and base_name:
+        try:
+            client = s3_backup.meta.client
+            paginator = client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=BACKUP_BUCKET, Prefix=user_prefix, PaginationConfig={'MaxItems': 5000}):
+                for obj in page.get('Contents', []):
+                    existing_key = obj.get('Key', '')
+                    if os.path.basename(existing_key).lower() == base_name and existing_key != key:
+                        logger.info(f"Backup skipped (duplicate filename): {base_name} already exists as {existing_key}")
+                        return
+        except Exception as check_ex:
+            # If check fails, proceed with backup anyway
+            logger.warning(f"Backup duplicate check failed: {check_ex}")
+
+    data = read_bytes_key(key)
+    if data is None:
+        raise IOError(f"source missing: {key}")
+    content_type = payload.get("content_type") or "application/octet-stream"
+    s3_backup.Bucket(BACKUP_BUCKET).put_object(Key=key, Body=data, ContentType=content_type, ACL="private")
+    logger.info(f"Backup mirrored to B2: {BACKUP_BUCKET}/{key}")
+
+
+_DERIVATIVE_HANDLERS = {
+    "thumbnail": _derive_thumbnail,
+    "backup": _mirror_backup,
+}
+
+
+def register_derivative_handlers() -> None:
+    from utils import derivative_jobs
+    for kind, fn in _DERIVATIVE_HANDLERS.items():
+        derivative_jobs.register_handler(kind, fn)
+
+
 def write_json_key(key: str, payload: dict):
     data = json.dumps(payload, ensure_ascii=False)
     if s3 and R2_BUCKET:
@@ -146,62 +217,13 @@ def upload_bytes(key: str, data: bytes, content_type: str = "image/jpeg", genera
     except Exception:
         bucket.put_object(Key=key, Body=data, ContentType=content_type, ACL="private")
     
-    # Generate thumbnails for images (non-blocking, best-effort)
+    # Thumbnail and backup mirror run in the background derivative queue
+    digest = hashlib.sha1(data).hexdigest()[:16]
     if generate_thumbs and content_type.startswith('image/') and _should_generate_thumbnail(key):
-        try:
-            from utils.thumbnails import generate_thumbnail, get_thumbnail_key, THUMB_SMALL
-            thumb_data = generate_thumbnail(data, THUMB_SMALL, quality=98)
-            if thumb_data:
-                thumb_key = get_thumbnail_key(key, 'small')
-                try:
-                    bucket.put_object(Key=thumb_key, Body=thumb_data, ContentType='image/jpeg', ACL="private", CacheControl="public, max-age=31536000")
-                    logger.info(f"Thumbnail generated: {thumb_key}")
-                except Exception as tex:
-                    logger.warning(f"Thumbnail upload failed: {tex}")
-        except Exception as tex:
-            logger.debug(f"Thumbnail generation skipped: {tex}")
-
-    # Attempt backup mirror (best-effort; non-blocking on failure)
+        _queue_derivative("thumbnail", key, {}, digest)
     # Only backup actual user photos, not profile/shop/branding assets
-    # Prevents duplicate backups by checking if same filename already exists
-    try:
-        if s3_backup and BACKUP_BUCKET and _should_backup_key(key):
-            try:
-                # Extract user prefix and base filename for duplicate detection
-                # Key format: users/{uid}/path/to/filename.jpg
-                base_name = os.path.basename(key).lower()
-                parts = key.split("/")
-                user_prefix = "/".join(parts[:2]) + "/" if len(parts) >= 2 else ""
-                
-                # Check if a file with the same base name already exists in backup
-                should_backup = True
-                if user_prefix and base_name:
-                    try:
-                        client = s3_backup.meta.client
-                        # List objects with user prefix to find duplicates by filename
-                        paginator = client.get_paginator('list_objects_v2')
-                        for page in paginator.paginate(Bucket=BACKUP_BUCKET, Prefix=user_prefix, PaginationConfig={'MaxItems': 5000}):
-                            for obj in page.get('Contents', []):
-                                existing_key = obj.get('Key', '')
-                                existing_name = os.path.basename(existing_key).lower()
-                                if existing_name == base_name and existing_key != key:
-                                    # Same filename already exists in backup, skip to prevent duplicates
-                                    logger.info(f"Backup skipped (duplicate filename): {base_name} already exists as {existing_key}")
-                                    should_backup = False
-                                    break
-                            if not should_backup:
-                                break
-                    except Exception as check_ex:
-                        # If check fails, proceed with backup anyway
-                        logger.warning(f"Backup duplicate check failed: {check_ex}")
-                
-                if should_backup:
-                    s3_backup.Bucket(BACKUP_BUCKET).put_object(Key=key, Body=data, ContentType=content_type, ACL="private")
-                    logger.info(f"Backup mirrored to B2: {BACKUP_BUCKET}/{key}")
-            except Exception as bx:
-                logger.warning(f"Backup mirror failed for {key}: {bx}")
-    except Exception:
-        pass
+    if s3_backup and BACKUP_BUCKET and _should_backup_key(key):
+        _queue_derivative("backup", key, {"content_type": content_type}, digest)
 
     try:
         url = get_presigned_url(key, expires_in=60 * 60)
@@ -213,104 +235,199 @@ def upload_bytes(key: str, data: bytes, content_type: str = "image/jpeg", genera
         return f"/static/{key}"
 
 
+# SigV4 signing keys are valid for a whole UTC day; derive once per day instead of per URL
+_SIGNING_KEYS: dict[tuple[str, str], bytes] = {}
+
+
+def _hmac_sha256(key_bytes: bytes, msg: str) -> bytes:
+    return hmac.new(key_bytes, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def _signing_key(secret_key: str, date_stamp: str, region: str = "auto", service: str = "s3") -> bytes:
+    ck = (secret_key, date_stamp)
+    k = _SIGNING_KEYS.get(ck)
+    if k is None:
+        k_date = _hmac_sha256(("AWS4" + secret_key).encode("utf-8"), date_stamp)
+        k = _hmac_sha256(_hmac_sha256(_hmac_sha256(k_date, region), service), "aws4_request")
+        _SIGNING_KEYS.clear()
+        _SIGNING_KEYS[ck] = k
+    return k
+
+
+def _presign_target() -> Optional[tuple[str, str]]:
+    """(host, path prefix) URLs are signed for, mirroring the boto clients in core.config.
+
+    Returns None when credentials are missing and signing has to go through boto.
+    """
+    if not (R2_ACCESS_KEY_ID and R2_SECRET_ACCESS_KEY and R2_BUCKET):
+        return None
+    custom = (R2_CUSTOM_DOMAIN or "").replace("https://", "").replace("http://", "").strip().rstrip("/")
+    if custom and (os.getenv("R2_CUSTOM_DOMAIN_BUCKET_LEVEL", "0").strip() == "1"):
+        return custom, ""
+    if custom:
+        return custom, f"/{R2_BUCKET}"
+    if R2_ACCOUNT_ID:
+        return f"{R2_ACCOUNT_ID}.r2.cloudflarestorage.com", f"/{R2_BUCKET}"
+    return None
+
+
+def _presign_many(host: str, path_prefix: str, keys: list[str], expires_in: int) -> dict[str, str]:
+    """SigV4 query-string presign of GET for many keys with one timestamp and signing key."""
+    access_key = R2_ACCESS_KEY_ID.strip()
+    secret_key = R2_SECRET_ACCESS_KEY.strip()
+    from datetime import datetime
+    now = datetime.utcnow()
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date_stamp = now.strftime("%Y%m%d")
+    credential_scope = f"{date_stamp}/auto/s3/aws4_request"
+    k_signing = _signing_key(secret_key, date_stamp)
+
+    q = {
+        "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+        "X-Amz-Credential": f"{access_key}/{credential_scope}",
+        "X-Amz-Date": amz_date,
+        "X-Amz-Expires": str(int(expires_in or 3600)),
+        "X-Amz-SignedHeaders": "host",
+    }
+    # Query values are fully URI-encoded ('/' -> %2F) as SigV4 and boto require
+    canonical_querystring = urlencode(q, quote_via=lambda s, *_: quote(s, safe="-_.~"))
+    # Everything but the path is identical across keys
+    request_tail = f"{canonical_querystring}\nhost:{host}\n\nhost\nUNSIGNED-PAYLOAD"
+    sts_head = f"AWS4-HMAC-SHA256\n{amz_date}\n{credential_scope}\n"
+
+    out: dict[str, str] = {}
+    for key in keys:
+        canonical_uri = path_prefix + "/" + quote(str(key).lstrip("/"), safe="/")
+        canonical_request = f"GET\n{canonical_uri}\n{request_tail}"
+        string_to_sign = sts_head + hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
+        signature = hmac.new(k_signing, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+        out[key] = f"https://{host}{canonical_uri}?{canonical_querystring}&X-Amz-Signature={signature}"
+    return out
+
+
 def presign_custom_domain_bucket(key: str, expires_in: int = 3600) -> str:
     try:
         domain = (R2_CUSTOM_DOMAIN or "").strip()
-        access_key = (R2_ACCESS_KEY_ID or "").strip()
-        secret_key = (R2_SECRET_ACCESS_KEY or "").strip()
-        bucket = (R2_BUCKET or "").strip()
-        if not (domain and access_key and secret_key and bucket and key):
+        if not (domain and R2_ACCESS_KEY_ID and R2_SECRET_ACCESS_KEY and R2_BUCKET and key):
             return ""
-
-        method = "GET"
-        service = "s3"
-        region = "auto"
-        from datetime import datetime
-        now = datetime.utcnow()
-        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
-        date_stamp = now.strftime("%Y%m%d")
-
-        credential_scope = f"{date_stamp}/{region}/{service}/aws4_request"
-        credential = f"{access_key}/{credential_scope}"
-
-        host = domain
-        signed_headers = "host"
-        canonical_uri = "/" + quote(str(key).lstrip("/"), safe="/")
-
-        q = {
-            "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
-            "X-Amz-Credential": credential,
-            "X-Amz-Date": amz_date,
-            "X-Amz-Expires": str(int(expires_in or 3600)),
-            "X-Amz-SignedHeaders": signed_headers,
-        }
-        canonical_querystring = urlencode(q, safe="/", quote_via=lambda s, *_: quote(s, safe="/"))
-
-        canonical_headers = f"host:{host}\n"
-        payload_hash = hashlib.sha256(b"").hexdigest()
-
-        canonical_request = "\n".join([
-            method,
-            canonical_uri,
-            canonical_querystring,
-            canonical_headers,
-            signed_headers,
-            payload_hash,
-        ])
-
-        string_to_sign = "\n".join([
-            "AWS4-HMAC-SHA256",
-            amz_date,
-            credential_scope,
-            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
-        ])
-
-        def _sign(key_bytes: bytes, msg: str) -> bytes:
-            return hmac.new(key_bytes, msg.encode("utf-8"), hashlib.sha256).digest()
-
-        k_date = _sign(("AWS4" + secret_key).encode("utf-8"), date_stamp)
-        k_region = _sign(k_date, region)
-        k_service = _sign(k_region, service)
-        k_signing = _sign(k_service, "aws4_request")
-        signature = hmac.new(k_signing, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
-
-        final_qs = canonical_querystring + "&X-Amz-Signature=" + signature
-        return f"https://{host}{canonical_uri}?{final_qs}"
+        return _presign_many(domain, "", [key], expires_in)[key]
     except Exception as ex:
         logger.warning(f"custom-domain presign failed for {key}: {ex}")
         return ""
 
 
+def _presign_boto(key: str, expires_in: int) -> str:
+    if R2_CUSTOM_DOMAIN and s3_presign_client:
+        return s3_presign_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": R2_BUCKET, "Key": key},
+            ExpiresIn=expires_in,
+        )
+    if s3:
+        return s3.meta.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": R2_BUCKET, "Key": key},
+            ExpiresIn=expires_in,
+        )
+    return ""
+
+
+class _UrlCache:
+    """Thread-safe LRU of presigned URLs bounded by entry count and approximate bytes."""
+
+    # Rough per-entry cost of the dict slot, tuple and string headers
+    _ENTRY_OVERHEAD = 200
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._data: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cost(self, k: str, url: str) -> int:
+        return len(k) + len(url) + self._ENTRY_OVERHEAD
+
+    def get_many(self, ks: list[str], now: float) -> dict[str, str]:
+        found: dict[str, str] = {}
+        with self._lock:
+            for k in ks:
+                hit = self._data.get(k)
+                if not hit:
+                    continue
+                if hit[1] > now:
+                    self._data.move_to_end(k)
+                    found[k] = hit[0]
+                else:
+                    del self._data[k]
+                    self.bytes -= self._cost(k, hit[0])
+        return found
+
+    def put_many(self, items: dict[str, str], expires_at: float) -> None:
+        with self._lock:
+            for k, url in items.items():
+                old = self._data.pop(k, None)
+                if old:
+                    self.bytes -= self._cost(k, old[0])
+                self._data[k] = (url, expires_at)
+                self.bytes += self._cost(k, url)
+            while self._data and (len(self._data) > self.max_entries or self.bytes > self.max_bytes):
+                k, (url, _) = self._data.popitem(last=False)
+                self.bytes -= self._cost(k, url)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_URL_CACHE = _UrlCache(
+    max_entries=int(os.getenv("URL_CACHE_MAX_ENTRIES", "50000") or "50000"),
+    max_bytes=int(os.getenv("URL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)) or str(32 * 1024 * 1024)),
+)
+
+
+def get_presigned_urls(keys, expires_in: int = 3600) -> dict[str, str]:
+    """Batch variant of get_presigned_url for listings: key -> URL.
+
+    Cache hits are served under one lock acquisition; misses are signed with a
+    single timestamp and the cached SigV4 signing key. Keys that could not be
+    signed are omitted.
+    """
+    wanted = [k for k in dict.fromkeys(keys or []) if k]
+    if not wanted:
+        return {}
+    expires_in = int(expires_in)
+    now = time.time()
+    ck = {k: f"{k}|{expires_in}" for k in wanted}
+    cached = _URL_CACHE.get_many(list(ck.values()), now)
+    out = {k: cached[c] for k, c in ck.items() if c in cached}
+    missing = [k for k in wanted if k not in out]
+    if not missing:
+        return out
+
+    signed: dict[str, str] = {}
+    try:
+        target = _presign_target()
+        if target:
+            signed = _presign_many(target[0], target[1], missing, expires_in)
+        else:
+            for k in missing:
+                url = _presign_boto(k, expires_in)
+                if url:
+                    signed[k] = url
+    except Exception as ex:
+        logger.warning(f"get_presigned_urls failed for {len(missing)} keys: {ex}")
+    if signed:
+        _URL_CACHE.put_many({ck[k]: u for k, u in signed.items()}, now + max(1, min(_CACHE_TTL, expires_in)))
+        out.update(signed)
+    return out
+
+
 def get_presigned_url(key: str, expires_in: int = 3600) -> str:
     """Central helper: returns cached presigned URL if available, otherwise generates.
     Supports bucket-level custom domains via custom signer and standard presign client.
     """
     try:
-        k = f"{key}|{int(expires_in)}"
-        now = time.time()
-        cached = _URL_CACHE.get(k)
-        if cached and cached[1] > now:
-            return cached[0]
-
-        url = ""
-        if R2_CUSTOM_DOMAIN and (os.getenv("R2_CUSTOM_DOMAIN_BUCKET_LEVEL", "0").strip() == "1"):
-            url = presign_custom_domain_bucket(key, expires_in=expires_in)
-        elif R2_CUSTOM_DOMAIN and s3_presign_client:
-            url = s3_presign_client.generate_presigned_url(
-                "get_object",
-                Params={"Bucket": R2_BUCKET, "Key": key},
-                ExpiresIn=expires_in,
-            )
-        elif s3:
-            url = s3.meta.client.generate_presigned_url(
-                "get_object",
-                Params={"Bucket": R2_BUCKET, "Key": key},
-                ExpiresIn=expires_in,
-            )
-
-        if url:
-            _URL_CACHE[k] = (url, now + max(1, min(_CACHE_TTL, int(expires_in))))
-        return url
+        return get_presigned_urls([key], expires_in=expires_in).get(key, "")
     except Exception as ex:
         logger.warning(f"get_presigned_url failed for {key}: {ex}")
         return ""
@@ -338,6 +455,38 @@ def read_bytes_key(key: str) -> Optional[bytes]:
         return None
 
 
+def read_bytes_if_exists(key: str) -> Optional[bytes]:
+    """Read `key`; None only when it does not exist. Other failures raise, unlike read_bytes_key."""
+    if s3 and R2_BUCKET:
+        try:
+            return s3.Object(R2_BUCKET, key).get()["Body"].read()
+        except ClientError as ce:
+            if ce.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return None
+            raise
+    path = os.path.join(STATIC_DIR, key)
+    if not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def read_bytes_range(key: str, start: int, length: int) -> bytes:
+    """Read `length` bytes at `start` with a ranged GET. Raises on failure or short read."""
+    if length <= 0:
+        return b""
+    if s3 and R2_BUCKET:
+        resp = s3.meta.client.get_object(Bucket=R2_BUCKET, Key=key, Range=f"bytes={start}-{start + length - 1}")
+        data = resp["Body"].read()
+    else:
+        with open(os.path.join(STATIC_DIR, key), "rb") as f:
+            f.seek(start)
+            data = f.read(length)
+    if len(data) != length:
+        raise IOError(f"short read for {key} at {start}: {len(data)}/{length}")
+    return data
+
+
 def backup_read_bytes_key(key: str) -> Optional[bytes]:
     try:
         if s3_backup and BACKUP_BUCKET:
@@ -387,3 +536,27 @@ def list_keys(prefix: str, max_keys: int = 1000) -> list[str]:
     except Exception as ex:
         logger.warning(f"list_keys failed for prefix {prefix}: {ex}")
         return []
+
+
+def list_key_sizes(prefix: str) -> dict[str, int]:
+    """Map of key -> size in bytes for direct children of `prefix` (no recursion)."""
+    sizes: dict[str, int] = {}
+    try:
+        if s3 and R2_BUCKET:
+            paginator = s3.meta.client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=R2_BUCKET, Prefix=prefix, Delimiter='/'):
+                for obj in page.get('Contents', []):
+                    sizes[obj['Key']] = int(obj.get('Size') or 0)
+        else:
+            local_dir = os.path.join(STATIC_DIR, prefix)
+            if os.path.isdir(local_dir):
+                for f in os.listdir(local_dir):
+                    full_path = os.path.join(local_dir, f)
+                    if os.path.isfile(full_path):
+                        sizes[f"{prefix.rstrip('/')}/{f}"] = os.path.getsize(full_path)
+    except Exception as ex:
+        logger.warning(f"list_key_sizes failed for prefix {prefix}: {ex}")
+    return sizes
+
+
+register_derivative_handlers()
@@ -0,0 +1,286 @@
+"""
+Listing-diff thumbnail backfill.
+
+Thumbnails live next to their source (`foo.jpg` -> `foo_thumb_small.jpg`), and a
+thumbnail key always sorts after its source key. So one paginated listing of a prefix
+is enough to find the sources without a thumbnail: each source waits in a heap keyed
+by its thumbnail key until the listing reaches that key (thumbnail present) or passes
+it (thumbnail missing). There is no HEAD request per key, and memory is bounded by
+the listing distance between a source and its thumbnail.
+
+Missing thumbnails (and their listing placeholders, see utils.image_placeholders) are
+generated with bounded concurrency. Reads and uploads run in a small thread pool;
+decoding and encoding run on the shared CPU pool.
+
+Progress can be checkpointed per prefix. The checkpoint stores a StartAfter cursor
+that never passes a source that is still undecided or in flight. A stopped backfill
+resumes from the cursor and only re-lists keys after it. Sources that fail are
+logged and counted, not retried.
+"""
+import heapq
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, Optional
+
+from core import cpu_pool
+from core.config import logger
+from utils.image_placeholders import record_placeholder
+from utils.thumbnails import generate_thumbnail_with_placeholder, get_thumbnail_key, THUMB_SMALL
+
+# Image extensions to process
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.tif', '.tiff'}
+DEFAULT_CONCURRENCY = 8
+CHECKPOINT_EVERY_SECONDS = 15.0
+
+
+def is_image_key(key: str) -> bool:
+    lower = key.lower()
+    return any(lower.endswith(ext) for ext in IMAGE_EXTENSIONS)
+
+
+def is_thumbnail_source(key: str) -> bool:
+    return is_image_key(key) and '_thumb_' not in key
+
+
+def list_keys(bucket, prefix: str, start_after: Optional[str] = None) -> Iterator[str]:
+    """Keys under `prefix` in listing (lexicographic) order, after `start_after`."""
+    paginator = bucket.meta.client.get_paginator('list_objects_v2')
+    kwargs = {"Bucket": bucket.name, "Prefix": prefix}
+    if start_after:
+        kwargs["StartAfter"] = start_after
+    for page in paginator.paginate(**kwargs):
+        for obj in page.get('Contents', []):
+            yield obj['Key']
+
+
+class ListingDiff:
+    """Feeds a sorted listing and reports each source as having or missing a thumbnail."""
+
+    def __init__(self):
+        self._waiting: list[tuple[str, str]] = []  # heap of (thumb_key, source_key)
+
+    def feed(self, key: str) -> tuple[list[str], list[str]]:
+        """Consume the next listed key. Returns (missing, present) sources decided by it."""
+        missing: list[str] = []
+        present: list[str] = []
+        while self._waiting and self._waiting[0][0] <= key:
+            thumb_key, source = heapq.heappop(self._waiting)
+            (present if thumb_key == key else missing).append(source)
+        if is_thumbnail_source(key):
+            heapq.heappush(self._waiting, (get_thumbnail_key(key, 'small'), key))
+        return missing, present
+
+    @property
+    def pending(self) -> int:
+        return len(self._waiting)
+
+    def finish(self) -> list[str]:
+        """End of listing: every source still waiting has no thumbnail."""
+        rest = [source for _, source in sorted(self._waiting)]
+        self._waiting = []
+        return rest
+
+
+def scan_prefix(bucket, prefix: str, max_sources: int = 0) -> dict:
+    """Count sources with and without thumbnails under `prefix` (one listing, no HEADs).
+
+    With `max_sources`, only the first that many sources are counted; listing continues
+    just far enough to decide them.
+    """
+    diff = ListingDiff()
+    total = with_thumbs = 0
+    for key in list_keys(bucket, prefix):
+        full = bool(max_sources) and total >= max_sources
+        if full and not diff.pending:
+            break
+        if full and is_thumbnail_source(key):
+            continue
+        _, present = diff.feed(key)
+        with_thumbs += len(present)
+        if is_thumbnail_source(key):
+            total += 1
+    return {"total": total, "with_thumbnails": with_thumbs, "without_thumbnails": total - with_thumbs}
+
+
+class FileCheckpoint:
+    """Backfill progress in a local JSON file, rewritten atomically."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state: dict = {"prefixes": {}, "generated": 0, "failed": 0}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.state.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as ex:
+            logger.warning(f"thumbnail backfill checkpoint unreadable ({path}): {ex}")
+
+    def prefix_state(self, prefix: str) -> dict:
+        return dict(self.state["prefixes"].get(prefix) or {})
+
+    def save(self, prefix: str, after: Optional[str], done: bool, generated: int, failed: int) -> None:
+        with self._lock:
+            self.state["prefixes"][prefix] = {"after": after, "done": done}
+            self.state["generated"] = int(self.state.get("generated", 0)) + generated
+            self.state["failed"] = int(self.state.get("failed", 0)) + failed
+            self.state["updated_at"] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.path)
+
+
+def _backfill_one(bucket, key: str, read_func: Callable[[str], Optional[bytes]], tenant: str) -> bool:
+    data = read_func(key)
+    if not data:
+        logger.warning(f"Could not read: {key}")
+        return False
+    thumb_data, placeholder = cpu_pool.submit(
+        generate_thumbnail_with_placeholder, data, THUMB_SMALL, 98, tenant=tenant, priority=cpu_pool.BATCH
+    ).result()
+    del data
+    if not thumb_data:
+        logger.warning(f"Could not generate thumbnail for: {key}")
+        return False
+    thumb_key = get_thumbnail_key(key, 'small')
+    bucket.put_object(
+        Key=thumb_key,
+        Body=thumb_data,
+        ContentType='image/jpeg',
+        ACL='private',
+        CacheControl='public, max-age=31536000',  # 1 year cache
+    )
+    record_placeholder(key, placeholder)
+    logger.info(f"Generated thumbnail: {thumb_key} ({len(thumb_data)} bytes)")
+    return True
+
+
+def backfill(
+    bucket,
+    prefixes: Iterable[str],
+    read_func: Callable[[str], Optional[bytes]],
+    limit: int = 0,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    dry_run: bool = False,
+    checkpoint: Optional[FileCheckpoint] = None,
+    tenant: str = "-",
+) -> dict:
+    """Generate the missing small thumbnails under each prefix.
+
+    limit: stop after this many generation attempts (0 = no limit).
+    dry_run: list and diff only; missing sources are counted, nothing is read or written.
+    checkpoint: resume from / record per-prefix progress.
+    """
+    totals = {"missing": 0, "generated": 0, "failed": 0, "errors": 0}
+    window = max(1, concurrency) * 2
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="thumb-backfill") as io_pool:
+        for prefix in prefixes:
+            if limit and totals["missing"] >= limit:
+                break
+            state = checkpoint.prefix_state(prefix) if checkpoint else {}
+            if state.get("done"):
+                continue
+            try:
+                finished = _backfill_prefix(
+                    bucket, prefix, read_func, io_pool, window, totals, limit, dry_run,
+                    checkpoint, state.get("after"), tenant,
+                )
+            except Exception as ex:
+                logger.error(f"Error scanning {prefix}: {ex}")
+                totals["errors"] += 1
+                continue
+            if not finished:
+                break
+    return totals
+
+
+def _backfill_prefix(
+    bucket,
+    prefix: str,
+    read_func,
+    io_pool: ThreadPoolExecutor,
+    window: int,
+    totals: dict,
+    limit: int,
+    dry_run: bool,
+    checkpoint: Optional[FileCheckpoint],
+    start_after: Optional[str],
+    tenant: str,
+) -> bool:
+    """Backfill one prefix. Returns False when stopped early by `limit`."""
+    diff = ListingDiff()
+    # Undecided or in-flight sources (listing order) -> key listed just before each;
+    # the checkpoint cursor may not move past the first of them
+    unresolved: "OrderedDict[str, Optional[str]]" = OrderedDict()
+    in_flight: dict[Future, str] = {}
+    last_key = start_after
+    delta = {"generated": 0, "failed": 0}
+    last_save = time.monotonic()
+
+    def _cursor() -> Optional[str]:
+        return next(iter(unresolved.values())) if unresolved else last_key
+
+    def _save(done: bool) -> None:
+        nonlocal last_save
+        if checkpoint and not dry_run:
+            checkpoint.save(prefix, _cursor(), done, delta["generated"], delta["failed"])
+            delta["generated"] = delta["failed"] = 0
+        last_save = time.monotonic()
+
+    def _collect(block: bool) -> None:
+        if not in_flight:
+            return
+        done, _ = wait(list(in_flight), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for fut in done:
+            key = in_flight.pop(fut)
+            unresolved.pop(key, None)
+            try:
+                ok = fut.result()
+            except Exception as ex:
+                logger.error(f"Error processing {key}: {ex}")
+                ok = False
+            outcome = "generated" if ok else "failed"
+            totals[outcome] += 1
+            delta[outcome] += 1
+
+    def _dispatch(sources: list[str]) -> bool:
+        for key in sources:
+            if limit and totals["missing"] >= limit:
+                return False
+            totals["missing"] += 1
+            if dry_run:
+                logger.info(f"[DRY-RUN] Would generate thumbnail: {get_thumbnail_key(key, 'small')}")
+                unresolved.pop(key, None)
+                continue
+            while len(in_flight) >= window:
+                _collect(block=True)
+            in_flight[io_pool.submit(_backfill_one, bucket, key, read_func, tenant)] = key
+        return True
+
+    finished = True
+    for key in list_keys(bucket, prefix, start_after):
+        missing, present = diff.feed(key)
+        for source in present:
+            unresolved.pop(source, None)
+        if is_thumbnail_source(key):
+            unresolved[key] = last_key
+        last_key = key
+        if not _dispatch(missing):
+            finished = False
+            break
+        _collect(block=False)
+        if time.monotonic() - last_save >= CHECKPOINT_EVERY_SECONDS:
+            _save(done=False)
+    if finished:
+        finished = _dispatch(diff.finish())
+    while in_flight:
+        _collect(block=True)
+    _save(done=finished)
+    return finished
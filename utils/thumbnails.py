@@ -2,16 +2,189 @@
 Thumbnail generation utilities for optimized image loading.
 Generates thumbnails matching Cloudinary optimization standards.
 Thumbnails are 1200px (600px base × 2.0 DPR) for retina/HiDPI displays.
+
+All sizes for one source come from a single reduced-scale decode
+(`generate_thumbnail_pyramid`). `generate_rendition` uses the same decode and encoders
+for width-based JPEG / WebP renditions, and `generate_thumbnail_with_placeholder` also
+derives the listing placeholder (dimensions, dominant color, 16px LQIP) from it.
 """
+import base64
 import io
 from PIL import Image
-from typing import Optional, Tuple
+from typing import Dict, Iterable, Optional, Tuple
 from core.config import logger
 
 # Thumbnail sizes - matching Cloudinary standards (w_600,dpr_2.0 = 1200px actual)
 THUMB_SMALL = 1200   # For grid/gallery views (600px base × 2.0 DPR, matches Cloudinary)
 THUMB_MEDIUM = 1600  # For lightbox/full views (800px base × 2.0 DPR)
 
+RENDITION_FORMATS = {'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+
+PLACEHOLDER_SIZE = 16  # Longest side of the inline LQIP
+
+def _fit(size: Tuple[int, int], max_size: int) -> Tuple[int, int]:
+    """Dimensions after scaling `size` down so neither side exceeds max_size."""
+    width, height = size
+    if width <= max_size and height <= max_size:
+        return size
+    if width > height:
+        return max_size, max(1, int(height * (max_size / width)))
+    return max(1, int(width * (max_size / height))), max_size
+
+
+def _fit_width(size: Tuple[int, int], width: int) -> Tuple[int, int]:
+    """Dimensions after scaling `size` down to `width` (never up)."""
+    w, h = size
+    if w <= width:
+        return size
+    return width, max(1, int(h * (width / w)))
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    # Convert to RGB if necessary (handles RGBA, P mode, etc.)
+    if img.mode in ('RGBA', 'P', 'LA'):
+        # Create white background for transparency
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def _decode_reduced(image_data: bytes, max_size: int, fit=_fit) -> Tuple[Image.Image, Tuple[int, int]]:
+    """Decode once, at the smallest power-of-two scale that still covers max_size.
+
+    JPEGs are scaled by libjpeg while decoding (`draft`: 1/2, 1/4, 1/8), so the
+    full-resolution pixels are never materialized; other formats are box-reduced by
+    a power of two right after decoding. Returns the RGB image and the original size.
+    `fit` maps (original size, max_size) to the target size.
+    """
+    img = Image.open(io.BytesIO(image_data))
+    full_size = img.size
+    target = fit(full_size, max_size)
+    if target != full_size and img.format == 'JPEG':
+        img.draft('RGB', target)
+    img = _to_rgb(img)
+    factor = 1
+    while img.size[0] // (factor * 2) >= target[0] and img.size[1] // (factor * 2) >= target[1]:
+        factor *= 2
+    if factor > 1:
+        img = img.reduce(factor)
+    return img, full_size
+
+
+def _resize_sharpened(base: Image.Image, full_size: Tuple[int, int], target: Tuple[int, int]) -> Image.Image:
+    img = base if base.size == target else base.resize(target, Image.Resampling.LANCZOS)
+
+    # Apply subtle sharpening for better quality (only if resized)
+    if target != full_size:
+        from PIL import ImageFilter
+        img = img.filter(ImageFilter.UnsharpMask(radius=0.5, percent=50, threshold=2))
+    return img
+
+
+def _encode(img: Image.Image, fmt: str, quality: int) -> bytes:
+    buf = io.BytesIO()
+    if fmt == 'webp':
+        img.save(buf, format='WEBP', quality=quality, method=4)
+    else:
+        # Save as optimized JPEG with highest quality settings (matching Cloudinary q_auto:best)
+        img.save(buf, format='JPEG', quality=quality, optimize=True, progressive=True,
+                 subsampling=0, qtables='web_high')
+    return buf.getvalue()
+
+
+def _encode_thumbnail(base: Image.Image, full_size: Tuple[int, int], max_size: int, quality: int) -> bytes:
+    """Resize the decoded buffer to one thumbnail size and encode it."""
+    img = _resize_sharpened(base, full_size, _fit(full_size, max_size))
+    return _encode(img, 'jpeg', quality)
+
+
+def generate_thumbnail_pyramid(
+    image_data: bytes,
+    sizes: Iterable[int] = (THUMB_SMALL, THUMB_MEDIUM),
+    quality: int = 95,
+) -> Dict[int, Optional[bytes]]:
+    """
+    Generate several thumbnail sizes from a single decode.
+
+    The source is decoded once at reduced scale for the largest size (see
+    `_decode_reduced`) and every size is resized from that buffer.
+
+    Returns:
+        {max_size: thumbnail bytes or None if failed}
+    """
+    sizes = sorted(set(int(s) for s in sizes), reverse=True)
+    out: Dict[int, Optional[bytes]] = {s: None for s in sizes}
+    if not sizes:
+        return out
+    try:
+        base, full_size = _decode_reduced(image_data, sizes[0])
+    except Exception as ex:
+        logger.warning(f"Thumbnail generation failed: {ex}")
+        return out
+    for size in sizes:
+        try:
+            out[size] = _encode_thumbnail(base, full_size, size, quality)
+        except Exception as ex:
+            logger.warning(f"Thumbnail generation failed ({size}px): {ex}")
+    return out
+
+
+def image_placeholder(img: Image.Image, full_size: Tuple[int, int]) -> Dict[str, object]:
+    """
+    Listing placeholder for a decoded (RGB) image.
+    
+    Returns:
+        {"width", "height"} of the original, "color" (dominant, #rrggbb) and
+        "lqip" (a PLACEHOLDER_SIZE px WebP as a data URI, a few hundred bytes)
+    """
+    small = img.resize(_fit(img.size, PLACEHOLDER_SIZE), Image.Resampling.BOX)
+    # Dominant color: most populated bucket of a small palette
+    palette = small.quantize(colors=4, method=Image.Quantize.MEDIANCUT)
+    _, index = max(palette.getcolors())
+    r, g, b = palette.getpalette()[index * 3:index * 3 + 3]
+    buf = io.BytesIO()
+    small.save(buf, format='WEBP', quality=40)
+    return {
+        "width": int(full_size[0]),
+        "height": int(full_size[1]),
+        "color": f"#{r:02x}{g:02x}{b:02x}",
+        "lqip": "data:image/webp;base64," + base64.b64encode(buf.getvalue()).decode('ascii'),
+    }
+
+
+def generate_thumbnail_with_placeholder(
+    image_data: bytes,
+    max_size: int = THUMB_SMALL,
+    quality: int = 95,
+) -> Tuple[Optional[bytes], Optional[Dict[str, object]]]:
+    """
+    Generate a thumbnail and the listing placeholder from the same decode.
+    
+    Returns:
+        (thumbnail bytes or None, placeholder dict or None) - see `image_placeholder`
+    """
+    try:
+        base, full_size = _decode_reduced(image_data, max_size)
+    except Exception as ex:
+        logger.warning(f"Thumbnail generation failed: {ex}")
+        return None, None
+    thumb = placeholder = None
+    try:
+        thumb = _encode_thumbnail(base, full_size, max_size, quality)
+    except Exception as ex:
+        logger.warning(f"Thumbnail generation failed ({max_size}px): {ex}")
+    try:
+        placeholder = image_placeholder(base, full_size)
+    except Exception as ex:
+        logger.warning(f"Placeholder generation failed: {ex}")
+    return thumb, placeholder
+
+
 def generate_thumbnail(image_data: bytes, max_size: int = THUMB_SMALL, quality: int = 95) -> Optional[bytes]:
     """
     Generate a thumbnail from image data.
@@ -24,48 +197,7 @@ def generate_thumbnail(image_data: bytes, max_size: int = THUMB_SMALL, quality:
     Returns:
         Thumbnail bytes or None if failed
     """
-    try:
-        img = Image.open(io.BytesIO(image_data))
-        
-        # Convert to RGB if necessary (handles RGBA, P mode, etc.)
-        if img.mode in ('RGBA', 'P', 'LA'):
-            # Create white background for transparency
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Calculate new dimensions maintaining aspect ratio
-        width, height = img.size
-        if width <= max_size and height <= max_size:
-            # Image is already small enough, just optimize it
-            pass
-        elif width > height:
-            new_width = max_size
-            new_height = int(height * (max_size / width))
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        else:
-            new_height = max_size
-            new_width = int(width * (max_size / height))
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # Apply subtle sharpening for better quality (only if resized)
-        if width > max_size or height > max_size:
-            from PIL import ImageFilter
-            img = img.filter(ImageFilter.UnsharpMask(radius=0.5, percent=50, threshold=2))
-        
-        # Save as optimized JPEG with highest quality settings (matching Cloudinary q_auto:best)
-        buf = io.BytesIO()
-        img.save(buf, format='JPEG', quality=quality, optimize=True, progressive=True, 
-                 subsampling=0, qtables='web_high')
-        buf.seek(0)
-        return buf.getvalue()
-    except Exception as ex:
-        logger.warning(f"Thumbnail generation failed: {ex}")
-        return None
+    return generate_thumbnail_pyramid(image_data, (max_size,), quality)[max_size]
 
 
 def generate_thumbnails(image_data: bytes) -> Tuple[Optional[bytes], Optional[bytes]]:
@@ -79,9 +211,40 @@ def generate_thumbnails(image_data: bytes) -> Tuple[Optional[bytes], Optional[by
     Returns:
         Tuple of (small_thumb_bytes, medium_thumb_bytes)
     """
-    small = generate_thumbnail(image_data, THUMB_SMALL, quality=98)
-    medium = generate_thumbnail(image_data, THUMB_MEDIUM, quality=98)
-    return small, medium
+    thumbs = generate_thumbnail_pyramid(image_data, (THUMB_SMALL, THUMB_MEDIUM), quality=98)
+    return thumbs[THUMB_SMALL], thumbs[THUMB_MEDIUM]
+
+
+def generate_rendition(image_data: bytes, width: int, fmt: str = 'jpeg', quality: int = 85) -> Optional[bytes]:
+    """
+    Generate a rendition scaled down to `width` (aspect preserved, never upscaled).
+    
+    Args:
+        image_data: Source image bytes
+        width: Target width in pixels
+        fmt: 'jpeg' or 'webp' (see RENDITION_FORMATS)
+        quality: Encoder quality (1-100)
+    
+    Returns:
+        Rendition bytes or None if failed
+    """
+    if fmt not in RENDITION_FORMATS:
+        raise ValueError(f"unsupported rendition format: {fmt}")
+    try:
+        base, full_size = _decode_reduced(image_data, width, fit=_fit_width)
+        img = _resize_sharpened(base, full_size, _fit_width(full_size, width))
+        return _encode(img, fmt, quality)
+    except Exception as ex:
+        logger.warning(f"Rendition generation failed ({width}px {fmt}): {ex}")
+        return None
+
+
+def covers_width(image_data: bytes, width: int) -> bool:
+    """True if the image is at least `width` pixels wide (reads the header only)."""
+    try:
+        return Image.open(io.BytesIO(image_data)).size[0] >= width
+    except Exception:
+        return False
 
 
 def get_thumbnail_key(original_key: str, size: str = 'small') -> str:
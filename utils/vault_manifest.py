@@ -0,0 +1,399 @@
+"""
+Postgres-backed vault membership (public.vault_photos).
+
+Replaces the `users/{uid}/vaults/{name}.json` key list as the source of truth once a
+vault has been migrated (public.vaults.manifest_in_db). Adds and removes touch only the
+affected rows, and listings page with a keyset cursor over (position, key).
+
+Each migrated vault also has a public.vault_summaries row (count, cover key, size,
+protection flag, display name) maintained in the same transaction as membership
+changes, so the vault list endpoint reads every vault of a user in one query.
+
+Every function returns None/False when the vault is not migrated or the database is
+unavailable, so callers can fall back to the JSON object.
+"""
+import base64
+import json
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+
+from core.config import logger
+from core.database import engine
+
+# Position for keys without an explicit order; matches the old `order_index.get(k, 10**9)`
+DEFAULT_POSITION = 1_000_000_000
+
+# Mirrors the Photos_sent_by_friends filter in routers/vaults.py
+_FRIENDS_FILTER_SQL = (
+    " AND key NOT LIKE '%/partners/%'"
+    " AND regexp_replace(key, '^.*/', '') NOT LIKE '%-fromfriend%'"
+)
+
+
+def encode_cursor(position: int, key: str) -> str:
+    raw = json.dumps([int(position), key], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[tuple[int, str]]:
+    try:
+        pad = "=" * (-len(cursor) % 4)
+        pos, key = json.loads(base64.urlsafe_b64decode(cursor + pad).decode("utf-8"))
+        return int(pos), str(key)
+    except Exception:
+        return None
+
+
+def _vault_row(conn, uid: str, name: str, create: bool = False) -> Optional[tuple[int, bool]]:
+    sql = text("SELECT id, manifest_in_db FROM public.vaults WHERE owner_uid=:uid AND name=:name ORDER BY id LIMIT 1")
+    row = conn.execute(sql, {"uid": uid, "name": name}).first()
+    if row:
+        return int(row[0]), bool(row[1])
+    if not create:
+        return None
+    # (owner_uid, name) is unique: a concurrent migration of the same vault inserts at
+    # most one row, and both read it back
+    conn.execute(text("""
+        INSERT INTO public.vaults (owner_uid, name, visibility, metadata, status)
+        VALUES (:uid, :name, 'private', '{}'::jsonb, 'awaiting_proofing')
+        ON CONFLICT (owner_uid, name) DO NOTHING
+    """), {"uid": uid, "name": name})
+    row = conn.execute(sql, {"uid": uid, "name": name}).first()
+    return int(row[0]), bool(row[1])
+
+
+def _migrated_vault_id(conn, uid: str, name: str) -> Optional[int]:
+    row = _vault_row(conn, uid, name)
+    if not row or not row[1]:
+        return None
+    return row[0]
+
+
+_COVER_SQL = "(SELECT key FROM public.vault_photos WHERE vault_id=:vid ORDER BY position, key LIMIT 1)"
+
+
+def _recompute_summary(conn, vault_id: int) -> int:
+    """Rebuild count/size/cover from vault_photos; keeps protection/display name. Returns count."""
+    row = conn.execute(text(f"""
+        INSERT INTO public.vault_summaries (vault_id, photo_count, total_size_bytes, cover_key, updated_at)
+        SELECT :vid, COUNT(vp.key), COALESCE(SUM(ga.size_bytes), 0), {_COVER_SQL}, NOW()
+        FROM public.vault_photos vp LEFT JOIN public.gallery_assets ga ON ga.key = vp.key
+        WHERE vp.vault_id=:vid
+        ON CONFLICT (vault_id) DO UPDATE SET
+          photo_count = EXCLUDED.photo_count,
+          total_size_bytes = EXCLUDED.total_size_bytes,
+          cover_key = EXCLUDED.cover_key,
+          updated_at = NOW()
+        RETURNING photo_count
+    """), {"vid": vault_id}).first()
+    return int(row[0]) if row else 0
+
+
+def _bump_summary(conn, vault_id: int, keys: list[str], sign: int) -> int:
+    """Apply an incremental membership change to the summary. Returns the new count."""
+    if not keys:
+        row = conn.execute(text(
+            "SELECT photo_count FROM public.vault_summaries WHERE vault_id=:vid"
+        ), {"vid": vault_id}).first()
+        return int(row[0]) if row else _recompute_summary(conn, vault_id)
+    size = int(conn.execute(text(
+        "SELECT COALESCE(SUM(size_bytes), 0) FROM public.gallery_assets WHERE key = ANY(CAST(:keys AS text[]))"
+    ), {"keys": keys}).scalar() or 0)
+    row = conn.execute(text(f"""
+        UPDATE public.vault_summaries SET
+          photo_count = GREATEST(0, photo_count + :dc),
+          total_size_bytes = GREATEST(0, total_size_bytes + :ds),
+          cover_key = {_COVER_SQL},
+          updated_at = NOW()
+        WHERE vault_id=:vid
+        RETURNING photo_count
+    """), {"vid": vault_id, "dc": sign * len(keys), "ds": sign * size}).first()
+    if not row:
+        return _recompute_summary(conn, vault_id)
+    return int(row[0])
+
+
+def is_migrated(uid: str, name: str) -> Optional[bool]:
+    """True/False when known; None if the database could not be reached."""
+    try:
+        with engine.connect() as conn:
+            return _migrated_vault_id(conn, uid, name) is not None
+    except Exception as ex:
+        logger.warning(f"vault manifest check failed for {uid}/{name}: {ex}")
+        return None
+
+
+def read_keys(uid: str, name: str) -> Optional[list[str]]:
+    """All keys of a migrated vault, sorted by key (the JSON layout). None if not migrated."""
+    try:
+        with engine.connect() as conn:
+            vid = _migrated_vault_id(conn, uid, name)
+            if vid is None:
+                return None
+            rows = conn.execute(text(
+                "SELECT key FROM public.vault_photos WHERE vault_id=:vid ORDER BY key"
+            ), {"vid": vid}).all()
+            return [r[0] for r in rows]
+    except Exception as ex:
+        logger.warning(f"vault manifest read failed for {uid}/{name}: {ex}")
+        return None
+
+
+def import_keys(uid: str, name: str, keys: Iterable[str], order: Optional[list] = None) -> bool:
+    """Seed the table from a JSON key list and mark the vault as migrated. Idempotent."""
+    keys = sorted({k for k in (keys or []) if isinstance(k, str) and k})
+    order_index = {k: i for i, k in enumerate(order or []) if isinstance(k, str)}
+    try:
+        with engine.begin() as conn:
+            vid, migrated = _vault_row(conn, uid, name, create=True)
+            if migrated:
+                return True
+            if keys:
+                conn.execute(text("""
+                    INSERT INTO public.vault_photos (vault_id, key, position)
+                    SELECT :vid, k, p FROM unnest(CAST(:keys AS text[]), CAST(:pos AS integer[])) AS t(k, p)
+                    ON CONFLICT (vault_id, key) DO NOTHING
+                """), {"vid": vid, "keys": keys, "pos": [order_index.get(k, DEFAULT_POSITION) for k in keys]})
+            conn.execute(text("UPDATE public.vaults SET manifest_in_db=TRUE WHERE id=:vid"), {"vid": vid})
+            _recompute_summary(conn, vid)
+        return True
+    except Exception as ex:
+        logger.warning(f"vault manifest import failed for {uid}/{name}: {ex}")
+        return False
+
+
+def add_keys(uid: str, name: str, keys: Iterable[str]) -> Optional[int]:
+    """Insert keys (existing ones keep their position). Returns the new count."""
+    keys = sorted({k for k in (keys or []) if isinstance(k, str) and k})
+    try:
+        with engine.begin() as conn:
+            vid = _migrated_vault_id(conn, uid, name)
+            if vid is None:
+                return None
+            added: list[str] = []
+            if keys:
+                added = [r[0] for r in conn.execute(text("""
+                    INSERT INTO public.vault_photos (vault_id, key)
+                    SELECT :vid, unnest(CAST(:keys AS text[]))
+                    ON CONFLICT (vault_id, key) DO NOTHING
+                    RETURNING key
+                """), {"vid": vid, "keys": keys}).all()]
+            return _bump_summary(conn, vid, added, +1)
+    except Exception as ex:
+        logger.warning(f"vault manifest add failed for {uid}/{name}: {ex}")
+        return None
+
+
+def remove_keys(uid: str, name: str, keys: Iterable[str]) -> Optional[int]:
+    """Delete keys from a migrated vault. Returns the new count."""
+    keys = [k for k in set(keys or []) if isinstance(k, str) and k]
+    try:
+        with engine.begin() as conn:
+            vid = _migrated_vault_id(conn, uid, name)
+            if vid is None:
+                return None
+            removed: list[str] = []
+            if keys:
+                removed = [r[0] for r in conn.execute(text(
+                    "DELETE FROM public.vault_photos WHERE vault_id=:vid AND key = ANY(CAST(:keys AS text[])) RETURNING key"
+                ), {"vid": vid, "keys": keys}).all()]
+            return _bump_summary(conn, vid, removed, -1)
+    except Exception as ex:
+        logger.warning(f"vault manifest remove failed for {uid}/{name}: {ex}")
+        return None
+
+
+def purge_keys(uid: str, keys: Iterable[str]) -> Optional[int]:
+    """Delete keys from every vault of `uid` (e.g. deleted photos). Returns rows removed."""
+    keys = [k for k in set(keys or []) if isinstance(k, str) and k]
+    if not keys:
+        return 0
+    try:
+        with engine.begin() as conn:
+            rows = conn.execute(text("""
+                DELETE FROM public.vault_photos vp USING public.vaults v
+                WHERE vp.vault_id = v.id AND v.owner_uid=:uid AND vp.key = ANY(CAST(:keys AS text[]))
+                RETURNING vp.vault_id
+            """), {"uid": uid, "keys": keys}).all()
+            for vid in sorted({int(r[0]) for r in rows}):
+                _recompute_summary(conn, vid)
+            return len(rows)
+    except Exception as ex:
+        logger.warning(f"vault manifest purge failed for {uid}: {ex}")
+        return None
+
+
+def replace_keys(uid: str, name: str, keys: Iterable[str]) -> bool:
+    """Make the vault contain exactly `keys`, migrating it if needed. Diff-based."""
+    keys = sorted({k for k in (keys or []) if isinstance(k, str) and k})
+    try:
+        with engine.begin() as conn:
+            vid, migrated = _vault_row(conn, uid, name, create=True)
+            conn.execute(text(
+                "DELETE FROM public.vault_photos WHERE vault_id=:vid AND NOT (key = ANY(CAST(:keys AS text[])))"
+            ), {"vid": vid, "keys": keys})
+            if keys:
+                conn.execute(text("""
+                    INSERT INTO public.vault_photos (vault_id, key)
+                    SELECT :vid, unnest(CAST(:keys AS text[]))
+                    ON CONFLICT (vault_id, key) DO NOTHING
+                """), {"vid": vid, "keys": keys})
+            if not migrated:
+                conn.execute(text("UPDATE public.vaults SET manifest_in_db=TRUE WHERE id=:vid"), {"vid": vid})
+            _recompute_summary(conn, vid)
+        return True
+    except Exception as ex:
+        logger.warning(f"vault manifest replace failed for {uid}/{name}: {ex}")
+        return False
+
+
+def set_order(uid: str, name: str, order: list[str]) -> bool:
+    """Persist an explicit display order; keys not listed go after, sorted by key."""
+    order = [k for k in dict.fromkeys(order or []) if isinstance(k, str) and k]
+    try:
+        with engine.begin() as conn:
+            vid = _migrated_vault_id(conn, uid, name)
+            if vid is None:
+                return False
+            conn.execute(text(
+                "UPDATE public.vault_photos SET position=:dflt WHERE vault_id=:vid AND position <> :dflt"
+            ), {"vid": vid, "dflt": DEFAULT_POSITION})
+            if order:
+                conn.execute(text("""
+                    UPDATE public.vault_photos vp SET position = o.p
+                    FROM unnest(CAST(:keys AS text[]), CAST(:pos AS integer[])) AS o(k, p)
+                    WHERE vp.vault_id=:vid AND vp.key = o.k
+                """), {"vid": vid, "keys": order, "pos": list(range(len(order)))})
+            conn.execute(text(
+                f"UPDATE public.vault_summaries SET cover_key = {_COVER_SQL}, updated_at = NOW() WHERE vault_id=:vid"
+            ), {"vid": vid})
+        return True
+    except Exception as ex:
+        logger.warning(f"vault manifest order update failed for {uid}/{name}: {ex}")
+        return False
+
+
+def delete_manifest(uid: str, name: str) -> bool:
+    try:
+        with engine.begin() as conn:
+            row = _vault_row(conn, uid, name)
+            if not row:
+                return True
+            conn.execute(text("DELETE FROM public.vault_photos WHERE vault_id=:vid"), {"vid": row[0]})
+            conn.execute(text("DELETE FROM public.vault_summaries WHERE vault_id=:vid"), {"vid": row[0]})
+            conn.execute(text("UPDATE public.vaults SET manifest_in_db=FALSE WHERE id=:vid"), {"vid": row[0]})
+        return True
+    except Exception as ex:
+        logger.warning(f"vault manifest delete failed for {uid}/{name}: {ex}")
+        return False
+
+
+def page_keys(uid: str, name: str, limit: Optional[int] = None, cursor: Optional[str] = None,
+              exclude_friend_uploads: bool = False) -> Optional[dict]:
+    """Keyset page of a migrated vault in display order (position, key).
+
+    Returns {"keys", "next_cursor", "total"} or None if the vault is not migrated.
+    A purely numeric cursor is treated as a legacy offset.
+    """
+    try:
+        with engine.connect() as conn:
+            vid = _migrated_vault_id(conn, uid, name)
+            if vid is None:
+                return None
+            where = "vault_id=:vid AND lower(key) NOT LIKE '%.json'"
+            if exclude_friend_uploads:
+                where += _FRIENDS_FILTER_SQL
+            params: dict = {"vid": vid}
+            total = int(conn.execute(text(f"SELECT COUNT(*) FROM public.vault_photos WHERE {where}"), params).scalar() or 0)
+
+            sql = f"SELECT key, position FROM public.vault_photos WHERE {where}"
+            offset = 0
+            after = None
+            if cursor:
+                if str(cursor).isdigit():
+                    offset = int(cursor)
+                else:
+                    after = decode_cursor(str(cursor))
+            if after is not None:
+                sql += " AND (position, key) > (:after_pos, :after_key)"
+                params.update({"after_pos": after[0], "after_key": after[1]})
+            sql += " ORDER BY position, key"
+            if limit:
+                sql += " LIMIT :lim"
+                params["lim"] = int(limit) + 1
+            if offset:
+                sql += " OFFSET :off"
+                params["off"] = offset
+            rows = conn.execute(text(sql), params).all()
+
+            next_cursor = None
+            if limit and len(rows) > int(limit):
+                rows = rows[:int(limit)]
+                last = rows[-1]
+                next_cursor = encode_cursor(last[1], last[0])
+            return {"keys": [r[0] for r in rows], "next_cursor": next_cursor, "total": total}
+    except Exception as ex:
+        logger.warning(f"vault manifest page failed for {uid}/{name}: {ex}")
+        return None
+
+
+def update_summary_meta(uid: str, name: str, protected: bool, display_name: Optional[str]) -> bool:
+    """Sync protection flag and display name from vault meta into the summary."""
+    try:
+        with engine.begin() as conn:
+            vid = _migrated_vault_id(conn, uid, name)
+            if vid is None:
+                return False
+            res = conn.execute(text("""
+                UPDATE public.vault_summaries
+                SET is_protected=:prot, display_name=:dn, meta_synced=TRUE, updated_at=NOW()
+                WHERE vault_id=:vid
+            """), {"vid": vid, "prot": bool(protected), "dn": display_name})
+            if not res.rowcount:
+                _recompute_summary(conn, vid)
+                conn.execute(text("""
+                    UPDATE public.vault_summaries
+                    SET is_protected=:prot, display_name=:dn, meta_synced=TRUE
+                    WHERE vault_id=:vid
+                """), {"vid": vid, "prot": bool(protected), "dn": display_name})
+        return True
+    except Exception as ex:
+        logger.warning(f"vault summary meta update failed for {uid}/{name}: {ex}")
+        return False
+
+
+def list_summaries(uid: str) -> Optional[dict[str, dict]]:
+    """Summaries of all migrated vaults of a user, keyed by vault name, in one query."""
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT v.name, s.photo_count, s.cover_key, s.total_size_bytes, s.is_protected,
+                       s.display_name, s.meta_synced, s.updated_at,
+                       v.status, v.proofing_completed_at, v.final_delivery_prepared_at
+                FROM public.vaults v
+                JOIN public.vault_summaries s ON s.vault_id = v.id
+                WHERE v.owner_uid=:uid AND v.manifest_in_db
+            """), {"uid": uid}).all()
+    except Exception as ex:
+        logger.warning(f"vault summary list failed for {uid}: {ex}")
+        return None
+
+    def _iso(v):
+        return v.isoformat() if hasattr(v, "isoformat") else (str(v) if v else None)
+
+    out: dict[str, dict] = {}
+    for r in rows:
+        out[r[0]] = {
+            "count": int(r[1] or 0),
+            "cover_key": r[2],
+            "size_bytes": int(r[3] or 0),
+            "protected": bool(r[4]),
+            "display_name": r[5],
+            "meta_synced": bool(r[6]),
+            "updated_at": _iso(r[7]),
+            "status": r[8] or "awaiting_proofing",
+            "proofing_completed_at": _iso(r[9]),
+            "final_delivery_prepared_at": _iso(r[10]),
+        }
+    return out
@@ -1,5 +1,9 @@
 from typing import Optional, Tuple, List
+import hashlib
 import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 from core.config import logger
@@ -142,58 +146,261 @@ def _parse_hex_color(s: str) -> Tuple[int, int, int]:
         return (255, 255, 255)
 
 
-def add_text_watermark(
-    img: Image.Image,
+# --------- Font registry and glyph mask cache ---------
+# The font file is resolved once per process (WATERMARK_TTF, then common system
+# fonts); FreeType faces are kept per size and rasterized text is cached as L masks,
+# so watermarking a batch does not probe the filesystem or re-rasterize the string
+# for every image.
+_FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+    "arial.ttf",
+    "DejaVuSans.ttf",
+)
+_TEXT_MASK_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=1)
+def _font_path() -> Optional[str]:
+    """First loadable TrueType font, or None to use PIL's default bitmap font."""
+    for fp in (os.getenv("WATERMARK_TTF"),) + _FONT_CANDIDATES:
+        if not fp:
+            continue
+        try:
+            ImageFont.truetype(fp, 12)
+            return fp
+        except Exception:
+            continue
+    logger.warning("Falling back to PIL default bitmap font; watermark text may appear small. Provide WATERMARK_TTF or install DejaVuSans/Arial.")
+    return None
+
+
+@lru_cache(maxsize=64)
+def _font(font_path: Optional[str], size: int):
+    if font_path is None:
+        return ImageFont.load_default()
+    return ImageFont.truetype(font_path, size)
+
+
+def load_fonts() -> None:
+    """Resolve the watermark font up front (e.g. at startup) instead of on first use."""
+    _font(_font_path(), 18)
+
+
+@lru_cache(maxsize=_TEXT_MASK_CACHE_SIZE)
+def _text_masks(text: str, font_path: Optional[str], size: int, stroke_width: int) -> Tuple[Optional[Image.Image], Image.Image, Tuple[int, int]]:
+    """Rasterized `text` as (stroke mask or None, fill mask, (dx, dy) from the draw origin)."""
+    font = _font(font_path, size)
+    l, t, r, b = font.getbbox(text, stroke_width=stroke_width)
+    w, h = max(1, r - l), max(1, b - t)
+    fill = Image.new('L', (w, h), 0)
+    ImageDraw.Draw(fill).text((-l, -t), text, font=font, fill=255)
+    stroke = None
+    if stroke_width:
+        stroke = Image.new('L', (w, h), 0)
+        ImageDraw.Draw(stroke).text((-l, -t), text, font=font, fill=255, stroke_width=stroke_width)
+    return stroke, fill, (l, t)
+
+
+def _text_bbox(text: str, size: int) -> Tuple[int, int, int, int]:
+    return _font(_font_path(), size).getbbox(text)
+
+
+def _draw_text(
+    im: Image.Image,
+    xy: Tuple[int, int],
     text: str,
-    position: str = 'bottom-right',
-    color: Optional[str] = None,
-    opacity: Optional[float] = None,
-    bg_box: bool = False,
-    base_size_rel: Optional[float] = None,
-) -> Image.Image:
-    """Add watermark text at a chosen position using Torch for compositing (GPU if available).
-    color: hex like #RRGGBB; opacity: 0..1; bg_box draws a semi-transparent rounded rectangle behind.
+    size: int,
+    fill: Tuple[int, int, int, int],
+    stroke_width: int = 0,
+    stroke_fill: Optional[Tuple[int, int, int, int]] = None,
+) -> None:
+    """`ImageDraw.text` with the registry font, painting cached masks instead of re-rasterizing."""
+    stroke, mask, (dx, dy) = _text_masks(text, _font_path(), size, stroke_width if stroke_fill is not None else 0)
+    x, y = int(xy[0]) + dx, int(xy[1]) + dy
+    if stroke is not None:
+        im.paste(stroke_fill, (x, y, x + stroke.size[0], y + stroke.size[1]), stroke)
+    im.paste(fill, (x, y, x + mask.size[0], y + mask.size[1]), mask)
+
+
+# --------- Prepared overlay cache ---------
+# Images from one shoot share a handful of sizes, so the text/logo overlay for a given
+# set of watermark parameters is rendered once per (size, backend) and reused; each
+# image then only pays for compositing. Bounded by approximate bytes (LRU).
+OVERLAY_CACHE_BUDGET_MB = int(os.getenv("WATERMARK_OVERLAY_CACHE_MB", "256") or "256")
+
+
+def _overlay_cost(value) -> int:
+    if isinstance(value, tuple):
+        return sum(_overlay_cost(v) for v in value)
+    if isinstance(value, Image.Image):
+        return value.size[0] * value.size[1] * len(value.getbands())
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+    if hasattr(value, 'element_size') and hasattr(value, 'nelement'):
+        return int(value.element_size() * value.nelement())
+    return 64
+
+
+class _OverlayCache:
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.bytes = 0
+        self._data: "OrderedDict[tuple, tuple[object, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Threads in batch_apply that miss on the same key wait for one build
+        self._building: dict[tuple, threading.Lock] = {}
+
+    def _get(self, key: tuple):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            self._data.move_to_end(key)
+            return hit[0]
+
+    def _put(self, key: tuple, value) -> None:
+        cost = _overlay_cost(value)
+        if cost > self.budget_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._data[key] = (value, cost)
+            self.bytes += cost
+            while self.bytes > self.budget_bytes and self._data:
+                _, (_, c) = self._data.popitem(last=False)
+                self.bytes -= c
+
+    def get_or_build(self, key: tuple, build):
+        value = self._get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            try:
+                value = self._get(key)
+                if value is None:
+                    value = build()
+                    self._put(key, value)
+                return value
+            finally:
+                with self._lock:
+                    self._building.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+
+_overlays = _OverlayCache(OVERLAY_CACHE_BUDGET_MB * 1024 * 1024)
+
+
+def _image_digest(img: Image.Image) -> str:
+    """Content key for a logo (mode, size and pixels)."""
+    h = hashlib.sha1(f"{img.mode}:{img.size[0]}x{img.size[1]}:".encode('ascii'))
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def _overlay_backend() -> str:
+    """Backend the tiled/overlay paths use: 'opencv', 'pil' or 'torch'."""
+    if _BACKEND == 'opencv' and _CV2_OK:
+        return 'opencv'
+    if _use_pil():
+        return 'pil'
+    return 'torch'
+
+
+# --------- Strip-wise path for very large images ---------
+# Images of at least STRIP_MIN_PIXELS are composited into a single RGB buffer band by
+# band instead of through full-frame RGBA copies (base, overlay, result). Tiled
+# overlays are sampled per band and never materialized, so memory beyond the image
+# itself is bounded by STRIP_ROWS.
+STRIP_MIN_PIXELS = int(os.getenv("WATERMARK_STRIP_MIN_PIXELS", "40000000") or "40000000")
+STRIP_ROWS = int(os.getenv("WATERMARK_STRIP_ROWS", "256") or "256")
+
+
+def is_large_image(size: Tuple[int, int]) -> bool:
+    return size[0] * size[1] >= STRIP_MIN_PIXELS
+
+
+def _strip_target(img: Image.Image, inplace: bool) -> Optional[Image.Image]:
+    """RGB image to composite into band by band, or None for the full-frame path.
+
+    With inplace=True an RGB input is modified and returned as the result.
     """
-    # Prepare base image (RGBA for correct alpha handling)
-    if img.mode != "RGBA":
-        base_pil = img.convert("RGBA")
-    else:
-        base_pil = img.copy()
+    if not is_large_image(img.size):
+        return None
+    if img.mode == 'RGB':
+        return img if inplace else img.copy()
+    return img.convert('RGB')
+
+
+def _composite_patch_rgb(out: Image.Image, patch: Image.Image, x: int, y: int) -> None:
+    """Alpha-composite an RGBA patch into an RGB image in place, touching only its area."""
+    W, H = out.size
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(W, x + patch.size[0]), min(H, y + patch.size[1])
+    if x1 <= x0 or y1 <= y0:
+        return
+    for r0 in range(y0, y1, STRIP_ROWS):
+        r1 = min(y1, r0 + STRIP_ROWS)
+        box = (x0, r0, x1, r1)
+        band = out.crop(box).convert('RGBA')
+        band.alpha_composite(patch.crop((x0 - x, r0 - y, x1 - x, r1 - y)))
+        out.paste(band.convert('RGB'), box)
 
-    width, height = base_pil.size
-    overlay = Image.new("RGBA", base_pil.size, (255, 255, 255, 0))
-    draw = ImageDraw.Draw(overlay)
 
+def _composite_tiled_rgb(out: Image.Image, unit: Image.Image, spacing_rel: float, angle_deg: float) -> None:
+    """Tile `unit` over an RGB image in place, sampling the rotated pattern band by band."""
+    W, H = out.size
+    gap = max(8, int(min(unit.size) * max(0.05, min(1.0, spacing_rel or 0.3))))
+    cell_p = _pad_cell(_tile_cell(np.asarray(unit.convert('RGBA')), unit.size[0] + gap, unit.size[1] + gap))
+    # Sampling temporaries are ~100 bytes per pixel; cap the band by pixels as well
+    rows = max(1, min(STRIP_ROWS, _TILE_STRIP_PIXELS // max(1, W)))
+    for r0 in range(0, H, rows):
+        r1 = min(H, r0 + rows)
+        box = (0, r0, W, r1)
+        band = out.crop(box).convert('RGBA')
+        band.alpha_composite(Image.fromarray(_tile_rows_np(cell_p, W, H, angle_deg, r0, r1), mode='RGBA'))
+        out.paste(band.convert('RGB'), box)
+
+
+def _render_text_overlay(
+    width: int,
+    height: int,
+    text: str,
+    position: str,
+    color: Optional[str],
+    opacity: Optional[float],
+    bg_box: bool,
+) -> Tuple[Image.Image, Tuple[int, int]]:
+    """Positioned text (and optional background box) as an RGBA patch and its offset.
+
+    Only the neighbourhood of the text is rendered, then cropped to the drawn area, so
+    building, caching and compositing never touch the rest of the frame.
+    """
     rel = 0.05
     base_size = max(18, int(min(width, height) * rel))
-    font = None
-    font_candidates = [
-        os.getenv("WATERMARK_TTF"),
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        "/System/Library/Fonts/Supplemental/Arial.ttf",
-        "C:/Windows/Fonts/arial.ttf",
-        "arial.ttf",
-    ]
-    for fp in font_candidates:
-        if not fp:
-            continue
-        try:
-            font = ImageFont.truetype(fp, base_size)
-            break
-        except Exception:
-            continue
-    if font is None:
-        try:
-            font = ImageFont.truetype("DejaVuSans.ttf", base_size)
-        except Exception:
-            font = ImageFont.load_default()
-            logger.warning("Falling back to PIL default bitmap font; watermark text may appear small. Provide WATERMARK_TTF or install DejaVuSans/Arial.")
 
-    bbox = draw.textbbox((0, 0), text, font=font)
+    bbox = _text_bbox(text, base_size)
     tw, th = bbox[2] - bbox[0], bbox[3] - bbox[1]
     padding = max(10, base_size // 2)
     x, y = _compute_position(width, height, tw, th, padding, position)
 
+    # Canvas around the text: wide enough for glyph overhang, stroke, shadow and box
+    margin = 2 * base_size + 8
+    cx0, cy0 = max(0, x - margin), max(0, y - margin)
+    cx1, cy1 = min(width, x + tw + margin), min(height, y + th + margin)
+    overlay = Image.new("RGBA", (max(1, cx1 - cx0), max(1, cy1 - cy0)), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(overlay)
+
     r, g, b = _parse_hex_color(color or '#ffffff')
     a = int(max(0.0, min(1.0, opacity if opacity is not None else 0.96)) * 255)
 
@@ -206,21 +413,64 @@ def add_text_watermark(
         bx1 = min(width, x + tw + pad_x)
         by1 = min(height, y + th + pad_y)
         box_alpha = int(0.32 * 255)
+        rect = [bx0 - cx0, by0 - cy0, bx1 - cx0, by1 - cy0]
         try:
-            draw.rounded_rectangle([bx0, by0, bx1, by1], radius=int(min(bx1-bx0, by1-by0) * 0.12), fill=(0, 0, 0, box_alpha))
+            draw.rounded_rectangle(rect, radius=int(min(bx1-bx0, by1-by0) * 0.12), fill=(0, 0, 0, box_alpha))
         except Exception:
-            draw.rectangle([bx0, by0, bx1, by1], fill=(0, 0, 0, box_alpha))
+            draw.rectangle(rect, fill=(0, 0, 0, box_alpha))
 
     # Shadow and stroke/fill on overlay
     shadow_offset = max(1, base_size // 10)
-    draw.text((x + shadow_offset, y + shadow_offset), text, font=font, fill=(0, 0, 0, min(200, a)))
+    _draw_text(overlay, (x - cx0 + shadow_offset, y - cy0 + shadow_offset), text, base_size, (0, 0, 0, min(200, a)))
     stroke_w = max(1, base_size // 14)
-    draw.text((x, y), text, font=font, fill=(r, g, b, a), stroke_width=stroke_w, stroke_fill=(0, 0, 0, min(220, a)))
+    _draw_text(overlay, (x - cx0, y - cy0), text, base_size, (r, g, b, a), stroke_width=stroke_w, stroke_fill=(0, 0, 0, min(220, a)))
+    box = overlay.getchannel('A').getbbox() or (0, 0, 1, 1)
+    return overlay.crop(box), (cx0 + box[0], cy0 + box[1])
+
+
+def add_text_watermark(
+    img: Image.Image,
+    text: str,
+    position: str = 'bottom-right',
+    color: Optional[str] = None,
+    opacity: Optional[float] = None,
+    bg_box: bool = False,
+    base_size_rel: Optional[float] = None,
+    inplace: bool = False,
+) -> Image.Image:
+    """Add watermark text at a chosen position using Torch for compositing (GPU if available).
+    color: hex like #RRGGBB; opacity: 0..1; bg_box draws a semi-transparent rounded rectangle behind.
+    inplace: the caller no longer needs `img`; very large RGB images are then watermarked in place.
+    """
+    out = _strip_target(img, inplace)
+    if out is not None:
+        width, height = out.size
+        key = ('text', width, height, text, position, color, opacity, bool(bg_box))
+        patch, (px, py) = _overlays.get_or_build(
+            key, lambda: _render_text_overlay(width, height, text, position, color, opacity, bg_box)
+        )
+        _composite_patch_rgb(out, patch, px, py)
+        return out
+
+    # Prepare base image (RGBA for correct alpha handling)
+    if img.mode != "RGBA":
+        base_pil = img.convert("RGBA")
+    else:
+        base_pil = img.copy()
+
+    width, height = base_pil.size
+    key = ('text', width, height, text, position, color, opacity, bool(bg_box))
+    patch, offset = _overlays.get_or_build(
+        key, lambda: _render_text_overlay(width, height, text, position, color, opacity, bg_box)
+    )
 
-    # Torch compositing
     if _use_pil():
-        return Image.alpha_composite(base_pil, overlay).convert("RGB")
+        base_pil.alpha_composite(patch, offset)
+        return base_pil.convert("RGB")
 
+    # Torch compositing
+    overlay = Image.new("RGBA", base_pil.size, (255, 255, 255, 0))
+    overlay.paste(patch, offset)
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
     base = _pil_to_tensor_rgba(base_pil, device=device)
     overlay_t = _pil_to_tensor_rgba(overlay, device=device)
@@ -235,14 +485,81 @@ def add_text_watermark(
     return _tensor_to_pil_rgb(out_rgb)
 
 
+def _render_signature_stamp(
+    signature_rgba: Image.Image,
+    width: int,
+    height: int,
+    position: str,
+    bg_box: bool,
+    target_w_override: Optional[int],
+    rel_w: Optional[float],
+) -> Tuple[Image.Image, Tuple[int, int]]:
+    """Resized logo with its shadow (and optional background box) as one RGBA patch.
+
+    Returns the patch and its offset in a width x height image; compositing the patch
+    gives the same result as drawing box, shadow and logo onto the image in turn.
+    """
+    sig = signature_rgba.convert("RGBA")
+    target_w = max(64, int(target_w_override or int(width * float(rel_w if rel_w is not None else 0.30))))
+    scale = target_w / sig.width
+    target_h = int(sig.height * scale)
+    sig_resized = sig.resize((target_w, target_h), Image.LANCZOS)
+    padding = max(10, int(min(width, height) * 0.02))
+    x, y = _compute_position(width, height, sig_resized.width, sig_resized.height, padding, position)
+
+    # Patch covers the logo, its 2px shadow offset and the box, clipped to the image
+    px0, py0 = x, y
+    px1, py1 = x + sig_resized.width + 2, y + sig_resized.height + 2
+    if bg_box:
+        pad = max(6, int(min(width, height) * 0.01))
+        bx0 = max(0, x - pad); by0 = max(0, y - pad)
+        bx1 = min(width, x + sig_resized.width + pad); by1 = min(height, y + sig_resized.height + pad)
+        px0, py0 = min(px0, bx0), min(py0, by0)
+        # rectangle end coordinates are inclusive
+        px1, py1 = max(px1, bx1 + 1), max(py1, by1 + 1)
+    px0, py0 = max(0, px0), max(0, py0)
+    px1, py1 = min(width, px1), min(height, py1)
+    patch = Image.new("RGBA", (max(1, px1 - px0), max(1, py1 - py0)), (0, 0, 0, 0))
+    if bg_box:
+        box_alpha = int(0.35 * 255)
+        pdraw = ImageDraw.Draw(patch)
+        box = [bx0 - px0, by0 - py0, bx1 - px0, by1 - py0]
+        try:
+            pdraw.rounded_rectangle(box, radius=int(min(bx1-bx0, by1-by0) * 0.08), fill=(0, 0, 0, box_alpha))
+        except Exception:
+            pdraw.rectangle(box, fill=(0, 0, 0, box_alpha))
+    try:
+        alpha = sig_resized.split()[3]
+        shadow = Image.new("RGBA", sig_resized.size, (0, 0, 0, 140))
+        shadow.putalpha(alpha)
+        _composite_at(patch, shadow, x + 2 - px0, y + 2 - py0)
+    except Exception:
+        pass
+    _composite_at(patch, sig_resized, x - px0, y - py0)
+    return patch, (px0, py0)
+
+
 def add_signature_watermark(
     img: Image.Image,
     signature_rgba: Image.Image,
     position: str = 'bottom-right',
     bg_box: bool = False,
     target_w_override: Optional[int] = None,
-    rel_w: Optional[float] = None) -> Image.Image:
-    """Overlay a signature PNG with alpha using Torch composition; scales to ~30% width, optional bg box and shadow via Kornia blur."""
+    rel_w: Optional[float] = None,
+    inplace: bool = False) -> Image.Image:
+    """Overlay a signature PNG with alpha using Torch composition; scales to ~30% width, optional bg box and shadow via Kornia blur.
+    inplace: the caller no longer needs `img`; very large RGB images are then watermarked in place.
+    """
+    out = _strip_target(img, inplace)
+    if out is not None:
+        width, height = out.size
+        key = ('logo', _image_digest(signature_rgba), width, height, position, bool(bg_box), target_w_override, rel_w)
+        stamp, (sx, sy) = _overlays.get_or_build(
+            key, lambda: _render_signature_stamp(signature_rgba, width, height, position, bg_box, target_w_override, rel_w)
+        )
+        _composite_patch_rgb(out, stamp, sx, sy)
+        return out
+
     # Prepare base and logo tensors
     base_rgba = img.convert('RGBA')
     W, H = base_rgba.size
@@ -256,8 +573,10 @@ def add_signature_watermark(
         target_w = max(64, int(target_w_override or int(W * float(rel_w if rel_w is not None else 0.30))))
         scale = target_w / float(sw)
         target_h = max(1, int(round(sh * scale)))
-        sig_bgra = _pil_to_cv_rgba(sig_rgba)
-        sig_resized = _resize_cv(sig_bgra, target_w, target_h)
+        sig_resized = _overlays.get_or_build(
+            ('logo-cv', _image_digest(signature_rgba), target_w, target_h),
+            lambda: _resize_cv(_pil_to_cv_rgba(sig_rgba), target_w, target_h),
+        )
         lw, lh = sig_resized.shape[1], sig_resized.shape[0]
         padding = max(10, int(min(W, H) * 0.02))
         x, y = _compute_position(W, H, lw, lh, padding, position)
@@ -285,37 +604,14 @@ def add_signature_watermark(
         return _cv_bgr_to_pil_rgb(base_bgr)
 
     if _use_pil():
-        # Fallback to PIL path (original logic)
-        base = base_rgba.copy()
-        width, height = base.size
-        sig = signature_rgba.convert("RGBA")
-        target_w = max(64, int(target_w_override or int(width * float(rel_w if rel_w is not None else 0.30))))
-        scale = target_w / sig.width
-        target_h = int(sig.height * scale)
-        sig_resized = sig.resize((target_w, target_h), Image.LANCZOS)
-        padding = max(10, int(min(width, height) * 0.02))
-        x, y = _compute_position(width, height, sig_resized.width, sig_resized.height, padding, position)
-        if bg_box:
-            pad = max(6, int(min(width, height) * 0.01))
-            bx0 = max(0, x - pad); by0 = max(0, y - pad)
-            bx1 = min(width, x + sig_resized.width + pad); by1 = min(height, y + sig_resized.height + pad)
-            box_alpha = int(0.35 * 255)
-            overlay = Image.new("RGBA", base.size, (0, 0, 0, 0))
-            odraw = ImageDraw.Draw(overlay)
-            try:
-                odraw.rounded_rectangle([bx0, by0, bx1, by1], radius=int(min(bx1-bx0, by1-by0) * 0.08), fill=(0, 0, 0, box_alpha))
-            except Exception:
-                odraw.rectangle([bx0, by0, bx1, by1], fill=(0, 0, 0, box_alpha))
-            base = Image.alpha_composite(base, overlay)
-        try:
-            alpha = sig_resized.split()[3]
-            shadow = Image.new("RGBA", sig_resized.size, (0, 0, 0, 140))
-            shadow.putalpha(alpha)
-            base.alpha_composite(shadow, (x + 2, y + 2))
-        except Exception:
-            pass
-        base.alpha_composite(sig_resized, (x, y))
-        return base.convert('RGB')
+        # PIL path: logo, shadow and box are prepared once per logo/size as one patch
+        width, height = base_rgba.size
+        key = ('logo', _image_digest(signature_rgba), width, height, position, bool(bg_box), target_w_override, rel_w)
+        stamp, (sx, sy) = _overlays.get_or_build(
+            key, lambda: _render_signature_stamp(signature_rgba, width, height, position, bg_box, target_w_override, rel_w)
+        )
+        _composite_at(base_rgba, stamp, sx, sy)
+        return base_rgba.convert('RGB')
 
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
     base = _pil_to_tensor_rgba(base_rgba, device=device)
@@ -372,143 +668,211 @@ def add_signature_watermark(
     return _tensor_to_pil_rgb(out_rgb)
 
 
-def add_text_watermark_tiled(
-    img: Image.Image,
-    text: str,
-    color: Optional[str] = None,
-    opacity: Optional[float] = None,
-    angle_deg: float = 30.0,
-    spacing_rel: float = 0.3,
-    scale_mul: float = 1.0,
-) -> Image.Image:
-    """Tile watermark text across the whole image; use Torch for tiling/compositing and Kornia for rotation."""
-    base_rgba = img.convert('RGBA')
-    W, H = base_rgba.size
+def _composite_at(dst: Image.Image, src: Image.Image, x: int, y: int) -> None:
+    """In-place alpha_composite of `src` at (x, y), clipping at the top/left edges."""
+    sx, sy = max(0, -x), max(0, -y)
+    if sx >= src.size[0] or sy >= src.size[1]:
+        return
+    dst.alpha_composite(src, (max(0, x), max(0, y)), (sx, sy))
+
+
+# Output rows sampled per step when tiling with numpy (bounds temporaries to a strip)
+_TILE_STRIP_PIXELS = 1 << 18
+
+
+def _tile_cell(unit_arr: np.ndarray, step_x: int, step_y: int) -> np.ndarray:
+    """One period of the tiling: the unit at (0, 0) of a transparent step_x x step_y cell."""
+    cell = np.zeros((step_y, step_x, unit_arr.shape[2]), dtype=unit_arr.dtype)
+    h = min(step_y, unit_arr.shape[0]); w = min(step_x, unit_arr.shape[1])
+    cell[:h, :w] = unit_arr[:h, :w]
+    return cell
+
+
+def _tile_inverse_affine(W: int, H: int, angle_deg: float) -> Tuple[float, float, float, float, float, float]:
+    """Map output pixel (u, v) to tiling coordinates: (a*u + b*v + c, d*u + e*v + f).
+
+    Same geometry as tiling a 3W x 3H canvas from its top-left corner, rotating it
+    counter-clockwise about its center and cropping the central W x H.
+    """
+    t = np.deg2rad(float(angle_deg or 0.0))
+    cos_t, sin_t = float(np.cos(t)), float(np.sin(t))
+    # Pixel-center offsets from the output center, rotated back into the canvas
+    ox, oy = 0.5 - W / 2.0, 0.5 - H / 2.0
+    cx, cy = 1.5 * W - 0.5, 1.5 * H - 0.5
+    return (
+        cos_t, -sin_t, cx + cos_t * ox - sin_t * oy,
+        sin_t, cos_t, cy + sin_t * ox + cos_t * oy,
+    )
+
+
+def _pad_cell(cell: np.ndarray) -> np.ndarray:
+    """`cell` with a wrapped extra row/column (so x0 + 1 / y0 + 1 stay in range), as packed RGBA words."""
+    padded = np.ascontiguousarray(np.pad(cell, ((0, 1), (0, 1), (0, 0)), mode='wrap'), dtype=np.uint8)
+    return padded.view(np.uint32)[:, :, 0]
+
+
+def _tile_rows_np(cell_p: np.ndarray, W: int, H: int, angle_deg: float, r0: int, r1: int) -> np.ndarray:
+    """Rows r0..r1 of the W x H tiling: bilinear, wrap-around sampling of a padded cell."""
+    step_y, step_x = cell_p.shape[0] - 1, cell_p.shape[1] - 1
+    a, b, c, d, e, f = _tile_inverse_affine(W, H, angle_deg)
+    u = np.arange(W, dtype=np.float64)[None, :]
+    v = np.arange(r0, r1, dtype=np.float64)[:, None]
+    X = np.mod(a * u + b * v + c, step_x)
+    Y = np.mod(d * u + e * v + f, step_y)
+    x0 = np.minimum(X.astype(np.int32), step_x - 1)
+    y0 = np.minimum(Y.astype(np.int32), step_y - 1)
+    fx = (X - x0).astype(np.float32)[..., None]
+    fy = (Y - y0).astype(np.float32)[..., None]
+    # One 4-byte gather per neighbour, unpacked to float channels
+    flat = cell_p.ravel()
+    idx = y0 * (step_x + 1) + x0
+    shape = idx.shape + (4,)
+
+    def _px(i):
+        return flat[i].view(np.uint8).reshape(shape).astype(np.float32)
+
+    top = _px(idx) * (1.0 - fx) + _px(idx + 1) * fx
+    idx += step_x + 1
+    bot = _px(idx) * (1.0 - fx) + _px(idx + 1) * fx
+    return np.clip(top * (1.0 - fy) + bot * fy + 0.5, 0, 255).astype(np.uint8)
+
+
+def _tile_sample_np(cell: np.ndarray, W: int, H: int, angle_deg: float) -> np.ndarray:
+    """The whole W x H tiling, sampled in row strips to keep temporaries small."""
+    cell_p = _pad_cell(cell)
+    out = np.empty((H, W, 4), dtype=np.uint8)
+    rows = max(1, _TILE_STRIP_PIXELS // max(1, W))
+    for r0 in range(0, H, rows):
+        r1 = min(H, r0 + rows)
+        out[r0:r1] = _tile_rows_np(cell_p, W, H, angle_deg, r0, r1)
+    return out
+
+
+def _tile_overlay(backend: str, unit: Image.Image, W: int, H: int, spacing_rel: float, angle_deg: float, torch_shadow: bool = False):
+    """Rotated tiling of `unit` over a W x H image.
+
+    Rather than pasting tiles onto a 3W x 3H canvas and rotating it, one period of the
+    pattern (unit plus gap) is sampled with wrap-around through a single inverse affine
+    map at output size, so peak memory stays close to the overlay itself.
+
+    Returns the overlay in the backend's native form: BGRA ndarray (opencv), RGBA
+    image (pil) or CHW tensor on the compositing device (torch).
+    """
+    gap = max(8, int(min(unit.size) * max(0.05, min(1.0, spacing_rel or 0.3))))
+    step_x = unit.size[0] + gap
+    step_y = unit.size[1] + gap
+
+    if backend == 'opencv':
+        cell = _tile_cell(_pil_to_cv_rgba(unit), step_x, step_y)
+        a, b, c, d, e, f = _tile_inverse_affine(W, H, angle_deg)
+        M = np.array([[a, b, c], [d, e, f]], dtype=np.float64)
+        return cv2.warpAffine(
+            cell, M, (W, H),
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_WRAP,
+        )
+
+    if backend == 'pil':
+        cell = _tile_cell(np.asarray(unit.convert('RGBA')), step_x, step_y)
+        return Image.fromarray(_tile_sample_np(cell, W, H, angle_deg), mode='RGBA')
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    unit_t = _pil_to_tensor_rgba(unit, device=device)
 
-    # Build text unit tile via PIL (rasterize text), then Torch for the rest
+    # Blur alpha for subtle shadow
+    if torch_shadow and KF is not None:
+        blurred_a = KF.gaussian_blur2d(unit_t[3:4].unsqueeze(0), (7, 7), (2, 2)).squeeze(0)
+        shadow_rgb = torch.zeros_like(unit_t[:3])  # black shadow
+        unit_t = torch.maximum(unit_t, torch.cat([shadow_rgb, blurred_a * 0.55], dim=0))
+
+    cell = torch.zeros((4, step_y + 1, step_x + 1), device=device)
+    uh = min(step_y, unit_t.shape[1]); uw = min(step_x, unit_t.shape[2])
+    cell[:, :uh, :uw] = unit_t[:, :uh, :uw]
+    # Wrapped last row/column so bilinear sampling is continuous across the period
+    cell[:, step_y, :] = cell[:, 0, :]
+    cell[:, :, step_x] = cell[:, :, 0]
+
+    a, b, c, d, e, f = _tile_inverse_affine(W, H, angle_deg)
+    v, u = torch.meshgrid(
+        torch.arange(H, device=device, dtype=torch.float64),
+        torch.arange(W, device=device, dtype=torch.float64),
+        indexing='ij',
+    )
+    X = torch.remainder(a * u + b * v + c, step_x)
+    Y = torch.remainder(d * u + e * v + f, step_y)
+    del u, v
+    # align_corners=True: -1 / 1 are the centers of the first / last (wrapped) texel
+    grid = torch.stack([X / step_x * 2.0 - 1.0, Y / step_y * 2.0 - 1.0], dim=-1).float().unsqueeze(0)
+    del X, Y
+    overlay = F.grid_sample(cell.unsqueeze(0), grid, mode='bilinear', padding_mode='border', align_corners=True)
+    return overlay.squeeze(0)
+
+
+def _composite_overlay(backend: str, base_rgba: Image.Image, overlay) -> Image.Image:
+    """Composite a prepared W x H overlay (from `_tile_overlay`) over the image."""
+    if backend == 'opencv':
+        base_bgr = np.array(base_rgba.convert('RGB'))[:, :, ::-1].copy()
+        _alpha_blend_cv(base_bgr, overlay, 0, 0)
+        return _cv_bgr_to_pil_rgb(base_bgr)
+    if backend == 'pil':
+        return Image.alpha_composite(base_rgba, overlay).convert('RGB')
+    base = _pil_to_tensor_rgba(base_rgba, device=overlay.device)
+    base_rgb = base[:3]; over_rgb = overlay[:3]; over_a = overlay[3:4]
+    out_rgb = over_rgb * over_a + base_rgb * (1.0 - over_a)
+    return _tensor_to_pil_rgb(out_rgb)
+
+
+def _render_text_tile_unit(W: int, H: int, text: str, color: Optional[str], opacity: Optional[float], scale_mul: float) -> Image.Image:
+    """Rasterize one tile of watermark text (shadow, stroke, fill) for a W x H image."""
     base_size = max(18, int(min(W, H) * 0.05))
     size = int(base_size * max(0.5, min(2.0, scale_mul or 1.0)))
 
-    font = None
-    font_candidates = [
-        os.getenv("WATERMARK_TTF"),
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        "/System/Library/Fonts/Supplemental/Arial.ttf",
-        "C:/Windows/Fonts/arial.ttf",
-        "arial.ttf",
-    ]
-    for fp in font_candidates:
-        if not fp:
-            continue
-        try:
-            font = ImageFont.truetype(fp, size)
-            break
-        except Exception:
-            continue
-    if font is None:
-        try:
-            font = ImageFont.truetype("DejaVuSans.ttf", size)
-        except Exception:
-            font = ImageFont.load_default()
-
-    tmp = Image.new('RGBA', (1, 1), (0, 0, 0, 0))
-    tdraw = ImageDraw.Draw(tmp)
-    bbox = tdraw.textbbox((0, 0), text, font=font)
+    bbox = _text_bbox(text, size)
     tw, th = bbox[2] - bbox[0], bbox[3] - bbox[1]
     bx = max(1, size // 10)
     by = max(1, size // 10)
     unit_w = tw + max(2, size // 5)
     unit_h = th + max(2, size // 5)
     unit = Image.new('RGBA', (unit_w, unit_h), (0, 0, 0, 0))
-    udraw = ImageDraw.Draw(unit)
     r, g, b = _parse_hex_color(color or '#ffffff')
     a = int(max(0.0, min(1.0, opacity if opacity is not None else 0.96)) * 255)
     # Shadow, stroke, fill
-    udraw.text((bx + max(1, size // 10), by + max(1, size // 10)), text, font=font, fill=(0, 0, 0, min(200, a)))
+    _draw_text(unit, (bx + max(1, size // 10), by + max(1, size // 10)), text, size, (0, 0, 0, min(200, a)))
     stroke_w = max(1, size // 14)
-    udraw.text((bx, by), text, font=font, fill=(r, g, b, a), stroke_width=stroke_w, stroke_fill=(0, 0, 0, min(220, a)))
+    _draw_text(unit, (bx, by), text, size, (r, g, b, a), stroke_width=stroke_w, stroke_fill=(0, 0, 0, min(220, a)))
+    return unit
 
-    # OpenCV accelerated path: rasterize unit via PIL, then tile/rotate/composite with OpenCV
-    if _BACKEND == 'opencv' and _CV2_OK:
-        W, H = base_rgba.size
-        unit_bgra = _pil_to_cv_rgba(unit)
-        gap = max(8, int(min(unit_w, unit_h) * max(0.05, min(1.0, spacing_rel or 0.3))))
-        step_x = unit_w + gap
-        step_y = unit_h + gap
-        bigW, bigH = W * 3, H * 3
-        overlay = np.zeros((bigH, bigW, 4), dtype=np.uint8)
-        for y0 in range(0, bigH, step_y):
-            for x0 in range(0, bigW, step_x):
-                h = min(unit_bgra.shape[0], bigH - y0)
-                w = min(unit_bgra.shape[1], bigW - x0)
-                if h > 0 and w > 0:
-                    roi = overlay[y0:y0+h, x0:x0+w]
-                    _alpha_blend_cv(roi[:, :, :3], unit_bgra[:h, :w], 0, 0)
-                    roi[:, :, 3] = np.maximum(roi[:, :, 3], unit_bgra[:h, :w, 3])
-        # rotate via affine
-        angle = float(angle_deg or 0.0)
-        M = cv2.getRotationMatrix2D((bigW/2.0, bigH/2.0), angle, 1.0)
-        overlay_rot = _warp_affine_cv(overlay, M, (bigW, bigH))
-        # center crop
-        cx = (bigW - W) // 2; cy = (bigH - H) // 2
-        overlay_crop = overlay_rot[cy:cy+H, cx:cx+W]
-        base_bgr = np.array(base_rgba.convert('RGB'))[:, :, ::-1].copy()
-        _alpha_blend_cv(base_bgr, overlay_crop, 0, 0)
-        return _cv_bgr_to_pil_rgb(base_bgr)
 
-    if _use_pil():
-        # Fallback to PIL implementation (PIL path)
-        gap = max(8, int(min(unit_w, unit_h) * max(0.05, min(1.0, spacing_rel or 0.3))))
-        step_x = unit_w + gap
-        step_y = unit_h + gap
-        big = Image.new('RGBA', (W * 3, H * 3), (0, 0, 0, 0))
-        for y0 in range(0, big.size[1], step_y):
-            for x0 in range(0, big.size[0], step_x):
-                big.alpha_composite(unit, (x0, y0))
-        rotated = big.rotate(float(angle_deg or 0.0), resample=Image.BICUBIC, expand=True)
-        rx, ry = rotated.size
-        cx = (rx - W) // 2; cy = (ry - H) // 2
-        overlay = rotated.crop((cx, cy, cx + W, cy + H))
-        return Image.alpha_composite(base_rgba, overlay).convert('RGB')
+def add_text_watermark_tiled(
+    img: Image.Image,
+    text: str,
+    color: Optional[str] = None,
+    opacity: Optional[float] = None,
+    angle_deg: float = 30.0,
+    spacing_rel: float = 0.3,
+    scale_mul: float = 1.0,
+    inplace: bool = False,
+) -> Image.Image:
+    """Tile watermark text across the whole image (OpenCV, PIL or Torch/Kornia backend).
 
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    base = _pil_to_tensor_rgba(base_rgba, device=device)
-    # Unit tile tensor
-    uh, uw = unit.size[1], unit.size[0]
-    unit_t = _pil_to_tensor_rgba(unit, device=device)
+    The tiled overlay is cached per image size and parameters; repeat sizes only composite.
+    Very large images are tiled band by band (in place when `inplace` and RGB).
+    """
+    out = _strip_target(img, inplace)
+    if out is not None:
+        W, H = out.size
+        _composite_tiled_rgb(out, _render_text_tile_unit(W, H, text, color, opacity, scale_mul), spacing_rel, angle_deg)
+        return out
 
-    gap = max(8, int(min(unit_w, unit_h) * max(0.05, min(1.0, spacing_rel or 0.3))))
-    step_x = unit_w + gap
-    step_y = unit_h + gap
-
-    bigW, bigH = W * 3, H * 3
-    overlay = torch.zeros((4, bigH, bigW), device=device)
-    for y0 in range(0, bigH, step_y):
-        for x0 in range(0, bigW, step_x):
-            y1 = min(bigH, y0 + uh); x1 = min(bigW, x0 + uw)
-            h = y1 - y0; w = x1 - x0
-            if h > 0 and w > 0:
-                overlay[:, y0:y1, x0:x1] = torch.maximum(overlay[:, y0:y1, x0:x1], unit_t[:, :h, :w])
-
-    # Rotate overlay via Kornia
-    angle = float(angle_deg or 0.0)
-    overlay = overlay.unsqueeze(0)
-    if KG is not None:
-        overlay = KG.rotate(overlay, torch.tensor([angle], device=device), align_corners=False)
-    else:
-        # simple nearest fallback
-        pass
-    overlay = overlay.squeeze(0)
+    base_rgba = img.convert('RGBA')
+    W, H = base_rgba.size
+    backend = _overlay_backend()
 
-    # Center crop to W x H
-    BH, BW = overlay.shape[1], overlay.shape[2]
-    cx = (BW - W) // 2; cy = (BH - H) // 2
-    overlay = overlay[:, cy:cy+H, cx:cx+W]
+    def _build():
+        unit = _render_text_tile_unit(W, H, text, color, opacity, scale_mul)
+        return _tile_overlay(backend, unit, W, H, spacing_rel, angle_deg)
 
-    base_rgb = base[:3]; over_rgb = overlay[:3]; over_a = overlay[3:4]
-    out_rgb = over_rgb * over_a + base_rgb * (1.0 - over_a)
-    out = (out_rgb.clamp(0, 1) * 255.0).byte().permute(1, 2, 0).cpu().numpy()
-    return Image.fromarray(out, mode='RGB')
+    key = ('text-tiled', backend, W, H, text, color, opacity, float(angle_deg or 0.0), spacing_rel, scale_mul)
+    return _composite_overlay(backend, base_rgba, _overlays.get_or_build(key, _build))
 
 
 # --------- Batch helpers ---------
@@ -519,7 +883,11 @@ def batch_apply(
     workers: int = 0,
     **kwargs,
 ):
-    """Apply watermark function `fn` to a list of PIL images. If workers>0, use threads for I/O-bound speedups."""
+    """Apply watermark function `fn` to a list of PIL images. If workers>0, use threads for I/O-bound speedups.
+
+    Overlays are prepared once per image size (see `_overlays`), so same-sized images
+    after the first only pay for compositing.
+    """
     if workers and workers > 0:
         from concurrent.futures import ThreadPoolExecutor
         with ThreadPoolExecutor(max_workers=workers) as ex:
@@ -562,116 +930,56 @@ def batch_add_signature_watermark_tiled(
     return batch_apply(imgs, add_signature_watermark_tiled, signature_rgba, angle_deg, spacing_rel, scale_mul, workers=workers)
 
 
-def add_signature_watermark_tiled(
-    img: Image.Image,
-    signature_rgba: Image.Image,
-    angle_deg: float = 30.0,
-    spacing_rel: float = 0.3,
-    scale_mul: float = 1.0,
-) -> Image.Image:
-    """Tile a logo PNG across the whole image; Torch for tiling/compositing and Kornia for rotation/resize/blur."""
-    base_rgba = img.convert('RGBA')
-    W, H = base_rgba.size
+def _logo_tile_unit(signature_rgba: Image.Image, W: int, scale_mul: float, shadow: bool) -> Image.Image:
+    """Logo resized for tiling across a W-wide image, optionally with its drop shadow baked in."""
     sig = signature_rgba.convert('RGBA')
-
     # Determine unit size
     target_w = max(64, int(W * 0.15))
     target_w = int(target_w * max(0.5, min(2.0, scale_mul or 1.0)))
     scale = target_w / sig.width
     target_h = max(1, int(sig.height * scale))
     unit = sig.resize((max(1, target_w), target_h), Image.LANCZOS)
-
-    # OpenCV accelerated path: tile/rotate/composite with OpenCV
-    if _BACKEND == 'opencv' and _CV2_OK:
-        W, H = base_rgba.size
-        unit_bgra = _pil_to_cv_rgba(unit)
-        gap = max(8, int(min(unit.size) * max(0.05, min(1.0, spacing_rel or 0.3))))
-        step_x = unit.size[0] + gap
-        step_y = unit.size[1] + gap
-        bigW, bigH = W * 3, H * 3
-        overlay = np.zeros((bigH, bigW, 4), dtype=np.uint8)
-        for y0 in range(0, bigH, step_y):
-            for x0 in range(0, bigW, step_x):
-                h = min(unit_bgra.shape[0], bigH - y0)
-                w = min(unit_bgra.shape[1], bigW - x0)
-                if h > 0 and w > 0:
-                    roi = overlay[y0:y0+h, x0:x0+w]
-                    _alpha_blend_cv(roi[:, :, :3], unit_bgra[:h, :w], 0, 0)
-                    roi[:, :, 3] = np.maximum(roi[:, :, 3], unit_bgra[:h, :w, 3])
-        angle = float(angle_deg or 0.0)
-        M = cv2.getRotationMatrix2D((bigW/2.0, bigH/2.0), angle, 1.0)
-        overlay_rot = _warp_affine_cv(overlay, M, (bigW, bigH))
-        cx = (bigW - W) // 2; cy = (bigH - H) // 2
-        overlay_crop = overlay_rot[cy:cy+H, cx:cx+W]
-        base_bgr = np.array(base_rgba.convert('RGB'))[:, :, ::-1].copy()
-        _alpha_blend_cv(base_bgr, overlay_crop, 0, 0)
-        return _cv_bgr_to_pil_rgb(base_bgr)
-
-    if _use_pil():
-        # PIL fallback
+    if shadow:
         try:
             alpha = unit.split()[3]
-            shadow = Image.new('RGBA', unit.size, (0, 0, 0, 140))
-            shadow.putalpha(alpha)
+            shadow_img = Image.new('RGBA', unit.size, (0, 0, 0, 140))
+            shadow_img.putalpha(alpha)
             unit_with_shadow = Image.new('RGBA', unit.size, (0, 0, 0, 0))
-            unit_with_shadow.alpha_composite(shadow, (2, 2))
+            unit_with_shadow.alpha_composite(shadow_img, (2, 2))
             unit_with_shadow.alpha_composite(unit, (0, 0))
             unit = unit_with_shadow
         except Exception:
             pass
-        gap = max(8, int(min(unit.size) * max(0.05, min(1.0, spacing_rel or 0.3))))
-        step_x = unit.size[0] + gap
-        step_y = unit.size[1] + gap
-        big = Image.new('RGBA', (W * 3, H * 3), (0, 0, 0, 0))
-        for y0 in range(0, big.size[1], step_y):
-            for x0 in range(0, big.size[0], step_x):
-                big.alpha_composite(unit, (x0, y0))
-        rotated = big.rotate(float(angle_deg or 0.0), resample=Image.BICUBIC, expand=True)
-        rx, ry = rotated.size
-        cx = (rx - W) // 2; cy = (ry - H) // 2
-        overlay = rotated.crop((cx, cy, cx + W, cy + H))
-        return Image.alpha_composite(base_rgba, overlay).convert('RGB')
+    return unit
 
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    base = torch.as_tensor(bytearray(base_rgba.tobytes()), dtype=torch.uint8).view(H, W, 4).permute(2, 0, 1).float() / 255.0
-    base = base.to(device)
-    uh, uw = unit.size[1], unit.size[0]
-    unit_t = torch.as_tensor(bytearray(unit.tobytes()), dtype=torch.uint8).view(uh, uw, 4).permute(2, 0, 1).float() / 255.0
-    unit_t = unit_t.to(device)
 
-    # Blur alpha for subtle shadow
-    if KF is not None:
-        blurred_a = KF.gaussian_blur2d(unit_t[3:4].unsqueeze(0), (7, 7), (2, 2)).squeeze(0)
-        shadow = torch.zeros_like(unit_t)
-        shadow[3:4] = blurred_a * 0.55
-        shadow_rgb = torch.zeros_like(unit_t[:3])  # black shadow
-        unit_t = torch.maximum(unit_t, torch.cat([shadow_rgb, shadow[3:4]], dim=0))
+def add_signature_watermark_tiled(
+    img: Image.Image,
+    signature_rgba: Image.Image,
+    angle_deg: float = 30.0,
+    spacing_rel: float = 0.3,
+    scale_mul: float = 1.0,
+    inplace: bool = False,
+) -> Image.Image:
+    """Tile a logo PNG across the whole image (OpenCV, PIL or Torch/Kornia backend).
 
-    gap = max(8, int(min(unit.size) * max(0.05, min(1.0, spacing_rel or 0.3))))
-    step_x = uw + gap
-    step_y = uh + gap
-
-    bigW, bigH = W * 3, H * 3
-    overlay = torch.zeros((4, bigH, bigW), device=device)
-    for y0 in range(0, bigH, step_y):
-        for x0 in range(0, bigW, step_x):
-            y1 = min(bigH, y0 + uh); x1 = min(bigW, x0 + uw)
-            h = y1 - y0; w = x1 - x0
-            if h > 0 and w > 0:
-                overlay[:, y0:y1, x0:x1] = torch.maximum(overlay[:, y0:y1, x0:x1], unit_t[:, :h, :w])
-
-    # Rotate overlay
-    overlay = overlay.unsqueeze(0)
-    if KG is not None:
-        overlay = KG.rotate(overlay, torch.tensor([float(angle_deg or 0.0)], device=device), align_corners=False)
-    overlay = overlay.squeeze(0)
-
-    # Center crop
-    BH, BW = overlay.shape[1], overlay.shape[2]
-    cx = (BW - W) // 2; cy = (BH - H) // 2
-    overlay = overlay[:, cy:cy+H, cx:cx+W]
+    The tiled overlay is cached per logo, image size and parameters; repeat sizes only composite.
+    Very large images are tiled band by band (in place when `inplace` and RGB).
+    """
+    out = _strip_target(img, inplace)
+    if out is not None:
+        unit = _logo_tile_unit(signature_rgba, out.size[0], scale_mul, shadow=True)
+        _composite_tiled_rgb(out, unit, spacing_rel, angle_deg)
+        return out
 
-    base_rgb = base[:3]; over_rgb = overlay[:3]; over_a = overlay[3:4]
-    out_rgb = over_rgb * over_a + base_rgb * (1.0 - over_a)
-    out = (out_rgb.clamp(0, 1) * 255.0).byte().permute(1, 2, 0).cpu().numpy()
-    return Image.fromarray(out, mode='RGB')
+    base_rgba = img.convert('RGBA')
+    W, H = base_rgba.size
+    backend = _overlay_backend()
+
+    def _build():
+        # The PIL backend bakes the shadow into the unit; torch blurs it in _tile_overlay
+        unit = _logo_tile_unit(signature_rgba, W, scale_mul, shadow=(backend == 'pil'))
+        return _tile_overlay(backend, unit, W, H, spacing_rel, angle_deg, torch_shadow=True)
+
+    key = ('logo-tiled', backend, _image_digest(signature_rgba), W, H, float(angle_deg or 0.0), spacing_rel, scale_mul)
+    return _composite_overlay(backend, base_rgba, _overlays.get_or_build(key, _build))